@@ -5,8 +5,11 @@ from crewai.agents.agent_builder.base_agent import BaseAgent
 from crewai.project import CrewBase, after_kickoff, agent, crew, task
 from crewai_tools import FileReadTool
 
+from agentic_job_search.llm import CustomCrewLLM
+from agentic_job_search.tools.custom_tool import ReducedContentTool
+from src.cache import ResponseCache
 from src.config import log
-from src.llms import CustomCrewLLM
+from src.telemetry import telemetry
 from src.utils import OrgsModel, fix_job_listings, store_jobs_info
 
 # Unfortunately, overriding with templates don't seem to fully work as expected.
@@ -41,18 +44,34 @@ class AgenticJobSearch:
     agents: List[BaseAgent]
     tasks: List[Task]
 
-    def __init__(self, provider: str = "OPENROUTER", temperature: float = 0.1, max_rpm=1):
+    def __init__(
+        self,
+        provider: str = "OPENROUTER",
+        temperature: float = 0.1,
+        max_rpm=1,
+        use_cache: bool = True,
+        content_mode: str = "inject",
+        max_tpm=None,
+    ):
+        """
+        `content_mode` decides how the agent gets to the scraped content of an org:
+        - "inject": the reduced content is part of the task's description (input `content`), taking a single LLM call
+        - "tool": the agent reads the reduced content with `ReducedContentTool`
+        - "file": the agent reads the whole scraped JSON file with `FileReadTool`
+        """
         super().__init__()
-        self.max_rpm = max_rpm  # to avoid rate throttling
-        self.crew_llm = CustomCrewLLM(provider, temperature)
+        self.content_mode = content_mode
+        cache = ResponseCache() if use_cache else None
+        # `max_rpm` & `max_tpm` are enforced by the LLM's token bucket, which is shared by all the crews of the process.
+        # So unlike crewAI's own `max_rpm`, they don't let concurrent crews burst & then stall for a minute
+        self.crew_llm = CustomCrewLLM(provider, temperature, max_rpm, max_tpm, cache=cache)
 
     @agent
     def job_researcher(self) -> Agent:
         return Agent(
             config=self.agents_config["job_researcher"],  # type: ignore[index]
             llm=self.crew_llm,
-            tools=[FileReadTool()],
-            max_rpm=self.max_rpm,
+            tools={"inject": [], "tool": [ReducedContentTool()], "file": [FileReadTool()]}[self.content_mode],
             use_system_prompt=True,
             # system_template=templates['system'],
             # prompt_template=templates['prompt'],
@@ -62,7 +81,9 @@ class AgenticJobSearch:
     @task
     def extract_job_info(self) -> Task:
         return Task(
-            config=self.tasks_config["extract_job_info"],  # type: ignore[index]
+            config=self.tasks_config[  # type: ignore[index]
+                "extract_job_info_from_content" if self.content_mode == "inject" else "extract_job_info"
+            ],
             output_pydantic=OrgsModel,
         )
 
@@ -73,7 +94,11 @@ class AgenticJobSearch:
             model_dump = OrgsModel(**fix_job_listings(model_dump)).model_dump()
         except Exception as e:
             log.exception(f"couldn't convert results into pydantic model:\n\n Error:{e}\n\n{results=}")
-        return store_jobs_info(model_dump)
+        # recorded under the org the crew was kicked off for (see `agentic_job_search.main._kickoff`)
+        with telemetry.stage("store"):
+            stored = store_jobs_info(model_dump)
+        telemetry.set("jobs_found", len(model_dump["jobs"]))
+        return stored
 
     @crew
     def crew(self) -> Crew:
@@ -83,5 +108,4 @@ class AgenticJobSearch:
             process=Process.sequential,
             verbose=True,
             output_log_file="logs.json",
-            max_rpm=self.max_rpm,  # OpenRouter Free API Limitation is 20 RPM
         )
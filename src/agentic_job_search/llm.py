@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Optional, Union
+
+from crewai import BaseLLM
+
+from src.cache import ResponseCache
+from src.llms import CustomLLM
+
+
+class CustomCrewLLM(BaseLLM):
+    def __init__(
+        self,
+        provider,
+        temperature: float = 0.1,
+        max_rpm: Optional[float] = None,
+        max_tpm: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.provider = provider
+        self.temperature = temperature
+        self.llm = CustomLLM(provider, temperature, max_rpm, max_tpm, cache)
+        super().__init__(model=self.llm.model_name, temperature=self.temperature)
+
+    # retry(
+    #         # Stop retrying after overall timeout
+    #         stop=stop_after_delay(_CALL_TIMEOUT),
+    #         # Retry only on specific HTTP/network errors
+    #         retry=retry_if_exception_type((requests.exceptions.RequestException, RuntimeError)),
+    #         before=_acquire_lock,
+    #         after=_release_lock,
+    #         reraise=True
+    # )
+    def call(
+        self,
+        messages: Union[str, List[Dict[str, str]]],
+        tools: Optional[List[dict]] = None,
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+        from_task: Optional[Any] = None,
+        from_agent: Optional[Any] = None,
+    ) -> Union[str, Any]:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+
+        # add this flag to let the custom llm know that it was being called by agentic workflow
+        payload_kwargs = {"from_crew": True}
+        if tools and self.supports_function_calling():
+            payload_kwargs["tools"] = tools
+
+        llm_resp = self.llm(messages, **payload_kwargs)
+        return llm_resp
+
+    def supports_function_calling(self) -> bool:
+        return True
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return int(self.llm.creds["CONTEXT_LENGTH"])
@@ -4,8 +4,12 @@ import warnings
 import click
 
 # from tenacity import retry, stop_after_attempt, wait_exponential
-from agentic_job_search.crew import AgenticJobSearch
-from src.utils import prepare_inputs, store_final_jobs_report
+from src.config import log
+from src.journal import EXTRACTED, FAILED, RunJournal
+from src.preprocess import reduce_html
+from src.scrape.store import crawl_store
+from src.telemetry import telemetry
+from src.utils import load_unchanged_jobs, prepare_inputs, store_final_jobs_report
 
 warnings.filterwarnings("ignore")  # , category=SyntaxWarning, module="pysbd")
 
@@ -15,24 +19,98 @@ warnings.filterwarnings("ignore")  # , category=SyntaxWarning, module="pysbd")
 # interpolate any tasks and agents information
 
 
+def _inject_content(inputs):
+    """add the reduced content of each org to its inputs so that the agent doesn't have to read its file"""
+    for inp in inputs:
+        inp["content"] = reduce_html(crawl_store.read(inp["org"])) or ""
+    return inputs
+
+
+def _export_content(inputs):
+    """write the content of each org to a plain JSON file for the agent to read with its tool"""
+    for inp in inputs:
+        inp["file_path"] = crawl_store.export(inp["org"])
+    return inputs
+
+
+def _pending_inputs(inputs, journal, content_mode):
+    """the inputs of the orgs that are left to extract in this run"""
+    journal.mark_scraped([inp["org"] for inp in inputs])
+    completed_orgs = set(journal.completed_orgs())
+    inputs = [inp for inp in inputs if inp["org"] not in completed_orgs]
+    return _inject_content(inputs) if content_mode == "inject" else _export_content(inputs)
+
+
+def _build_crew(**kwargs):
+    # crewai takes seconds to import, so it's only imported once there are orgs left to extract
+    from agentic_job_search.crew import AgenticJobSearch
+
+    return AgenticJobSearch(**kwargs).crew()
+
+
+def _kickoff(crew, inp, journal):
+    try:
+        # the LLM calls & the storing of the jobs are attributed to the org in the run's telemetry
+        with telemetry.org(inp["org"]):
+            crew.copy().kickoff(inputs=inp)
+    except Exception as e:
+        log.exception(f"Error running the crew for org:{inp['org']}. Skipping it...")
+        journal.mark(inp["org"], FAILED, reason=str(e))
+        return
+    journal.mark(inp["org"], EXTRACTED)
+
+
+async def _kickoff_with_workers(crew, inputs, n_workers, journal):
+    """run a copy of the crew per input with at most `n_workers` of them at once"""
+    queue = asyncio.Queue()
+    for inp in inputs:
+        queue.put_nowait(inp)
+
+    async def worker():
+        while not queue.empty():
+            inp = queue.get_nowait()
+            try:
+                with telemetry.org(inp["org"]):
+                    await crew.copy().kickoff_async(inputs=inp)
+            except Exception as e:
+                log.exception(f"Error running the crew for org:{inp['org']}. Skipping it...")
+                journal.mark(inp["org"], FAILED, reason=str(e))
+                continue
+            journal.mark(inp["org"], EXTRACTED)
+
+    await asyncio.gather(*(worker() for _ in range(n_workers)))
+
+
 # @retry(
 #         wait=wait_exponential(2, min=4, max=300),
 #         stop=stop_after_attempt(3)
 # )
-async def _run_async(scrape=True, **kwargs):
+async def _run_async(scrape=True, incremental=True, max_concurrence=None, resume=None, **kwargs):
+    journal = RunJournal.load(resume) if resume else RunJournal()
+    log.info(f"run id: {journal.run_id}")
     try:
-        inputs = await prepare_inputs(scrape)
-        crew = AgenticJobSearch(**kwargs).crew()
-        return await crew.kickoff_for_each_async(inputs=inputs)
+        # resumed runs don't scrape again once they're done with it
+        inputs = await prepare_inputs(scrape and not journal.scrape_done, incremental=incremental)
+        inputs = _pending_inputs(inputs, journal, kwargs.get("content_mode"))
+        if len(inputs):
+            # without a limit, every org gets a crew at once
+            await _kickoff_with_workers(_build_crew(**kwargs), inputs, max_concurrence or len(inputs), journal)
+        # the jobs of every org are read from the files the crews stored them in
+        return journal.report(load_unchanged_jobs() if incremental else [])
     except Exception as e:
         raise Exception(f"An error occurred while running the crew {e}")
 
 
-def _run(scrape=True, **kwargs):
+def _run(scrape=True, incremental=True, resume=None, **kwargs):
+    journal = RunJournal.load(resume) if resume else RunJournal()
+    log.info(f"run id: {journal.run_id}")
     try:
-        inputs = asyncio.run(prepare_inputs(scrape))
-        crew = AgenticJobSearch(**kwargs).crew()
-        return crew.kickoff_for_each(inputs=inputs)
+        inputs = asyncio.run(prepare_inputs(scrape and not journal.scrape_done, incremental=incremental))
+        inputs = _pending_inputs(inputs, journal, kwargs.get("content_mode"))
+        crew = _build_crew(**kwargs) if len(inputs) else None
+        for inp in inputs:
+            _kickoff(crew, inp, journal)
+        return journal.report(load_unchanged_jobs() if incremental else [])
     except Exception as e:
         raise Exception(f"An error occurred while running the crew {e}")
 
@@ -45,18 +123,51 @@ def _run(scrape=True, **kwargs):
 @click.option(
     "--max-rpm", default=1, help="Max LLM calls to make per minute. Pass `-1` to remove any limits (aka None)"
 )
-def run(scrape, async_run, provider, temperature, max_rpm):
+@click.option("--max-tpm", default=-1, help="Max tokens to send to the LLM per minute. Pass `-1` to remove any limits")
+@click.option(
+    "--max-concurrence",
+    default=4,
+    help="max crews running at once in async mode. Pass `-1` to kick off a crew for every org at once",
+)
+@click.option("--cache/--no-cache", default=True, help="reuse cached LLM responses for unchanged content")
+@click.option(
+    "--incremental/--no-incremental", default=True, help="reuse previous job reports of orgs with unchanged content"
+)
+@click.option("--resume", default=None, help="run ID of a run that died half way, to continue without redoing its orgs")
+@click.option(
+    "--content-mode",
+    type=click.Choice(["inject", "tool", "file"]),
+    default="inject",
+    help="pass the reduced content in the task (1 LLM call per org) or let the agent read it (`tool`) / the raw `file`",
+)
+def run(
+    scrape,
+    async_run,
+    provider,
+    temperature,
+    max_rpm,
+    max_tpm,
+    max_concurrence,
+    cache,
+    incremental,
+    resume,
+    content_mode,
+):
     if int(max_rpm) == -1:
         max_rpm = None
     kwargs = {
         "provider": provider,
         "temperature": temperature,
         "max_rpm": max_rpm,
+        "max_tpm": None if int(max_tpm) == -1 else int(max_tpm),
+        "use_cache": cache,
+        "content_mode": content_mode,
     }
     if async_run:
-        results = asyncio.run(_run_async(scrape, **kwargs))
+        max_concurrence = None if int(max_concurrence) == -1 else int(max_concurrence)
+        results = asyncio.run(_run_async(scrape, incremental, max_concurrence, resume, **kwargs))
     else:
-        results = _run(scrape, **kwargs)
+        results = _run(scrape, incremental, resume, **kwargs)
     store_final_jobs_report(results)
 
 
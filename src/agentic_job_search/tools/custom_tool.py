@@ -1,22 +1,28 @@
+import json
 from typing import Type
 
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
+from src.preprocess import reduce_html
 
-class MyCustomToolInput(BaseModel):
-    """Input schema for MyCustomTool."""
 
-    argument: str = Field(..., description="Description of the argument.")
+class ReducedContentToolInput(BaseModel):
+    """Input schema for ReducedContentTool."""
 
+    file_path: str = Field(..., description="Path of the JSON file with the scraped content of an org.")
 
-class MyCustomTool(BaseTool):
-    name: str = "Name of my tool"
+
+class ReducedContentTool(BaseTool):
+    name: str = "Read the job listings of a scraped career page"
     description: str = (
-        "Clear description for what this tool is useful for, your agent will need this information to use it."
+        "Returns the text of the career page scraped into the given JSON file, one listing entry per line, "
+        'with the job links kept as `<a href="...">title</a>` tags.'
     )
-    args_schema: Type[BaseModel] = MyCustomToolInput
+    args_schema: Type[BaseModel] = ReducedContentToolInput
 
-    def _run(self, argument: str) -> str:
-        # Implementation goes here
-        return "this is an example of a tool output, ignore it and move along."
+    def _run(self, file_path: str) -> str:
+        # only the text & job links, rather than the whole JSON file with its escaped HTML
+        with open(file_path) as fl:
+            content = json.load(fl).get("content")
+        return reduce_html(content) or "The career page has no content."
@@ -0,0 +1,115 @@
+"""
+Import time of the CLI entry points.
+
+Every entry point's module is imported `--repeats` times, each in a fresh interpreter & an empty working directory,
+to measure what a cron job or a short lived container pays before doing any work. The run fails if an entry point
+pulls in one of the heavy dependencies (which should only be imported on the code paths that use them), leaves
+anything behind in its working directory or takes longer than `--max-s` to import.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from statistics import median
+from time import perf_counter, time
+from typing import List
+
+import click
+
+from src.benchmark.main import BENCHMARK_PATH, ROOT_PATH
+from src.config import log
+
+ENTRY_POINTS = {
+    "run_manual": "src.programmatic_job_search.main",
+    "run_crew": "agentic_job_search.main",
+    "scrape_jobsites": "src.scrape.scrape",
+    "cleanup": "src.utils",
+    "query_jobs": "src.job_index",
+    "enqueue_orgs": "src.distributed",
+}
+# dependencies that take seconds to import & are only needed to render a page, run a crew or send a request
+HEAVY_MODULES = ("crewai", "crewai_tools", "litellm", "playwright")
+
+PROBE = """
+import json, sys
+from time import perf_counter
+
+start = perf_counter()
+__import__(sys.argv[1])
+import_s = perf_counter() - start
+print(json.dumps({"import_s": import_s, "modules": sorted({name.split(".")[0] for name in sys.modules})}))
+"""
+
+
+def measure_import(entry_point: str, repeats: int = 5) -> dict:
+    """median time to import (& to start an interpreter & import) the module of `entry_point`"""
+    module = ENTRY_POINTS[entry_point]
+    paths = [str(ROOT_PATH), str(ROOT_PATH / "src"), os.environ.get("PYTHONPATH")]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(path for path in paths if path)}
+    import_times, wall_times, modules = [], [], set()
+    with tempfile.TemporaryDirectory(prefix="imports_") as workdir:
+        for _ in range(repeats):
+            start = perf_counter()
+            proc = subprocess.run(
+                [sys.executable, "-c", PROBE, module], cwd=workdir, env=env, capture_output=True, text=True
+            )
+            wall_times.append(perf_counter() - start)
+            if proc.returncode:
+                log.error(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+                return {"entry_point": entry_point, "module": module, "error": proc.stderr.strip().splitlines()[-1]}
+            probe = json.loads(proc.stdout.strip().splitlines()[-1])
+            import_times.append(probe["import_s"])
+            modules.update(probe["modules"])
+        side_effects = sorted(os.listdir(workdir))
+
+    return {
+        "entry_point": entry_point,
+        "module": module,
+        "import_s": round(median(import_times), 3),
+        "startup_s": round(median(wall_times), 3),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in modules],
+        "side_effects": side_effects,
+    }
+
+
+def _format_table(results: List[dict]) -> str:
+    columns = ("entry_point", "import_s", "startup_s", "heavy_modules", "side_effects", "error")
+    rows = [columns] + [
+        tuple(", ".join(cell) if isinstance(cell := res.get(col, ""), list) else str(cell) for col in columns)
+        for res in results
+    ]
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+
+@click.command(context_settings=dict(show_default=True))
+@click.option("--entry-points", default=",".join(ENTRY_POINTS), help="comma separated entry points to import")
+@click.option("--repeats", default=5, help="times to import each entry point, each in a fresh interpreter")
+@click.option("--max-s", default=-1.0, help="max seconds an entry point may take to import. Pass `-1` to not check")
+def benchmark_imports(entry_points, repeats, max_s):
+    entry_points = [entry_point.strip() for entry_point in entry_points.split(",") if entry_point.strip()]
+    results = [measure_import(entry_point, int(repeats)) for entry_point in entry_points]
+    click.echo(_format_table(results))
+
+    BENCHMARK_PATH.mkdir(parents=True, exist_ok=True)
+    results_path = BENCHMARK_PATH / f"{int(time())}_imports.json"
+    with open(results_path, "w") as fl:
+        json.dump({"repeats": repeats, "max_s": max_s, "results": results}, fl, indent=4)
+    click.echo(f"\nresults written to '{results_path}'")
+
+    failures = [
+        res["entry_point"]
+        for res in results
+        if res.get("error")
+        or len(res["heavy_modules"])
+        or len(res["side_effects"])
+        or (max_s != -1 and res["import_s"] > max_s)
+    ]
+    if len(failures):
+        raise click.ClickException(f"entry points importing too much or too slowly: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    benchmark_imports()
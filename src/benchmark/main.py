@@ -0,0 +1,188 @@
+"""
+Offline benchmark of `run_manual` & `run_crew`.
+
+Every scenario runs the pipeline end to end (scraping included) in a subprocess with its own working directory,
+against a `FixtureServer` serving N career pages & a `MockLLMServer` standing in for the LLM provider.
+Throughput, latency & token counts are read off the wall time & the performance summary of the run
+(see `src/telemetry.py`), so nothing but local servers is hit.
+"""
+
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from glob import glob
+from pathlib import Path
+from time import perf_counter, time
+from typing import List
+
+import click
+import yaml
+
+from src.benchmark.servers import FixtureServer, MockLLMServer, load_fixtures
+from src.config import SCRAPE_DOWNLOAD_PATH, log
+from src.telemetry import percentile
+
+BENCHMARK_PATH = Path("data/benchmarks")
+BENCH_PROVIDER = "BENCH"
+ROOT_PATH = Path(__file__).resolve().parents[2]
+COMMANDS = {
+    "manual": [sys.executable, "-m", "src.programmatic_job_search.main"],
+    "crew": [sys.executable, "-m", "agentic_job_search.main"],
+}
+# every run does the whole work, without reusing anything from previous runs
+COMMON_ARGS = ["--provider", BENCH_PROVIDER, "--max-rpm", "-1", "--no-cache", "--no-incremental"]
+
+
+def _setup_workdir(workdir: Path, orgs_config: dict, api_base: str, context_length: int):
+    creds = {
+        BENCH_PROVIDER: {
+            "MODEL_NAME": "openai/bench",
+            "API_BASE": api_base,
+            "API_KEY": "bench",
+            "PREFIX": 0,
+            "CONTEXT_LENGTH": context_length,
+        }
+    }
+    with open(workdir / "creds.yaml", "w") as fl:
+        yaml.safe_dump(creds, fl)
+    (workdir / "src/scrape").mkdir(parents=True)
+    with open(workdir / "src/scrape/orgs.yaml", "w") as fl:
+        yaml.safe_dump(orgs_config, fl)
+
+
+def _read_run_outputs(workdir: Path):
+    """the final report, performance summary & spans of the (only) run in `workdir`"""
+    # final reports are named after their timestamp, their summary & diff carry a suffix
+    reports = sorted(path for path in glob(f"{workdir}/data/jobs/final_reports/*.json") if Path(path).stem.isdigit())
+    if not len(reports):
+        return [], {}, []
+    report_path = Path(reports[-1])
+    with open(report_path) as fl:
+        report = json.load(fl)
+    summary, spans = {}, []
+    summary_path = report_path.with_name(f"{report_path.stem}_summary.json")
+    if summary_path.exists():
+        with open(summary_path) as fl:
+            summary = json.load(fl)
+    spans_path = report_path.with_name(f"{report_path.stem}_spans.jsonl")
+    if spans_path.exists():
+        with open(spans_path) as fl:
+            spans = [json.loads(line) for line in fl if line.strip()]
+    return report, summary, spans
+
+
+def run_scenario(
+    path: str, n_orgs: int, fixtures: List[str], llm_server: MockLLMServer, extra_args: List[str], timeout_s: float
+) -> dict:
+    """run the `path` pipeline over `n_orgs` served career pages & measure it"""
+    llm_server.reset_counts()
+    with FixtureServer(fixtures, n_orgs) as fixture_server, tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        workdir = Path(workdir)
+        _setup_workdir(workdir, fixture_server.orgs_config(), f"{llm_server.base_url}/v1", context_length=32768)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT_PATH), str(ROOT_PATH / "src")])}
+        cmd = COMMANDS[path] + COMMON_ARGS + extra_args
+        log.info(f"benchmarking {path} with {n_orgs} orgs: {shlex.join(cmd)}")
+
+        start = perf_counter()
+        try:
+            proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, timeout=timeout_s)
+            returncode = proc.returncode
+            if returncode:
+                log.error(f"benchmark run failed:\n{proc.stderr[-2000:]}")
+        except subprocess.TimeoutExpired:
+            returncode = None
+            log.error(f"benchmark run didn't finish within {timeout_s}s")
+        wall_time_s = perf_counter() - start
+        report, summary, spans = _read_run_outputs(workdir)
+
+    org_durations = [sum(span["stages"].values()) for span in spans if not span["org"].startswith("_")]
+    totals = summary.get("totals", {})
+    return {
+        "path": path,
+        "n_orgs": n_orgs,
+        "returncode": returncode,
+        "wall_time_s": round(wall_time_s, 3),
+        "orgs_per_min": round(n_orgs / wall_time_s * 60, 2),
+        "orgs_reported": len(report),
+        "jobs_found": sum(len(org.get("jobs") or []) for org in report if isinstance(org, dict)),
+        "org_latency_p50_s": percentile(org_durations, 0.5),
+        "org_latency_p95_s": percentile(org_durations, 0.95),
+        "llm_latency_p50_s": summary.get("llm_latency", {}).get("p50_s"),
+        "llm_latency_p95_s": summary.get("llm_latency", {}).get("p95_s"),
+        "llm_calls": totals.get("llm_calls"),
+        "prompt_tokens": totals.get("prompt_tokens"),
+        "completion_tokens": totals.get("completion_tokens"),
+        "retries": totals.get("retries"),
+        "validation_failures": totals.get("validation_failures"),
+        "mock_llm": dict(llm_server.counts),
+    }
+
+
+def _format_table(results: List[dict]) -> str:
+    columns = (
+        "path", "n_orgs", "returncode", "wall_time_s", "orgs_per_min", "orgs_reported", "jobs_found",
+        "org_latency_p95_s", "llm_latency_p50_s", "llm_latency_p95_s", "llm_calls", "prompt_tokens",
+    )  # fmt: skip
+    rows = [columns] + [
+        tuple(f"{res[col]:.2f}" if isinstance(res[col], float) else str(res[col]) for col in columns) for res in results
+    ]
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+@click.command(context_settings=dict(show_default=True))
+@click.option("--paths", default="manual,crew", help="comma separated pipelines to benchmark (`manual`, `crew`)")
+@click.option("--sizes", default="5,25,100", help="comma separated no. of orgs to run each pipeline with")
+@click.option("--fixtures-dir", default=str(SCRAPE_DOWNLOAD_PATH), help="scraped org contents to serve as pages")
+@click.option("--latency-s", default=1.0, help="mean latency of the mock LLM's responses")
+@click.option("--latency-jitter-s", default=0.2, help="standard deviation of the mock LLM's latency")
+@click.option("--rate-limit-rate", default=0.0, help="share of LLM requests answered with a 429")
+@click.option("--malformed-rate", default=0.0, help="share of LLM responses with truncated JSON")
+@click.option("--manual-args", default="--async-run --max-concurrence 5", help="extra args of `run_manual`")
+@click.option("--crew-args", default="", help="extra args of `run_crew`")
+@click.option("--timeout-s", default=1800, help="max seconds a single scenario may take")
+def run_benchmark(
+    paths,
+    sizes,
+    fixtures_dir,
+    latency_s,
+    latency_jitter_s,
+    rate_limit_rate,
+    malformed_rate,
+    manual_args,
+    crew_args,
+    timeout_s,
+):
+    fixtures = load_fixtures(fixtures_dir)
+    extra_args = {"manual": shlex.split(manual_args), "crew": shlex.split(crew_args)}
+    results = []
+    with MockLLMServer(latency_s, latency_jitter_s, rate_limit_rate, malformed_rate) as llm_server:
+        for path in [path.strip() for path in paths.split(",") if path.strip()]:
+            for n_orgs in [int(size) for size in sizes.split(",")]:
+                results.append(run_scenario(path, n_orgs, fixtures, llm_server, extra_args[path], float(timeout_s)))
+                click.echo(_format_table(results[-1:]))
+
+    BENCHMARK_PATH.mkdir(parents=True, exist_ok=True)
+    results_path = BENCHMARK_PATH / f"{int(time())}.json"
+    with open(results_path, "w") as fl:
+        json.dump(
+            {
+                "mock_llm": {
+                    "latency_s": latency_s,
+                    "latency_jitter_s": latency_jitter_s,
+                    "rate_limit_rate": rate_limit_rate,
+                    "malformed_rate": malformed_rate,
+                },
+                "results": results,
+            },
+            fl,
+            indent=4,
+        )
+    click.echo(f"\n{_format_table(results)}\n\nresults written to '{results_path}'")
+
+
+if __name__ == "__main__":
+    run_benchmark()
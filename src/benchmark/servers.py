@@ -0,0 +1,275 @@
+"""
+Local stand-ins for the career pages & the LLM provider, so that the pipeline can be benchmarked offline.
+
+- `FixtureServer` serves recorded (or synthetic) career page contents as HTML pages, one per org.
+- `MockLLMServer` is an OpenAI compatible `/chat/completions` endpoint that answers like a well behaved model
+  would (reading the job links off the prompt) after a configurable latency, with configurable rates of
+  rate limiting (429s) & malformed JSON responses.
+"""
+
+import json
+import random
+import re
+import threading
+from html import unescape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from typing import Dict, List, Optional
+
+from src.config import SCRAPE_DOWNLOAD_PATH, log
+from src.scrape.store import CrawlStore
+
+FIXTURE_SELECTOR = "#listings"
+SYNTHETIC_TITLES = (
+    "Senior Data Scientist", "Machine Learning Engineer", "NLP Research Scientist", "Deep Learning Engineer",
+    "LLM Platform Engineer", "AI Product Manager", "Backend Engineer", "Frontend Engineer", "Account Executive",
+    "Customer Success Manager", "Recruiter", "Site Reliability Engineer", "Product Designer", "Finance Manager",
+)  # fmt: skip
+SYNTHETIC_LOCATIONS = ("Berlin", "Remote", "London", "New York", "Amsterdam, Hybrid", "Paris")
+# what the mock LLM considers relevant, standing in for the topic of the run
+RELEVANT_PATTERN = re.compile(r"\b(data|machine|learning|ml|ai|nlp|llm|deep|scien\w*)\b", re.IGNORECASE)
+ANCHOR_PATTERN = re.compile(r'<a [^>]*?href=\\?"([^"\\]+)\\?"[^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+# the crew's task refers to the org either by its scraped file or by its name & URL
+FILE_PATH_PATTERN = re.compile(r"(data/crawl/export/([^\"'\s/]+)\.json)")
+TASK_ORG_PATTERN = re.compile(r'of the org "([^"]+)" at (\S+?)\.?\s')
+FILE_URL_PATTERN = re.compile(r'\\?"url\\?": \\?"([^"\\]+)')
+
+
+def make_synthetic_fixture(idx: int, n_jobs: Optional[int] = None) -> str:
+    """a career page content resembling what's scraped off a job board, reproducible for the same `idx`"""
+    rng = random.Random(idx)
+    n_jobs = n_jobs or rng.randint(10, 60)
+    entries = []
+    for job in range(n_jobs):
+        entries.append(
+            f'<div class="posting" data-id="{idx}-{job}"><style>.posting{{margin:0}}</style>'
+            f'<a class="posting-title" href="/jobs/{idx}-{job}"><h5>{rng.choice(SYNTHETIC_TITLES)}</h5>'
+            f'<span class="location">{rng.choice(SYNTHETIC_LOCATIONS)}</span></a>'
+            '<svg viewBox="0 0 10 10"><path d="M0 0L10 10"></path></svg></div>'
+        )
+    return "\n".join(entries)
+
+
+def load_fixtures(fixtures_dir=SCRAPE_DOWNLOAD_PATH, n_synthetic: int = 20) -> List[str]:
+    """the contents of the orgs scraped so far or synthetic ones if nothing has been scraped yet"""
+    store = CrawlStore(fixtures_dir)
+    fixtures = []
+    for entry in sorted(store.entries(), key=lambda entry: entry["org"]):
+        if content := store.read(entry["org"]):
+            fixtures.append(content)
+    if not len(fixtures):
+        log.warning(f"no fixtures found under '{fixtures_dir}'. Using {n_synthetic} synthetic ones instead.")
+        fixtures = [make_synthetic_fixture(idx) for idx in range(n_synthetic)]
+    return fixtures
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str, headers: Optional[Dict[str, str]] = None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _BackgroundServer:
+    """a threaded HTTP server running in a daemon thread for as long as it's used as a context manager"""
+
+    handler = _QuietHandler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler)
+        self.httpd.daemon_threads = True
+        # let the handlers reach the server's state
+        self.httpd.owner = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _FixtureHandler(_QuietHandler):
+    def do_GET(self):
+        content = self.server.owner.pages.get(self.path.strip("/"))
+        if content is None:
+            self._send(404, "not found", "text/plain")
+            return
+        html = f'<html><head><title>careers</title></head><body><div id="listings">{content}</div></body></html>'
+        self._send(200, html, "text/html; charset=utf-8")
+
+
+class FixtureServer(_BackgroundServer):
+    """serve `n_orgs` career pages at `/<org>`, cycling through the `fixtures`"""
+
+    handler = _FixtureHandler
+
+    def __init__(self, fixtures: List[str], n_orgs: int, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = {f"bench_{idx:04d}": fixtures[idx % len(fixtures)] for idx in range(n_orgs)}
+
+    def orgs_config(self) -> Dict[str, dict]:
+        """the contents of an `orgs.yaml` pointing to the served pages"""
+        return {org: {"url": f"{self.base_url}/{org}", "selector": FIXTURE_SELECTOR} for org in self.pages}
+
+
+def _text(content) -> str:
+    # content blocks (e.g. with cache control hints) carry their text in `text`
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content or "")
+
+
+def _find_jobs(text: str) -> List[dict]:
+    jobs = []
+    for href, link_text in ANCHOR_PATTERN.findall(text):
+        # the title comes first in a job's link, followed by its location (if any), in both raw & reduced HTML
+        parts = [" ".join(part.split()) for part in unescape(TAG_PATTERN.sub("|", link_text)).split("|")]
+        parts = [part for part in parts if part] + [None]
+        title, location = parts[0], parts[1] if len(parts) > 2 else None
+        if title and RELEVANT_PATTERN.search(title):
+            jobs.append({"title": title, "href": href, "location": location, "workplaceType": None})
+    return jobs
+
+
+class _MockLLMHandler(_QuietHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send(400, json.dumps({"error": {"message": "invalid JSON body"}}), "application/json")
+            return
+
+        server = self.server.owner
+        request_id = server.count("requests")
+        if server.roll("rate_limited", server.rate_limit_rate):
+            error = {"error": {"message": "rate limited", "type": "rate_limit_error", "code": 429}}
+            self._send(429, json.dumps(error), "application/json", {"Retry-After": str(server.retry_after_s)})
+            return
+
+        sleep(max(0.0, server.rng_gauss(server.latency_s, server.latency_jitter_s)))
+        messages = request.get("messages") or []
+        content = server.answer(messages, request)
+        if server.roll("malformed", server.malformed_rate):
+            content = content[: len(content) // 2]
+
+        prompt_tokens = sum(len(_text(msg.get("content"))) for msg in messages) // 4
+        completion_tokens = len(content) // 4
+        response = {
+            "id": f"bench-{request_id}",
+            "object": "chat.completion",
+            "created": int(time()),
+            "model": request.get("model", "bench"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        self._send(200, json.dumps(response), "application/json")
+
+
+class MockLLMServer(_BackgroundServer):
+    """
+    OpenAI compatible stand-in for an LLM provider, reachable at `base_url` + `/v1`.
+    Responses take `latency_s` (± `latency_jitter_s`) & a `rate_limit_rate` / `malformed_rate` share of them are
+    429s (with a `Retry-After` of `retry_after_s`) / truncated JSON.
+    """
+
+    handler = _MockLLMHandler
+
+    def __init__(
+        self,
+        latency_s: float = 1.0,
+        latency_jitter_s: float = 0.2,
+        rate_limit_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        retry_after_s: float = 1,
+        seed: int = 0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.latency_s = latency_s
+        self.latency_jitter_s = latency_jitter_s
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after_s = retry_after_s
+        self.counts: Dict[str, int] = {"requests": 0, "rate_limited": 0, "malformed": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            self.counts[name] += 1
+            return self.counts[name]
+
+    def roll(self, name: str, rate: float) -> bool:
+        with self._lock:
+            hit = self._rng.random() < rate
+        if hit:
+            self.count(name)
+        return hit
+
+    def rng_gauss(self, mu: float, sigma: float) -> float:
+        with self._lock:
+            return self._rng.gauss(mu, sigma)
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts = {name: 0 for name in self.counts}
+
+    def answer(self, messages: List[dict], request: dict) -> str:
+        """respond the way the pipeline expects a capable model to"""
+        system = " ".join(_text(msg.get("content")) for msg in messages if msg.get("role") == "system")
+        conversation = " ".join(_text(msg.get("content")) for msg in messages if msg.get("role") != "system")
+        schema_name = ((request.get("response_format") or {}).get("json_schema") or {}).get("name")
+
+        # crewAI agents talk in "Thought / Action / Final Answer" turns
+        if "Final Answer" in system + conversation:
+            return self._answer_crew(system, conversation)
+        if conversation.lstrip().startswith("Invalid response:"):
+            return json.dumps({"relevant": []} if '"relevant"' in system else {"jobs": []})
+        if schema_name == "RelevantJobsModel" or '"relevant"' in system:
+            titles = re.findall(r"^(\d+)\. (.*)$", conversation, re.MULTILINE)
+            return json.dumps({"relevant": [int(idx) for idx, title in titles if RELEVANT_PATTERN.search(title)]})
+        return json.dumps({"jobs": _find_jobs(conversation)})
+
+    @staticmethod
+    def _answer_crew(system: str, conversation: str) -> str:
+        tool = re.search(r"Tool Name: (.+)", system)
+        file_path = FILE_PATH_PATTERN.search(conversation)
+        # read the file with the agent's tool first, just like a model would
+        if tool is not None and file_path is not None and "Observation" not in conversation:
+            action_input = json.dumps({"file_path": file_path.group(1)})
+            return f"Thought: I need to read the file\nAction: {tool.group(1).strip()}\nAction Input: {action_input}"
+
+        # the org & its URL are either in the task itself or in the file read by the agent
+        if (task := TASK_ORG_PATTERN.search(conversation)) is not None:
+            org, url = task.groups()
+        else:
+            url_match = FILE_URL_PATTERN.search(conversation)
+            org, url = file_path.group(2) if file_path else "", url_match.group(1) if url_match else ""
+        answer = {
+            "org": org,
+            "url": url,
+            "jobs": _find_jobs(conversation),
+        }
+        return f"Thought: I now can give a great answer\nFinal Answer: {json.dumps(answer)}"
@@ -0,0 +1,109 @@
+"""
+Content-addressed on-disk cache of LLM responses so that unchanged career pages cost no LLM calls on later runs.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from time import time
+from typing import Optional
+
+from src.config import LLM_CACHE_PATH, log
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Stores one JSON file per request under `cache_dir`. Entries older than `max_age_days` are ignored & deleted,
+    and the oldest entries are evicted first whenever the cache grows beyond `max_size_mb`. As that takes listing the
+    whole cache, it's only checked when the cache is opened & then every `prune_every` writes.
+    """
+
+    def __init__(
+        self, cache_dir=LLM_CACHE_PATH, max_age_days: float = 7, max_size_mb: float = 200, prune_every: int = 100
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age_s = max_age_days * 24 * 60 * 60 if max_age_days else None
+        self.max_size_bytes = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.prune_every = prune_every
+        self._n_writes = 0
+        self.prune()
+
+    @staticmethod
+    def make_key(model_name: str, temperature: float, messages, **payload_kwargs) -> str:
+        """key on the model, temperature, system prompt & a hash of the rest of the conversation"""
+        system_prompt = "".join(str(msg.get("content")) for msg in messages if msg.get("role") == "system")
+        conversation = json.dumps(
+            [msg for msg in messages if msg.get("role") != "system"], sort_keys=True, ensure_ascii=False, default=str
+        )
+        payload = json.dumps(payload_kwargs, sort_keys=True, default=str)
+        parts = (model_name, str(temperature), hash_text(system_prompt), hash_text(conversation), hash_text(payload))
+        return hash_text("|".join(parts))
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _is_expired(self, created: float) -> bool:
+        return self.max_age_s is not None and time() - created > self.max_age_s
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path) as fl:
+                entry = json.load(fl)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if self._is_expired(entry["created"]):
+            self.delete(key)
+            return None
+        log.debug(f"LLM cache hit: {key}")
+        return entry["response"]
+
+    def set(self, key: str, response: str, model_name: str):
+        path = self._path(key)
+        # several processes & threads may write the same entry at once, each through a temp file of its own
+        with tempfile.NamedTemporaryFile("w", dir=self.cache_dir, prefix=f"{key}.", suffix=".tmp", delete=False) as fl:
+            json.dump({"model": model_name, "created": time(), "response": response}, fl, ensure_ascii=False)
+        os.replace(fl.name, path)
+        self._n_writes += 1
+        if self._n_writes % self.prune_every == 0:
+            self.prune()
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+    def prune(self):
+        """drop expired entries & then the oldest ones until the cache fits into `max_size_mb`"""
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # deleted by another process in the meantime
+                continue
+            if self.max_age_s is not None and time() - stat.st_mtime > self.max_age_s:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        if self.max_size_bytes is None:
+            return
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self.max_size_bytes:
+            return
+        log.debug(f"LLM cache exceeds {self.max_size_bytes} bytes. Evicting oldest entries.")
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob("*.json"):
+            path.unlink(missing_ok=True)
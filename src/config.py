@@ -1,4 +1,3 @@
-import os
 import yaml
 import logging
 from pathlib import Path
@@ -10,12 +9,16 @@ JOB_TOPIC = "Data Science or Machine/Deep Learning or NLP/LLMs or AI"
 PROVIDER_CREDENTIALS_PATH = Path("creds.yaml")
 SCRAPE_ORGS_PATH = Path("src/scrape/orgs.yaml")
 SCRAPE_DOWNLOAD_PATH = Path("data/crawl")
+SCRAPE_MANIFEST_PATH = Path("data/crawl_manifest.json")
 JOBS_PATH = Path("data/jobs")
 JOBS_WRITE_PATH = JOBS_PATH / "individual"
+LISTINGS_WRITE_PATH = JOBS_PATH / "listings"
 FINAL_REPORT_PATH = JOBS_PATH / "final_reports"
-
-for path in (SCRAPE_DOWNLOAD_PATH, JOBS_WRITE_PATH, FINAL_REPORT_PATH):
-    path.mkdir(parents=True, exist_ok=True)
+LLM_CACHE_PATH = Path("data/llm_cache")
+RUNS_PATH = Path("data/runs")
+JOB_INDEX_PATH = JOBS_PATH / "index.sqlite3"
+WORK_QUEUE_PATH = Path("data/work_queue.sqlite3")
+# folders are created by whatever writes into them first, so that importing the package doesn't touch the disk
 
 
 def get_logger(LOG_LEVEL="INFO"):
@@ -25,7 +28,8 @@ def get_logger(LOG_LEVEL="INFO"):
     log = logging.Logger("agentic_search")
     log.setLevel(LOG_LEVEL)
 
-    file_handler = logging.FileHandler(LOG_PATH)
+    # the log file is only opened (& created) once something is logged
+    file_handler = logging.FileHandler(LOG_PATH, delay=True)
     file_handler.setLevel(LOG_LEVEL)
     file_handler.setFormatter(formatter)
 
@@ -37,17 +41,11 @@ def get_logger(LOG_LEVEL="INFO"):
 log = get_logger("DEBUG")
 
 
-def load_creds(provider):
+def read_creds(provider):
+    """credentials of a single provider, without exporting them to the environment"""
     with open(PROVIDER_CREDENTIALS_PATH) as fl:
         creds = yaml.safe_load(fl)
-
-    providers = creds.keys()
-
-    # unset previous providers' credentials, if any
-    _ = [os.environ.pop(key) for provider in providers for key in os.environ.keys() if key.startswith(provider)]
-
-    if creds.get(provider):
-        for k, v in creds[provider].items():
-            os.environ[f"{provider}_{k}"] = str(v)
-    else:
+    if not creds.get(provider):
         log.error(f'LLM credentials for "{provider}" not found')
+        raise KeyError(provider)
+    return creds[provider]
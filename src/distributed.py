@@ -0,0 +1,68 @@
+"""
+Producer & reducer of a run sharded across several worker processes through a work queue (see `src/work_queue.py`):
+
+1. `enqueue_orgs` queues every org to be scraped (or, with `--no-scrape`, every org scraped so far to be extracted)
+2. any no. of `scrape_jobsites --queue <name>` & `run_manual --queue <name>` workers scrape & extract them
+3. `reduce_queue` assembles the final report out of the jobs the workers stored
+"""
+
+import os
+from time import sleep, strftime
+
+import click
+
+from src.config import JOB_TOPIC, log
+from src.scrape.scrape import get_orgs_info
+from src.scrape.store import crawl_store
+from src.utils import jobs_info_path, load_jobs_info, store_final_jobs_report
+from src.work_queue import DONE, EXTRACT, FAILED, SCRAPE, WorkQueue
+
+
+@click.command(context_settings=dict(show_default=True))
+@click.option("--queue", default=None, help="name of the work queue. Defaults to the current time")
+@click.option(
+    "--topic",
+    default=[JOB_TOPIC],
+    multiple=True,
+    help="the topic the orgs are extracted for. Repeat it to extract several topics in a single pass",
+)
+@click.option("--scrape/--no-scrape", default=True, help="queue the orgs to be scraped first or only to be extracted")
+def enqueue_orgs(queue, topic, scrape):
+    queue = WorkQueue(queue or strftime("%Y%m%d-%H%M%S"))
+    queue.create(topic[0] if len(topic) == 1 else list(topic))
+    if scrape:
+        queue.enqueue(SCRAPE, [{"org": entry["org"], "url": entry["url"]} for entry in get_orgs_info()])
+    else:
+        entries = [entry for entry in crawl_store.entries() if entry["content_hash"] is not None]
+        queue.enqueue(EXTRACT, [{k: entry[k] for k in ("org", "url", "content_hash")} for entry in entries])
+    log.info(f"work queue '{queue.name}': {queue.counts()}")
+    click.echo(queue.name)
+
+
+@click.command(context_settings=dict(show_default=True))
+@click.option("--queue", required=True, help="name of the work queue")
+@click.option("--wait/--no-wait", default=True, help="wait for the workers to drain the queue before reducing it")
+@click.option("--poll-s", default=10, help="seconds between checks whether the queue is drained")
+def reduce_queue(queue, wait, poll_s):
+    queue = WorkQueue(queue)
+    topic = queue.topic
+    while not queue.is_drained(SCRAPE, EXTRACT):
+        if not wait:
+            log.warning(f"work queue '{queue.name}' isn't drained yet: {queue.counts()}. Reducing it as it is.")
+            break
+        sleep(float(poll_s))
+
+    results = []
+    for item in queue.items(EXTRACT, DONE):
+        if not os.path.exists(jobs_info_path(item["org"])):
+            log.warning(f"jobs of org: {item['org']} weren't found even though they were extracted")
+            continue
+        results.append(load_jobs_info(item["org"]))
+    failed = {item["org"]: item["reason"] for stage in (SCRAPE, EXTRACT) for item in queue.items(stage, FAILED)}
+    if len(failed):
+        log.warning(f"{len(failed)} orgs failed in work queue '{queue.name}': {failed}")
+    store_final_jobs_report(results, topic)
+
+
+if __name__ == "__main__":
+    reduce_queue()
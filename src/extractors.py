@@ -0,0 +1,232 @@
+"""
+Rule based extractors for job boards hosted on well known ATS platforms (Ashby, Greenhouse, Lever...).
+Their listings share the same markup across orgs, so jobs can be read off the scraped HTML directly
+without asking an LLM. Orgs whose URL doesn't match any registered extractor still go through the LLM.
+
+Register extractors for other platforms with `register_extractor`.
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from src.config import log
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+WORKPLACE_TYPES = {"remote": "Remote", "hybrid": "Hybrid", "on-site": "On-Site", "onsite": "On-Site"}
+
+
+class SimpleSelector:
+    """
+    A tiny subset of CSS selectors: `tag`, `.class`, `tag.class` & `tag[attr=value]`.
+    Classes match on substrings since some platforms (e.g. Ashby) suffix their class names with build hashes.
+    """
+
+    _pattern = re.compile(
+        r"^(?P<tag>[\w-]*)(?:\.(?P<cls>[\w-]+))?(?:\[(?P<attr>[\w-]+)=[\"']?(?P<value>[^\"'\]]*)[\"']?\])?$"
+    )
+
+    def __init__(self, selector: str):
+        match = self._pattern.match(selector.strip())
+        if match is None:
+            raise ValueError(f"unsupported selector: '{selector}'")
+        self.tag, self.cls, self.attr, self.value = match.group("tag", "cls", "attr", "value")
+
+    def matches(self, tag: str, attrs: Dict[str, str]) -> bool:
+        if self.tag and self.tag != tag:
+            return False
+        if self.cls and not any(self.cls in cls for cls in (attrs.get("class") or "").split()):
+            return False
+        if self.attr and attrs.get(self.attr) != self.value:
+            return False
+        return True
+
+
+class _ListingParser(HTMLParser):
+    def __init__(self, container: SimpleSelector, fields: Dict[str, List[SimpleSelector]], links: List[SimpleSelector]):
+        super().__init__(convert_charrefs=True)
+        self.container = container
+        self.fields = fields
+        self.links = links
+        self.listings: List[Dict[str, str]] = []
+        self._stack: List[str] = []
+        self._listing: Optional[Dict[str, List[str]]] = None
+        self._listing_depth = 0
+        # (field name, depth of the element whose text is being captured)
+        self._captures: List[tuple] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: v or "" for k, v in attrs}
+        depth = len(self._stack) + 1
+        if self._listing is None and self.container.matches(tag, attrs):
+            self._listing, self._listing_depth = {"text": []}, depth
+        if self._listing is not None:
+            if tag == "a" and attrs.get("href") and "href" not in self._listing:
+                if not self.links or any(sel.matches(tag, attrs) for sel in self.links):
+                    self._listing["href"] = [attrs["href"]]
+            for field, selectors in self.fields.items():
+                if field not in self._listing and any(sel.matches(tag, attrs) for sel in selectors):
+                    self._listing[field] = []
+                    self._captures.append((field, depth))
+        if tag not in VOID_TAGS:
+            self._stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS or tag not in self._stack:
+            return
+        # pop any unclosed elements along with the one being closed
+        while self._stack:
+            depth = len(self._stack)
+            self._captures = [(field, d) for field, d in self._captures if d < depth]
+            if self._listing is not None and depth == self._listing_depth:
+                self._finish_listing()
+            if self._stack.pop() == tag:
+                break
+
+    def handle_data(self, data):
+        if self._listing is None:
+            return
+        text = " ".join(data.split())
+        if not text:
+            return
+        self._listing["text"].append(text)
+        for field, _ in self._captures:
+            self._listing[field].append(text)
+
+    def _finish_listing(self):
+        listing = {field: " ".join(parts) for field, parts in self._listing.items()}
+        self.listings.append(listing)
+        self._listing, self._captures = None, []
+
+
+class RuleBasedExtractor:
+    """
+    Extract jobs from the listings (`container`) of a job board whose URL matches `url_pattern`.
+    The `href` is taken from the first link in the container (matching any of the `link` selectors, if given)
+    & the other fields from the text of the first element matching any of their selectors.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url_pattern: str,
+        container: str,
+        title: List[str],
+        location: Optional[List[str]] = None,
+        workplace_type: Optional[List[str]] = None,
+        link: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.url_pattern = re.compile(url_pattern, re.IGNORECASE)
+        self.container = SimpleSelector(container)
+        self.fields = {
+            "title": [SimpleSelector(sel) for sel in title],
+            "location": [SimpleSelector(sel) for sel in location or []],
+            "workplaceType": [SimpleSelector(sel) for sel in workplace_type or []],
+        }
+        self.links = [SimpleSelector(sel) for sel in link or []]
+
+    def matches(self, url: str) -> bool:
+        return self.url_pattern.search(url) is not None
+
+    @staticmethod
+    def _guess_workplace_type(text: str) -> Optional[str]:
+        text = text.lower()
+        for keyword, workplace_type in WORKPLACE_TYPES.items():
+            if keyword in text:
+                return workplace_type
+        return None
+
+    def extract(self, content: Optional[str]) -> List[Dict[str, Optional[str]]]:
+        """return the jobs found in `content` in the format of `JobModel`"""
+        if not content:
+            return []
+        parser = _ListingParser(self.container, self.fields, self.links)
+        parser.feed(content)
+        parser.close()
+
+        jobs = []
+        for listing in parser.listings:
+            if not listing.get("href") or not listing.get("title"):
+                continue
+            jobs.append(
+                {
+                    "title": listing["title"],
+                    "href": listing["href"],
+                    "location": listing.get("location") or None,
+                    "workplaceType": listing.get("workplaceType") or self._guess_workplace_type(listing["text"]),
+                }
+            )
+        log.debug(f"'{self.name}' extractor found {len(jobs)} jobs")
+        return jobs
+
+
+EXTRACTORS: List[RuleBasedExtractor] = []
+
+
+def register_extractor(extractor: RuleBasedExtractor) -> RuleBasedExtractor:
+    EXTRACTORS.append(extractor)
+    return extractor
+
+
+def get_extractors(url: str) -> List[RuleBasedExtractor]:
+    """return the registered extractors that can handle the job board at `url`"""
+    return [extractor for extractor in EXTRACTORS if extractor.matches(url)]
+
+
+def extract_jobs(url: str, content: Optional[str]) -> Optional[List[Dict[str, Optional[str]]]]:
+    """
+    return the jobs found by the first matching extractor that finds any.
+    `None` means that the LLM has to take over, either because the job board is unknown
+    or because its markup changed & none of the rules match anymore.
+    """
+    for extractor in get_extractors(url):
+        jobs = extractor.extract(content)
+        if jobs:
+            return jobs
+    return None
+
+
+register_extractor(
+    RuleBasedExtractor(
+        name="ashby",
+        url_pattern=r"^https?://jobs\.ashbyhq\.com/",
+        container="a._container_",
+        title=["h3._title_"],
+        location=["div._details_"],
+    )
+)
+register_extractor(
+    RuleBasedExtractor(
+        name="greenhouse",
+        url_pattern=r"^https?://(boards|job-boards)(\.eu)?\.greenhouse\.io/",
+        container="tr.job-post",
+        title=["p.body--medium"],
+        location=["p.body--metadata"],
+    )
+)
+register_extractor(
+    RuleBasedExtractor(
+        name="greenhouse_legacy",
+        url_pattern=r"^https?://boards\.greenhouse\.io/",
+        container="div.opening",
+        title=["a"],
+        location=["span.location"],
+    )
+)
+register_extractor(
+    RuleBasedExtractor(
+        name="lever",
+        url_pattern=r"^https?://jobs(\.eu)?\.lever\.co/",
+        container="div.posting",
+        title=["h5[data-qa=posting-name]"],
+        location=["span.location"],
+        workplace_type=["span.workplaceTypes"],
+        link=["a.posting-title"],
+    )
+)
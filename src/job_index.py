@@ -0,0 +1,191 @@
+"""
+Persistent index of every job posting reported so far, across runs.
+
+Postings are keyed by topic & their normalized `href` and remember when they were first & last seen and when they
+were removed (i.e. no longer listed by their org), so that new, removed & active postings are a query away instead
+of a diff of every final report ever written.
+"""
+
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from time import time
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import click
+
+from src.config import JOB_INDEX_PATH, JOB_TOPIC, log
+
+STATUSES = ("new", "removed", "active")
+# query params that only tell where the visitor came from, not which job it is. Matched by name, as the likes of
+# `reference` or `sourceId` may well tell jobs apart
+TRACKING_PARAMS = {"gh_src", "lever-source", "lever-origin", "ref", "source"}
+TRACKING_PARAM_PREFIXES = ("utm_",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    topic TEXT NOT NULL,
+    href_key TEXT NOT NULL,
+    org TEXT NOT NULL,
+    title TEXT NOT NULL,
+    href TEXT NOT NULL,
+    location TEXT,
+    workplaceType TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    removed REAL,
+    PRIMARY KEY (topic, href_key)
+);
+CREATE INDEX IF NOT EXISTS jobs_org ON jobs (topic, org);
+CREATE INDEX IF NOT EXISTS jobs_first_seen ON jobs (topic, first_seen);
+CREATE INDEX IF NOT EXISTS jobs_removed ON jobs (topic, removed);
+CREATE TABLE IF NOT EXISTS reports (
+    topic TEXT NOT NULL,
+    reported_at REAL NOT NULL
+);
+"""
+
+
+def normalize_href(href: str) -> str:
+    """the same posting under different URLs (case of the host, trailing slashes, fragments, tracking params...)"""
+    parts = urlsplit(href.strip())
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(sorted(query)), ""))
+
+
+class JobIndex:
+    """SQLite backed index of job postings at `path`, safe to update from several threads & processes"""
+
+    def __init__(self, path=JOB_INDEX_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            # let readers query the index while an org is being upserted
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def upsert_org(self, org: str, jobs: List[dict], topic: str = JOB_TOPIC, seen_at: Optional[float] = None):
+        """
+        record the jobs currently listed by `org`: new ones are added, listed ones are seen again (even if they were
+        removed before) & the ones that aren't listed anymore are marked as removed
+        """
+        seen_at = seen_at or time()
+        rows = {
+            normalize_href(job["href"]): (
+                topic,
+                normalize_href(job["href"]),
+                org,
+                job["title"],
+                job["href"],
+                job.get("location"),
+                job.get("workplaceType"),
+                seen_at,
+                seen_at,
+            )
+            for job in jobs
+        }
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                """
+                INSERT INTO jobs (topic, href_key, org, title, href, location, workplaceType, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (topic, href_key) DO UPDATE SET
+                    org = excluded.org, title = excluded.title, href = excluded.href,
+                    location = excluded.location, workplaceType = excluded.workplaceType,
+                    last_seen = excluded.last_seen, removed = NULL
+                """,
+                rows.values(),
+            )
+            n_removed = conn.execute(
+                "UPDATE jobs SET removed = ? WHERE topic = ? AND org = ? AND removed IS NULL AND last_seen < ?",
+                (seen_at, topic, org, seen_at),
+            ).rowcount
+        log.debug(f"indexed {len(rows)} jobs of org: {org}, {n_removed} of its earlier jobs aren't listed anymore")
+
+    def query(
+        self, status: str, topic: str = JOB_TOPIC, org: Optional[str] = None, since: Optional[float] = None
+    ) -> List[dict]:
+        """
+        postings that are `new` (first seen), `removed` (no longer listed) since the timestamp `since` or that are
+        `active` (still listed), optionally of a single `org`
+        """
+        if status not in STATUSES:
+            raise ValueError(f"unknown status '{status}'. Pick one of {STATUSES}")
+        clauses, params = ["topic = ?"], [topic]
+        if status == "new":
+            clauses.append("first_seen >= ? AND removed IS NULL")
+            params.append(since or 0)
+        elif status == "removed":
+            clauses.append("removed >= ?")
+            params.append(since or 0)
+        else:
+            clauses.append("removed IS NULL")
+        if org is not None:
+            clauses.append("org = ?")
+            params.append(org)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"""
+                SELECT org, title, href, location, workplaceType, first_seen, last_seen, removed FROM jobs
+                WHERE {" AND ".join(clauses)} ORDER BY org, first_seen
+                """,
+                params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_reported(self, topic: str = JOB_TOPIC, nth: int = 1) -> Optional[float]:
+        """when the `nth` last report of the `topic` was written, if there were that many"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT reported_at FROM reports WHERE topic = ? ORDER BY reported_at DESC LIMIT 1 OFFSET ?",
+                (topic, nth - 1),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def diff(self, topic: str = JOB_TOPIC) -> dict:
+        """the postings new or removed since the last report of the `topic`, which is then recorded as reported"""
+        since, reported_at = self.last_reported(topic), time()
+        diff = {
+            "since": since,
+            "new": self.query("new", topic, since=since),
+            "removed": self.query("removed", topic, since=since),
+        }
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT INTO reports (topic, reported_at) VALUES (?, ?)", (topic, reported_at))
+        return diff
+
+
+job_index = JobIndex()
+
+
+@click.command(context_settings=dict(show_default=True))
+@click.option("--status", type=click.Choice(STATUSES), default="new", help="which postings to list")
+@click.option("--topic", default=JOB_TOPIC, help="the topic the postings were reported for")
+@click.option("--org", default=None, help="only list the postings of this org")
+@click.option(
+    "--since-days",
+    default=-1.0,
+    help="list the postings new / removed in the last N days. Pass `-1` for those of the last report",
+)
+def query_jobs(status, topic, org, since_days):
+    since = job_index.last_reported(topic, nth=2) if since_days == -1 else time() - since_days * 24 * 60 * 60
+    for job in job_index.query(status, topic, org, since):
+        click.echo(f"{job['org']}\t{job['title']}\t{job['location'] or ''}\t{job['href']}")
+
+
+if __name__ == "__main__":
+    query_jobs()
@@ -0,0 +1,86 @@
+"""
+Journal of a run, recording the status of every org (scraped, extracted or failed along with the reason) as soon as
+it changes, so that a run that died half way can be resumed with its run ID without redoing the orgs it completed.
+"""
+
+import json
+import os
+import threading
+from time import strftime, time
+from typing import Dict, List, Optional
+
+from src.config import JOB_TOPIC, RUNS_PATH, log
+from src.utils import jobs_info_path, load_jobs_info
+
+SCRAPED, EXTRACTED, FAILED = "scraped", "extracted", "failed"
+
+
+class RunJournal:
+    def __init__(self, run_id: Optional[str] = None, topic: str = JOB_TOPIC):
+        self.run_id = run_id or strftime("%Y%m%d-%H%M%S")
+        self.topic = topic
+        self.scrape_done = False
+        self.orgs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return RUNS_PATH / f"{self.run_id}.json"
+
+    @classmethod
+    def load(cls, run_id: str, topic: str = JOB_TOPIC) -> "RunJournal":
+        """the journal of an earlier run to resume. Raises `FileNotFoundError` if there's no such run"""
+        journal = cls(run_id, topic)
+        with open(journal.path) as fl:
+            state = json.load(fl)
+        if state["topic"] != topic:
+            log.warning(f"run '{run_id}' was for the topic \"{state['topic']}\". Resuming it with that topic.")
+        journal.topic, journal.scrape_done, journal.orgs = state["topic"], state["scrape_done"], state["orgs"]
+        log.info(f"resuming run '{run_id}' with {len(journal.completed_orgs())} orgs already extracted")
+        return journal
+
+    def _save(self):
+        state = {"run_id": self.run_id, "topic": self.topic, "scrape_done": self.scrape_done, "orgs": self.orgs}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as fl:
+            json.dump(state, fl, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def mark(self, org: str, status: str, reason: Optional[str] = None):
+        with self._lock:
+            self.orgs[org] = {"status": status, "reason": reason, "updated": time()}
+            self._save()
+
+    def mark_scraped(self, orgs: List[str]):
+        """record that scraping is over & which orgs it yielded, leaving the orgs extracted so far as they are"""
+        with self._lock:
+            self.scrape_done = True
+            for org in orgs:
+                if self.orgs.get(org, {}).get("status") != EXTRACTED:
+                    self.orgs[org] = {"status": SCRAPED, "reason": None, "updated": time()}
+            self._save()
+
+    def completed_orgs(self) -> List[str]:
+        return [org for org, entry in self.orgs.items() if entry["status"] == EXTRACTED]
+
+    def failed_orgs(self) -> Dict[str, Optional[str]]:
+        return {org: entry["reason"] for org, entry in self.orgs.items() if entry["status"] == FAILED}
+
+    def report(self, results: Optional[List[dict]] = None) -> List[dict]:
+        """
+        the final report of the run: the given `results` along with the stored jobs of every other org
+        extracted in this run, including those extracted before it was resumed
+        """
+        results = list(results or [])
+        reported_orgs = {res["org"] for res in results}
+        for org in self.completed_orgs():
+            if org in reported_orgs:
+                continue
+            if not os.path.exists(jobs_info_path(org)):
+                log.warning(f"jobs of org: {org} weren't found even though they were extracted in this run")
+                continue
+            results.append(load_jobs_info(org))
+        if failed := self.failed_orgs():
+            log.warning(f"{len(failed)} orgs failed in run '{self.run_id}'. Resume it to retry them: {list(failed)}")
+        return results
@@ -1,11 +1,17 @@
-import os
-from time import sleep
-from typing import Any, Dict, List, Optional, Union
+import asyncio
+import re
+import threading
+from time import monotonic, sleep
+from typing import Dict, Optional
 
-from crewai import BaseLLM
-from litellm import APIConnectionError, completion
+from src.cache import ResponseCache
+from src.config import log, read_creds
+from src.telemetry import telemetry
 
-from src.config import load_creds, log
+# litellm takes seconds to import, so it's only imported once the first request is prepared (see `benchmark_imports`)
+
+# 400s naming the params that carry the response schema
+SCHEMA_ERROR_PATTERN = re.compile(r"response_format|json_schema|\bformat\b", re.IGNORECASE)
 
 """
 from tenacity import (
@@ -37,50 +43,98 @@ def _release_lock(retry_state):
  """
 
 
-class CustomCrewLLM(BaseLLM):
-    def __init__(self, provider, temperature: float = 0.1, wait_between_requests_seconds: int = None):
-        self.provider = provider
-        self.temperature = temperature
-        self.llm = CustomLLM(provider, temperature, wait_between_requests_seconds)
-        super().__init__(model=self.llm.model_name, temperature=self.temperature)
-
-    # retry(
-    #         # Stop retrying after overall timeout
-    #         stop=stop_after_delay(_CALL_TIMEOUT),
-    #         # Retry only on specific HTTP/network errors
-    #         retry=retry_if_exception_type((requests.exceptions.RequestException, RuntimeError)),
-    #         before=_acquire_lock,
-    #         after=_release_lock,
-    #         reraise=True
-    # )
-    def call(
-        self,
-        messages: Union[str, List[Dict[str, str]]],
-        tools: Optional[List[dict]] = None,
-        callbacks: Optional[List[Any]] = None,
-        available_functions: Optional[Dict[str, Any]] = None,
-        from_task: Optional[Any] = None,
-        from_agent: Optional[Any] = None,
-    ) -> Union[str, Any]:
-        if isinstance(messages, str):
-            messages = [{"role": "user", "content": messages}]
+class RateLimiter:
+    """
+    Token bucket limiting the requests (RPM) & tokens (TPM) sent to a provider per minute.
+    Both buckets start full & refill continuously, so callers only wait once the quota is used up.
+    """
 
-        # add this flag to let the custom llm know that it was being called by agentic workflow
-        payload_kwargs = {"from_crew": True}
-        if tools and self.supports_function_calling():
-            payload_kwargs["tools"] = tools
+    def __init__(self, max_rpm: Optional[float] = None, max_tpm: Optional[float] = None):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._levels = {"rpm": max_rpm or 0, "tpm": max_tpm or 0}
+        self._last_refill = monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
 
-        llm_resp = self.llm(messages, **payload_kwargs)
-        return llm_resp
+    def set_limits(self, max_rpm: Optional[float] = None, max_tpm: Optional[float] = None):
+        with self._lock:
+            self.max_rpm, self.max_tpm = max_rpm, max_tpm
+            self._levels = {"rpm": max_rpm or 0, "tpm": max_tpm or 0}
+
+    def pause(self, seconds: float):
+        """hold back every request for `seconds`, e.g. when the provider asks to retry only after a while"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    def _reserve(self, tokens: int = 0, commit: bool = True) -> float:
+        """take the budget for a single request & return the no. of seconds to wait before sending it"""
+        with self._lock:
+            now = monotonic()
+            elapsed = now - self._last_refill
+            if commit:
+                self._last_refill = now
+            wait = max(0.0, self._paused_until - now)
+            for key, limit, cost in (("rpm", self.max_rpm, 1), ("tpm", self.max_tpm, tokens)):
+                if not limit:
+                    continue
+                rate = limit / 60
+                # a single prompt larger than the whole TPM budget should still go through eventually
+                level = min(limit, self._levels[key] + elapsed * rate) - min(cost, limit)
+                if commit:
+                    self._levels[key] = level
+                if level < 0:
+                    wait = max(wait, -level / rate)
+            return wait
+
+    def expected_wait(self, tokens: int = 0) -> float:
+        """the no. of seconds a request would have to wait if it was sent now, without taking any budget"""
+        return self._reserve(tokens, commit=False)
+
+    def acquire(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait:
+            log.debug(f"rate limited. sleeping for {wait:.2f} secs")
+            sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait:
+            log.debug(f"rate limited. sleeping for {wait:.2f} secs")
+            await asyncio.sleep(wait)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(provider: str, max_rpm: Optional[float] = None, max_tpm: Optional[float] = None) -> RateLimiter:
+    """
+    return the limiter shared by every LLM talking to `provider` in this process, so that they all draw from the same
+    quota (e.g. the LLMs of concurrent crews). It takes on the limits it was last asked for.
+    """
+    limiter = _rate_limiters.get(provider)
+    if limiter is None:
+        limiter = _rate_limiters[provider] = RateLimiter(max_rpm, max_tpm)
+    elif (limiter.max_rpm, limiter.max_tpm) != (max_rpm, max_tpm):
+        limiter.set_limits(max_rpm, max_tpm)
+    return limiter
 
-    def supports_function_calling(self) -> bool:
-        return True
 
-    def supports_stop_words(self) -> bool:
-        return True
+def get_retry_after(error, default: float = 60.0) -> float:
+    """seconds to back off for, as told by the provider's `Retry-After` header, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return default
 
-    def get_context_window_size(self) -> int:
-        return int(os.environ[f"{self.provider}_CONTEXT_LENGTH"])
+
+def is_unsupported_schema_error(error) -> bool:
+    """whether a rejected request was rejected for its response schema rather than e.g. its size"""
+    from litellm import UnsupportedParamsError
+
+    return isinstance(error, UnsupportedParamsError) or bool(SCHEMA_ERROR_PATTERN.search(str(error)))
 
 
 class CustomLLM:
@@ -88,16 +142,46 @@ class CustomLLM:
         self,
         provider: str = "OPENROUTER",
         temperature: float = 0.1,
-        wait_between_requests_seconds: float = 5,
+        max_rpm: Optional[float] = None,
+        max_tpm: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+        structured_output: bool = False,
+        prompt_caching: bool = True,
+        keep_alive: str = "30m",
+        max_rate_limit_retries: int = 3,
+        rate_limit_backoff_s: float = 5,
     ):
         self._provider = provider
         self.temperature = temperature
-        self.wait = wait_between_requests_seconds
-        load_creds(provider)
+        self.rate_limiter = get_rate_limiter(provider, max_rpm, max_tpm)
+        self.cache = cache
+        self.structured_output = structured_output
+        self.prompt_caching = prompt_caching
+        self.keep_alive = keep_alive
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.rate_limit_backoff_s = rate_limit_backoff_s
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self._load_creds(provider)
+
+    def _load_creds(self, provider):
+        # each instance holds its own credentials so that several providers can be used at once
+        self.creds = read_creds(provider)
+        _prefix = bool(int(self.creds.get("PREFIX") or 0))
+        _model_name = self.creds["MODEL_NAME"]
+        self.model_name = f"{provider.lower()}/{_model_name}" if _prefix else _model_name
+        self._supports_cache_control = None
+
+    @property
+    def supports_cache_control(self) -> bool:
+        """whether the model takes `cache_control` markers. Looked up on first use, as it takes importing litellm"""
+        if self._supports_cache_control is None:
+            try:
+                from litellm.utils import supports_prompt_caching
 
-        _prefix = bool(os.environ[f"{self.provider}_PREFIX"])
-        _model_name = os.environ[f"{self.provider}_MODEL_NAME"]
-        self.model_name = f"{self.provider.lower()}/{_model_name}" if _prefix else _model_name
+                self._supports_cache_control = supports_prompt_caching(model=self.model_name)
+            except Exception:
+                self._supports_cache_control = False
+        return self._supports_cache_control
 
     @property
     def provider(self):
@@ -105,32 +189,243 @@ class CustomLLM:
 
     def change_provider(self, new_provider):
         self._provider = new_provider
-        load_creds(new_provider)
+        self.rate_limiter = get_rate_limiter(new_provider, self.rate_limiter.max_rpm, self.rate_limiter.max_tpm)
+        self._load_creds(new_provider)
 
-    def __call__(self, messages, **payload_kwargs):
+    def _prepare_request(self, messages, payload_kwargs):
         if isinstance(messages, str):
             messages = [{"role": "user", "content": messages}]
 
         payload_kwargs.update({"stream": False, "format": "json", "timeout": 300, "temperature": self.temperature})
+        payload_kwargs.update(
+            {"api_base": self.creds.get("API_BASE") or None, "api_key": self.creds.get("API_KEY") or None}
+        )
         if payload_kwargs.pop("from_crew", False):
             _ = payload_kwargs.pop("format")
+        response_model = payload_kwargs.pop("response_model", None)
+        if response_model is not None and self.structured_output:
+            payload_kwargs.update(self._structured_output_kwargs(response_model))
+        if self.prompt_caching:
+            messages = self._prepare_prefix_cache(messages)
+            if self.provider == "OLLAMA" and self.keep_alive:
+                # keep the model loaded so that ollama can reuse the already processed prompt prefix
+                payload_kwargs.setdefault("keep_alive", self.keep_alive)
+        return messages, payload_kwargs
+
+    def _prepare_prefix_cache(self, messages):
+        """
+        put the system messages, which are the same across requests, first so that they form a common prefix
+        that providers can cache, & mark the end of that prefix as cacheable where supported.
+        """
+        system_msgs = [msg for msg in messages if msg.get("role") == "system"]
+        other_msgs = [msg for msg in messages if msg.get("role") != "system"]
+        if system_msgs and self.supports_cache_control and isinstance(system_msgs[-1].get("content"), str):
+            content = [{"type": "text", "text": system_msgs[-1]["content"], "cache_control": {"type": "ephemeral"}}]
+            system_msgs[-1] = {**system_msgs[-1], "content": content}
+        return system_msgs + other_msgs
+
+    def _structured_output_kwargs(self, response_model):
+        """constrain the model's output to the JSON schema of the pydantic `response_model`"""
+        schema = response_model.model_json_schema()
+        if self.provider == "OLLAMA":
+            # ollama takes the schema in place of `"json"` & enforces it with a grammar
+            return {"format": schema}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": response_model.__name__, "schema": schema},
+            }
+        }
+
+    def _disable_structured_output(self, payload_kwargs, error):
+        """some providers/models don't support response schemas. Fall back to plain JSON mode for the rest of the run"""
+        log.warning(f"structured output isn't supported by '{self.model_name}'. Disabling it. Error: {error}")
+        self.structured_output = False
+        _ = payload_kwargs.pop("response_format", None)
+        if not isinstance(payload_kwargs.get("format", "json"), str):
+            payload_kwargs["format"] = "json"
+        return payload_kwargs
+
+    def _is_structured(self, payload_kwargs) -> bool:
+        return "response_format" in payload_kwargs or not isinstance(payload_kwargs.get("format", "json"), str)
+
+    def recache(self, messages, response, **payload_kwargs):
+        """cache `response` for these messages, e.g. after an invalid response was repaired"""
+        messages, payload_kwargs = self._prepare_request(messages, payload_kwargs)
+        key = self._cache_key(messages, payload_kwargs)
+        if key is not None:
+            self.cache.set(key, response, self.model_name)
+
+    def _cache_key(self, messages, payload_kwargs):
+        """`None` if responses aren't cached, e.g. for requests passing `use_cache=False`"""
+        use_cache = payload_kwargs.pop("use_cache", True)
+        if self.cache is None or not use_cache:
+            return None
+        # credentials, timeouts & how long the model stays loaded don't change the response. The temperature is part
+        # of the key already & responses are never streamed
+        excluded = ("api_base", "api_key", "timeout", "keep_alive", "temperature", "stream")
+        payload_kwargs = {k: v for k, v in payload_kwargs.items() if k not in excluded}
+        return self.cache.make_key(self.model_name, self.temperature, messages, **payload_kwargs)
+
+    def get_cached(self, messages, **payload_kwargs) -> Optional[str]:
+        messages, payload_kwargs = self._prepare_request(messages, payload_kwargs)
+        key = self._cache_key(messages, payload_kwargs)
+        return self.cache.get(key) if key is not None else None
+
+    def uncache(self, messages, **payload_kwargs):
+        """forget the cached response for these messages, e.g. when it turned out to be invalid"""
+        messages, payload_kwargs = self._prepare_request(messages, payload_kwargs)
+        key = self._cache_key(messages, payload_kwargs)
+        if key is not None:
+            self.cache.delete(key)
+
+    def count_tokens(self, messages) -> int:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        from litellm import token_counter
 
-        log.debug("calling llm...")
-        log.debug(f"{'/' * 30}\n\n{messages}\n\n{'*' * 30}")
-        if self.wait:
-            log.debug(f"sleeping for {self.wait} secs")
-            sleep(self.wait)
         try:
-            resp = completion(self.model_name, messages, **payload_kwargs)
-        except APIConnectionError as e:
-            log.exception(e)
-            raise
-        except Exception as e:
-            log.exception(e)
-            raise
+            return token_counter(model=self.model_name, messages=messages)
+        except Exception:
+            # rough estimate of ~4 chars per token for models unknown to litellm
+            return sum(len(str(msg.get("content") or "")) for msg in messages) // 4
+
+    def _count_tokens(self, messages) -> int:
+        return self.count_tokens(messages) if self.rate_limiter.max_tpm else 0
+
+    def get_context_window_size(self) -> Optional[int]:
+        """context length set for the provider in `creds.yaml`, if any"""
+        try:
+            return int(self.creds["CONTEXT_LENGTH"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _record_usage(self, usage):
+        # providers report prompt tokens served from their cache differently
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or getattr(usage, "cache_read_input_tokens", None) or 0
+        self.usage["requests"] += 1
+        self.usage["prompt_tokens"] += getattr(usage, "prompt_tokens", None) or 0
+        self.usage["completion_tokens"] += getattr(usage, "completion_tokens", None) or 0
+        self.usage["cached_tokens"] += cached_tokens
+        telemetry.add("llm_calls")
+        telemetry.add("prompt_tokens", getattr(usage, "prompt_tokens", None) or 0)
+        telemetry.add("completion_tokens", getattr(usage, "completion_tokens", None) or 0)
+        telemetry.add("cached_tokens", cached_tokens)
+        if cached_tokens:
+            log.debug(f"{cached_tokens} prompt tokens were served from the provider's cache")
 
+    def _parse_response(self, resp):
         llm_resp = resp.choices[0].message.content
         log.debug(f"Usage: {resp.usage.model_dump_json()}")
+        self._record_usage(resp.usage)
 
         log.debug(f"{'+' * 30}\n\n{llm_resp}\n\n{'-' * 30}\n\n")
         return llm_resp
+
+    def _on_rate_limited(self, error, n_retries: int):
+        """
+        pause every request to the provider (across all LLMs & crews sharing its rate limiter) for as long as it asks
+        to, backing off exponentially if it doesn't say. Re-raises the error once out of retries.
+        """
+        backoff_s = get_retry_after(error, default=self.rate_limit_backoff_s * 2**n_retries)
+        self.rate_limiter.pause(backoff_s)
+        if n_retries >= self.max_rate_limit_retries:
+            log.debug(f'giving up on "{self.provider}" after {n_retries} retries of rate limited requests')
+            raise error
+        log.warning(f'rate limited by "{self.provider}". Retrying in {backoff_s:.1f} secs')
+        telemetry.add("retries")
+
+    def _complete(self, messages, payload_kwargs):
+        """a single request to the provider, falling back to plain JSON mode if structured output isn't supported"""
+        from litellm import BadRequestError, UnsupportedParamsError, completion
+
+        start = monotonic()
+        try:
+            try:
+                return completion(self.model_name, messages, **payload_kwargs)
+            except (BadRequestError, UnsupportedParamsError) as e:
+                if not self._is_structured(payload_kwargs) or not is_unsupported_schema_error(e):
+                    raise
+                telemetry.add("retries")
+                payload_kwargs = self._disable_structured_output(payload_kwargs, e)
+                return completion(self.model_name, messages, **payload_kwargs)
+        finally:
+            telemetry.add_llm_latency(monotonic() - start)
+
+    async def _acomplete(self, messages, payload_kwargs):
+        from litellm import BadRequestError, UnsupportedParamsError, acompletion
+
+        start = monotonic()
+        try:
+            try:
+                return await acompletion(self.model_name, messages, **payload_kwargs)
+            except (BadRequestError, UnsupportedParamsError) as e:
+                if not self._is_structured(payload_kwargs) or not is_unsupported_schema_error(e):
+                    raise
+                telemetry.add("retries")
+                payload_kwargs = self._disable_structured_output(payload_kwargs, e)
+                return await acompletion(self.model_name, messages, **payload_kwargs)
+        finally:
+            telemetry.add_llm_latency(monotonic() - start)
+
+    def __call__(self, messages, **payload_kwargs):
+        messages, payload_kwargs = self._prepare_request(messages, payload_kwargs)
+        key = self._cache_key(messages, payload_kwargs)
+        if key is not None and (cached_resp := self.cache.get(key)) is not None:
+            telemetry.add("llm_cache_hits")
+            return cached_resp
+
+        from litellm import RateLimitError
+
+        log.debug("calling llm...")
+        log.debug(f"{'/' * 30}\n\n{messages}\n\n{'*' * 30}")
+        tokens, n_retries = self._count_tokens(messages), 0
+        while True:
+            with telemetry.stage("rate_limit_wait"):
+                self.rate_limiter.acquire(tokens)
+            try:
+                resp = self._complete(messages, payload_kwargs)
+                break
+            except RateLimitError as e:
+                self._on_rate_limited(e, n_retries)
+                n_retries += 1
+            except Exception as e:
+                log.exception(e)
+                raise
+
+        llm_resp = self._parse_response(resp)
+        if key is not None and llm_resp is not None:
+            self.cache.set(key, llm_resp, self.model_name)
+        return llm_resp
+
+    async def acall(self, messages, **payload_kwargs):
+        """async counterpart of `__call__` so that multiple requests can be in flight at once"""
+        messages, payload_kwargs = self._prepare_request(messages, payload_kwargs)
+        key = self._cache_key(messages, payload_kwargs)
+        if key is not None and (cached_resp := self.cache.get(key)) is not None:
+            telemetry.add("llm_cache_hits")
+            return cached_resp
+
+        from litellm import RateLimitError
+
+        log.debug("calling llm...")
+        log.debug(f"{'/' * 30}\n\n{messages}\n\n{'*' * 30}")
+        tokens, n_retries = self._count_tokens(messages), 0
+        while True:
+            with telemetry.stage("rate_limit_wait"):
+                await self.rate_limiter.aacquire(tokens)
+            try:
+                resp = await self._acomplete(messages, payload_kwargs)
+                break
+            except RateLimitError as e:
+                self._on_rate_limited(e, n_retries)
+                n_retries += 1
+            except Exception as e:
+                log.exception(e)
+                raise
+
+        llm_resp = self._parse_response(resp)
+        if key is not None and llm_resp is not None:
+            self.cache.set(key, llm_resp, self.model_name)
+        return llm_resp
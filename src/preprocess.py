@@ -0,0 +1,135 @@
+"""
+Reduce the scraped HTML down to what's needed to extract job listings before it's sent to an LLM.
+Scripts, styles, SVGs & all attributes but the `href` of anchors are dropped, leaving one line of text
+per block element with job links kept as minimal `<a href="...">...</a>` tags.
+
+Content that's still too large for the model's context window can be split into chunks on line boundaries.
+"""
+
+from html import escape
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from src.config import log
+
+# tags whose content is of no use in finding job listings
+SKIPPED_TAGS = {"script", "style", "svg", "noscript", "template", "iframe", "head", "select", "canvas", "video"}
+# tags that start a new line of text
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "details", "div", "dl", "dt", "fieldset", "figure",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "section",
+    "summary", "table", "tbody", "thead", "tfoot", "tr", "ul",
+}  # fmt: skip
+# tags that separate pieces of text on the same line (e.g. title & location of a job)
+CELL_TAGS = {"td", "th", "span", "label", "small", "time"}
+SEPARATOR = " | "
+
+
+class _HTMLReducer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = []
+        self._line: List[str] = []
+        self._skip_depth = 0
+        self._anchor_href: Optional[str] = None
+        self._anchor_text: Optional[List[str]] = None
+
+    @property
+    def _buffer(self) -> List[str]:
+        return self._anchor_text if self._anchor_text is not None else self._line
+
+    def _separate(self):
+        if self._buffer and self._buffer[-1] != SEPARATOR:
+            self._buffer.append(SEPARATOR)
+
+    def _flush_line(self):
+        # blocks nested inside an anchor (e.g. title & location of a job) stay on the same line
+        if self._anchor_text is not None:
+            self._separate()
+            return
+        line = " ".join(self._line).replace(f" {SEPARATOR} ", SEPARATOR).strip(SEPARATOR + " ")
+        if line:
+            self.lines.append(line)
+        self._line = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href and not href.startswith(("#", "javascript:", "mailto:")):
+                self._anchor_href, self._anchor_text = href, []
+        elif tag in BLOCK_TAGS:
+            self._flush_line()
+        elif tag in CELL_TAGS:
+            self._separate()
+
+    def handle_startendtag(self, tag, attrs):
+        # self-closing tags (e.g. `<svg ... />`, `<br/>`) never contain anything to skip
+        if tag not in SKIPPED_TAGS:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+            return
+        if self._skip_depth:
+            return
+        if tag == "a" and self._anchor_text is not None:
+            text = " ".join(self._anchor_text).replace(f" {SEPARATOR} ", SEPARATOR).strip(SEPARATOR + " ")
+            self._line.append(f'<a href="{escape(self._anchor_href)}">{text}</a>')
+            self._anchor_href, self._anchor_text = None, None
+        elif tag in BLOCK_TAGS:
+            self._flush_line()
+        elif tag in CELL_TAGS:
+            self._separate()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        text = " ".join(data.split())
+        if text:
+            self._buffer.append(text)
+
+    def close(self):
+        super().close()
+        if self._anchor_text is not None:
+            self.handle_endtag("a")
+        self._flush_line()
+
+
+def reduce_html(content: Optional[str]) -> Optional[str]:
+    """return a compact representation of `content` keeping only its text & job links"""
+    if not content:
+        return content
+    parser = _HTMLReducer()
+    parser.feed(content)
+    parser.close()
+    reduced = "\n".join(parser.lines)
+    log.debug(f"reduced HTML content from {len(content)} to {len(reduced)} chars")
+    return reduced
+
+
+def split_into_chunks(content: str, max_chars: int) -> List[str]:
+    """
+    split `content` into chunks of at most `max_chars` on line boundaries so that listing entries aren't cut in half.
+    Only lines that are longer than `max_chars` on their own are split mid-line.
+    """
+    if len(content) <= max_chars:
+        return [content]
+
+    chunks, chunk, chunk_len = [], [], 0
+    for line in content.splitlines():
+        pieces = [line[i : i + max_chars] for i in range(0, len(line), max_chars)] or [line]
+        for piece in pieces:
+            if chunk and chunk_len + len(piece) + 1 > max_chars:
+                chunks.append("\n".join(chunk))
+                chunk, chunk_len = [], 0
+            chunk.append(piece)
+            chunk_len += len(piece) + 1
+    if chunk:
+        chunks.append("\n".join(chunk))
+    return chunks
@@ -1,142 +1,769 @@
 import asyncio
 import json
 from ast import literal_eval
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Union
+
 import click
 from pydantic import ValidationError
 
+from src.cache import ResponseCache
 from src.config import JOB_TOPIC, log
+from src.extractors import extract_jobs
+from src.journal import EXTRACTED, FAILED, SCRAPED, RunJournal
 from src.llms import CustomLLM
+from src.preprocess import reduce_html, split_into_chunks
+from src.relevance import TopicScorer
+from src.router import ProviderRouter
+from src.scrape.scrape import load_manifest, scrape_orgs
+from src.scrape.store import crawl_store
+from src.telemetry import telemetry
 from src.utils import (
     JobsModel,
     OrgsModel,
+    RelevantJobsModel,
+    TaggedJobModel,
+    TaggedJobsModel,
     clean_resp,
     fix_job_listings,
+    is_unchanged,
+    load_jobs_info,
+    load_listings,
+    load_unchanged_jobs,
+    merge_job_lists,
     prepare_inputs,
     store_final_jobs_report,
     store_jobs_info,
+    store_listings,
 )
+from src.work_queue import EXTRACT, SCRAPE, WorkQueue, worker_id
 
 
 class ProgrammaticJobSearch:
     def __init__(
         self,
-        topic=JOB_TOPIC,
+        topic: Union[str, List[str]] = JOB_TOPIC,
         scrape: bool = True,
         provider: str = "OPENROUTER",
         temperature: float = 0.3,
-        wait_between_requests_seconds: float = 15,
+        max_rpm: Optional[float] = 20,
+        max_tpm: Optional[float] = None,
+        use_cache: bool = True,
+        incremental: bool = True,
+        stream: bool = False,
+        preprocess: bool = True,
+        max_chunk_tokens: Optional[int] = None,
+        use_extractors: bool = True,
+        classify_batch_size: int = 200,
+        structured_output: bool = True,
+        max_repairs: int = 2,
+        hedge: bool = False,
+        prompt_caching: bool = True,
+        resume: Optional[str] = None,
+        relevance_threshold: Optional[float] = None,
+        queue: Optional[str] = None,
         **payload_kwargs: Dict[str, Any],
     ):
         self.topic = topic
         self.scrape = scrape
+        self.incremental = incremental
         self.provider = provider
         self.temperature = temperature
+        self.preprocess = preprocess
+        self.max_chunk_tokens = max_chunk_tokens
+        self.use_extractors = use_extractors
+        self.classify_batch_size = classify_batch_size
+        self.max_repairs = max_repairs
+        self.relevance_threshold = relevance_threshold
         self.payload_kwargs = payload_kwargs
 
-        self.llm = CustomLLM(self.provider, self.temperature, wait_between_requests_seconds)
-        self.inputs = asyncio.run(prepare_inputs(self.scrape))
+        # unchanged career pages hit the cache & cost no LLM calls
+        cache = ResponseCache() if use_cache else None
+        # several comma separated providers are used at once, routing each request to the best of them
+        providers = [provider.strip() for provider in self.provider.split(",") if provider.strip()]
+        if len(providers) > 1:
+            self.llm = ProviderRouter(
+                providers,
+                self.temperature,
+                max_rpm,
+                max_tpm,
+                cache,
+                structured_output,
+                hedge=hedge,
+                prompt_caching=prompt_caching,
+            )
+        else:
+            self.llm = CustomLLM(
+                self.provider,
+                self.temperature,
+                max_rpm,
+                max_tpm,
+                cache,
+                structured_output,
+                prompt_caching=prompt_caching,
+            )
+        # workers of a work queue extract the orgs leased off it for the topic(s) it was created with
+        self.queue = WorkQueue(queue) if queue is not None else None
+        if self.queue is not None:
+            self.topic = self.queue.topic
+        # the status of every org is journaled as it changes, so that a run that died half way can be resumed
+        if resume:
+            self.journal = RunJournal.load(resume, self.topic)
+        else:
+            run_id = f"{queue}-{worker_id()}" if queue is not None else None
+            self.journal = RunJournal(run_id, topic=self.topic)
+        self.topic = self.journal.topic
+        log.info(f"run id: {self.journal.run_id}")
+        # several topics are extracted in a single pass, tagging each job with the topics it's related to
+        self.topics = [self.topic] if isinstance(self.topic, str) else list(self.topic)
+        self._jobs_model = JobsModel if len(self.topics) == 1 else TaggedJobsModel
+        # orgs whose listings score below `relevance_threshold` against the topics are skipped without an LLM call
+        self.scorer = TopicScorer(" or ".join(self.topics)) if relevance_threshold is not None else None
+        self.inputs, self.unchanged_results = [], []
+        # streamed runs scrape & extract orgs on the go (see `astream_job_info_from_all_orgs`) & queue workers extract
+        # the orgs they lease off the queue (see `aprocess_queue`)
+        if not stream and self.queue is None:
+            # resumed runs don't scrape again once they're done with it
+            scrape = self.scrape and not self.journal.scrape_done
+            self.inputs = asyncio.run(prepare_inputs(scrape, incremental=incremental, topic=self.topic))
+            self.journal.mark_scraped([inp["org"] for inp in self.inputs])
+            completed_orgs = set(self.journal.completed_orgs())
+            self.inputs = [inp for inp in self.inputs if inp["org"] not in completed_orgs]
+            # jobs of orgs whose content didn't change since their last extraction are reused as they are
+            self.unchanged_results = load_unchanged_jobs(self.topic) if incremental else []
         # the message is split so that we can reuse this common message when we're not satisfied with LLM's response
-        self._common_msg = " ".join(
-            f"""
+        if len(self.topics) == 1:
+            self._common_msg = " ".join(
+                f"""
                 Your output should be strictly adhering to the following JSON Format:
                 {{ "jobs": Optional[List[{{ "title": str, "href": str, "location": Optional, "workplaceType": Optional}}] ] }}
 
                 The `href` should contain URL of that respective job title ONLY, which is embedded in the same job listing entry.
                 Do NOT make up any information that is NOT present in the user provided text nor mix up the URLs.
                 Set an empty list as a value for `jobs` if there are no jobs in the blob of text related to "{self.topic}".
-        """.split()
-        )
+            """.split()
+            )
+            topics_msg = f'topics: "{self.topic}"'
+        else:
+            self._common_msg = " ".join(
+                """
+                Your output should be strictly adhering to the following JSON Format:
+                { "jobs": Optional[List[{ "title": str, "href": str, "location": Optional, "workplaceType": Optional, "topics": List[int]}] ] }
+
+                The `href` should contain URL of that respective job title ONLY, which is embedded in the same job listing entry.
+                The `topics` should contain the numbers of ALL the topics that job is related to.
+                Do NOT make up any information that is NOT present in the user provided text nor mix up the URLs.
+                Set an empty list as a value for `jobs` if there are no jobs in the blob of text related to any of the topics.
+            """.split()
+            )
+            topics_msg = "any of the following numbered topics: " + "; ".join(
+                f'{idx}. "{topic}"' for idx, topic in enumerate(self.topics, 1)
+            )
         self._system_msg = {
             "role": "system",
             "content": " ".join(
                 f"""
                 You're a specialized bot excelled in web technologies (esp. HTML & CSS) and information retrieval from job postings.
                 You only speak in JSON. The user will simply paste a blob of HTML text containing job listings and your goal is to
-                extract all relevant information limited ONLY to topics: "{self.topic}" EXCLUSIVELY FROM THAT BLOB OF TEXT.
+                extract all relevant information limited ONLY to {topics_msg} EXCLUSIVELY FROM THAT BLOB OF TEXT.
 
                 {self._common_msg}
            """.split()
             ),
         }
+        # used to fix invalid responses without sending the content they were extracted from again
+        self._repair_msg = " ".join(
+            """
+                You're a specialized bot that fixes invalid JSON responses. You only speak in JSON.
+                The user will paste an invalid response along with the reason why it's invalid and your goal is to
+                return it in the correct format WITHOUT adding, removing or changing any of its information.
+        """.split()
+        )
+        # used to extract all the jobs of an org regardless of the topic, to be classified later in batches
+        self._listings_common_msg = " ".join(
+            """
+                Your output should be strictly adhering to the following JSON Format:
+                { "jobs": Optional[List[{ "title": str, "href": str, "location": Optional, "workplaceType": Optional}] ] }
+
+                The `href` should contain URL of that respective job title ONLY, which is embedded in the same job listing entry.
+                Do NOT make up any information that is NOT present in the user provided text nor mix up the URLs.
+                Set an empty list as a value for `jobs` if there are no jobs in the blob of text.
+        """.split()
+        )
+        self._listings_system_msg = {
+            "role": "system",
+            "content": " ".join(
+                f"""
+                You're a specialized bot excelled in web technologies (esp. HTML & CSS) and information retrieval from job postings.
+                You only speak in JSON. The user will simply paste a blob of HTML text containing job listings and your goal is to
+                extract ALL the job listings EXCLUSIVELY FROM THAT BLOB OF TEXT.
+
+                {self._listings_common_msg}
+           """.split()
+            ),
+        }
+        # used to filter the jobs read off known job boards (see `src/extractors.py`) without an LLM, per topic
+        self._classify_common_msgs, self._classify_system_msgs = {}, {}
+        for topic in self.topics:
+            self._classify_common_msgs[topic] = " ".join(
+                f"""
+                Your output should be strictly adhering to the following JSON Format: {{ "relevant": List[int] }}
+                Set an empty list as a value for `relevant` if none of the job titles are related to "{topic}".
+            """.split()
+            )
+            self._classify_system_msgs[topic] = {
+                "role": "system",
+                "content": " ".join(
+                    f"""
+                You're a specialized bot excelled in classifying job postings by their titles. You only speak in JSON.
+                The user will paste a numbered list of job titles and your goal is to return the numbers of ALL the titles
+                related to topics: "{topic}".
+
+                {self._classify_common_msgs[topic]}
+               """.split()
+                ),
+            }
+
+    def log_usage(self):
+        """log the tokens used in this run & how many of the prompt tokens were served from the provider's cache"""
+        usage = self.llm.usage
+        cached_share = usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0
+        log.info(
+            f"{usage['requests']} LLM requests used {usage['prompt_tokens']} prompt tokens "
+            f"({usage['cached_tokens']} or {cached_share:.0%} cached) & {usage['completion_tokens']} completion tokens"
+        )
 
-    def _call_llm(self, messages):
-        orig_msg = messages
-        INVALID_RESPONSE = True
+    def _validate_response(self, resp, response_model):
+        """return the parsed response if it's valid or the reason why it isn't"""
         model, msg = None, ""
-        while INVALID_RESPONSE:
-            resp = self.llm(messages, **self.payload_kwargs)
-            try:
-                resp = clean_resp(resp)
-                model = json.loads(resp)
-                _ = JobsModel(**model)
-                INVALID_RESPONSE = False
-            except ValidationError as e:
-                msg = f"Failed to load response as JSON. {e}"
-                log.exception(msg)
-            except Exception as e:
-                msg = f"Invalid response. Error {e}"
-                log.exception(e)
-
-            if INVALID_RESPONSE:
-                messages = orig_msg
-                messages.extend(
-                    [
-                        {"role": "assistant", "content": resp},
-                        {"role": "user", "content": f"{msg}\n\n{self._common_msg}"},
-                    ]
-                )
+        try:
+            resp = clean_resp(resp)
+            model = json.loads(resp)
+            _ = response_model(**model)
+        except ValidationError as e:
+            model, msg = None, f"Failed to load response as JSON. {e}"
+            log.exception(msg)
+        except Exception as e:
+            model, msg = None, f"Invalid response. Error {e}"
+            log.exception(e)
+        return resp, model, msg
+
+    def _build_repair_messages(self, resp, msg, common_msg):
+        # only the invalid response is sent back, not the whole content it was extracted from
+        return [
+            {"role": "system", "content": f"{self._repair_msg} {common_msg}"},
+            {"role": "user", "content": f"Invalid response:\n{resp}\n\nError: {msg}"},
+        ]
+
+    def _on_invalid_response(self, messages, payload_kwargs, n_repairs, msg):
+        telemetry.add("validation_failures")
+        # don't let the invalid response be replayed from the cache on the next run
+        self.llm.uncache(messages, **payload_kwargs)
+        if n_repairs >= self.max_repairs:
+            raise ValueError(f"Response still invalid after {n_repairs} attempts to repair it. {msg}")
+
+    def _call_llm(self, messages, response_model=None, common_msg=None):
+        response_model, common_msg = response_model or self._jobs_model, common_msg or self._common_msg
+        payload_kwargs = {"response_model": response_model, **self.payload_kwargs}
+        resp = self.llm(messages, **payload_kwargs)
+        resp, model, msg = self._validate_response(resp, response_model)
+        n_repairs = 0
+        while model is None:
+            self._on_invalid_response(messages, payload_kwargs, n_repairs, msg)
+            n_repairs += 1
+            # repaired responses are only cached once they're valid, under the original request
+            repair_messages = self._build_repair_messages(resp, msg, common_msg)
+            resp = self.llm(repair_messages, use_cache=False, **payload_kwargs)
+            resp, model, msg = self._validate_response(resp, response_model)
+            if model is not None:
+                self.llm.recache(messages, resp, **payload_kwargs)
+        return model
+
+    async def _acall_llm(self, messages, response_model=None, common_msg=None):
+        response_model, common_msg = response_model or self._jobs_model, common_msg or self._common_msg
+        payload_kwargs = {"response_model": response_model, **self.payload_kwargs}
+        resp = await self.llm.acall(messages, **payload_kwargs)
+        resp, model, msg = self._validate_response(resp, response_model)
+        n_repairs = 0
+        while model is None:
+            self._on_invalid_response(messages, payload_kwargs, n_repairs, msg)
+            n_repairs += 1
+            # repaired responses are only cached once they're valid, under the original request
+            repair_messages = self._build_repair_messages(resp, msg, common_msg)
+            resp = await self.llm.acall(repair_messages, use_cache=False, **payload_kwargs)
+            resp, model, msg = self._validate_response(resp, response_model)
+            if model is not None:
+                self.llm.recache(messages, resp, **payload_kwargs)
         return model
 
+    @staticmethod
+    def _read_content(inp):
+        # streamed inputs come along with their content, the rest is read off the crawl store only when needed
+        if "content" in inp:
+            return inp["content"]
+        return crawl_store.read(inp["org"], inp.get("content_hash"))
+
+    def _prepare_content(self, content):
+        # strip the markup the LLM doesn't need to cut down on prompt tokens
+        with telemetry.stage("preprocess"):
+            return reduce_html(content) if self.preprocess else content
+
+    def _relevance(self, text) -> Optional[float]:
+        """score of the listing entry in `text` most related to the topic or `None` if there's no prefilter"""
+        if self.scorer is None:
+            return None
+        with telemetry.stage("prefilter"):
+            # words are weighed by how common they are across the listings of the orgs scored so far, so that no
+            # content has to be read up front
+            return round(self.scorer.partial_fit(text).score(text), 4)
+
+    def _is_irrelevant(self, url, relevance) -> bool:
+        if relevance is None or relevance >= self.relevance_threshold:
+            return False
+        log.debug(f"content of '{url}' scored {relevance} against the topic. Skipping it without an LLM.")
+        return True
+
+    def _chunk_token_budget(self) -> Optional[int]:
+        if self.max_chunk_tokens:
+            return self.max_chunk_tokens
+        context_length = self.llm.get_context_window_size()
+        if context_length is None:
+            return None
+        # leave half of what remains after the system prompt for the response
+        return (context_length - self.llm.count_tokens([self._system_msg])) // 2
+
+    def _build_messages(self, content, system_msg=None):
+        """
+        split the content into chunks that fit into the model's context window & return the messages for each of them.
+        Large career pages are thus extracted chunk by chunk and their results merged.
+        """
+        chunks = [content]
+        budget = self._chunk_token_budget()
+        if budget is not None and budget > 0:
+            n_tokens = self.llm.count_tokens(content)
+            if n_tokens > budget:
+                max_chars = max(int(len(content) * budget / n_tokens), 1)
+                chunks = split_into_chunks(content, max_chars)
+                log.debug(f"content of {n_tokens} tokens split into {len(chunks)} chunks of <= {budget} tokens")
+        # We call the LLM without giving `org` & `url` to avoid hallucinations
+        # We add them back once the results are fetched.
+        system_msg = system_msg or self._system_msg
+        return [[system_msg, {"role": "user", "content": chunk}] for chunk in chunks]
+
+    def _build_classify_messages(self, titles, topic):
+        titles = "\n".join(f"{idx}. {title}" for idx, title in enumerate(titles))
+        return [self._classify_system_msgs[topic], {"role": "user", "content": titles}]
+
+    @staticmethod
+    def _relevant_titles(titles, model):
+        # the numbers are read off the validated model, which coerces the likes of "3" or 3.0 to ints
+        numbers = RelevantJobsModel.model_validate(model).relevant
+        if unknown := [idx for idx in numbers if not 0 <= idx < len(titles)]:
+            log.warning(f"ignoring the numbers of {len(unknown)} titles that weren't classified: {unknown}")
+        return {titles[idx] for idx in numbers if 0 <= idx < len(titles)}
+
+    def _select_relevant(self, jobs, relevant):
+        """
+        keep only the jobs whose titles are `relevant` to (any of) the topics. With several topics, the jobs are
+        tagged with the names of the topics they're related to
+        """
+        if len(self.topics) == 1:
+            return [job for job in jobs if job["title"] in relevant[self.topic]]
+        jobs = [{**job, "topics": [topic for topic in self.topics if job["title"] in relevant[topic]]} for job in jobs]
+        return [job for job in jobs if len(job["topics"])]
+
+    def _tag_topics(self, jobs):
+        """replace the topic numbers of the jobs extracted for several topics by their names"""
+        if len(self.topics) == 1:
+            return jobs
+        for job in jobs:
+            numbers = set(TaggedJobModel.model_validate(job).topics)
+            if unknown := sorted(idx for idx in numbers if not 1 <= idx <= len(self.topics)):
+                log.warning(f"ignoring the unknown topic numbers {unknown} of job: {job['title']}")
+            job["topics"] = [topic for idx, topic in enumerate(self.topics, 1) if idx in numbers]
+        return [job for job in jobs if len(job["topics"])]
+
+    def _filter_by_topic(self, jobs):
+        """keep only the jobs whose titles are related to the topic(s)"""
+        if not jobs:
+            return jobs
+        titles, relevant = [job["title"] for job in jobs], {}
+        for topic in self.topics:
+            messages = self._build_classify_messages(titles, topic)
+            model = self._call_llm(messages, RelevantJobsModel, self._classify_common_msgs[topic])
+            relevant[topic] = self._relevant_titles(titles, model)
+        return self._select_relevant(jobs, relevant)
+
+    async def _aclassify_titles(self, titles, semaphore):
+        """
+        return the titles related to each topic, classifying `classify_batch_size` of them per LLM call.
+        Titles are classified against one topic at a time
+        """
+        titles = sorted(set(titles))
+        batches = [titles[i : i + self.classify_batch_size] for i in range(0, len(titles), self.classify_batch_size)]
+
+        async def classify(batch, topic):
+            async with semaphore:
+                model = await self._acall_llm(
+                    self._build_classify_messages(batch, topic), RelevantJobsModel, self._classify_common_msgs[topic]
+                )
+            return topic, self._relevant_titles(batch, model)
+
+        log.info(f"classifying {len(titles)} unique job titles in {len(batches)} batches per topic")
+        relevant = {topic: set() for topic in self.topics}
+        tasks = [classify(batch, topic) for topic in self.topics for batch in batches]
+        for topic, batch_relevant in await asyncio.gather(*tasks):
+            relevant[topic] |= batch_relevant
+        return relevant
+
+    async def _afilter_by_topic(self, jobs, semaphore):
+        if not jobs:
+            return jobs
+        relevant = await self._aclassify_titles([job["title"] for job in jobs], semaphore)
+        return self._select_relevant(jobs, relevant)
+
+    def _extract_known_jobs(self, url, content):
+        """jobs read off a known job board without an LLM, or `None` if it has to be extracted by an LLM"""
+        if not self.use_extractors:
+            return None
+        jobs = extract_jobs(url, content)
+        if jobs is not None:
+            log.debug(f"extracted {len(jobs)} jobs from '{url}' without an LLM")
+        return jobs
+
+    def _extract_jobs(self, url, content):
+        jobs = self._extract_known_jobs(url, content)
+        if jobs is not None:
+            relevance = self._relevance("\n".join(job["title"] for job in jobs))
+            if self._is_irrelevant(url, relevance):
+                return {"jobs": [], "relevance": relevance}
+            return {"jobs": self._filter_by_topic(jobs), "relevance": relevance}
+        content = self._prepare_content(content)
+        relevance = self._relevance(content if self.preprocess else reduce_html(content))
+        if self._is_irrelevant(url, relevance):
+            return {"jobs": [], "relevance": relevance}
+        models = [self._call_llm(messages) for messages in self._build_messages(content)]
+        return {"jobs": self._tag_topics(merge_job_lists(models)["jobs"]), "relevance": relevance}
+
+    async def _aextract_jobs(self, url, content, semaphore):
+        jobs = self._extract_known_jobs(url, content)
+        if jobs is not None:
+            relevance = self._relevance("\n".join(job["title"] for job in jobs))
+            if self._is_irrelevant(url, relevance):
+                return {"jobs": [], "relevance": relevance}
+            return {"jobs": await self._afilter_by_topic(jobs, semaphore), "relevance": relevance}
+
+        async def extract_chunk(messages):
+            async with semaphore:
+                return await self._acall_llm(messages)
+
+        content = self._prepare_content(content)
+        relevance = self._relevance(content if self.preprocess else reduce_html(content))
+        if self._is_irrelevant(url, relevance):
+            return {"jobs": [], "relevance": relevance}
+        models = await asyncio.gather(*(extract_chunk(messages) for messages in self._build_messages(content)))
+        return {"jobs": self._tag_topics(merge_job_lists(models)["jobs"]), "relevance": relevance}
+
+    def _store_org_jobs(self, model_dict):
+        with telemetry.stage("store"):
+            model_dump = OrgsModel(**fix_job_listings(model_dict)).model_dump()
+            store_jobs_info(model_dump, self.topic)
+        telemetry.set("jobs_found", len(model_dump["jobs"]))
+        self.journal.mark(model_dump["org"], EXTRACTED)
+        return model_dump
+
     def get_job_info_from_all_orgs(self):
         results = []
         for inp in self.inputs:
-            scrape_fp = inp["file_path"]
-            with open(scrape_fp) as fl:
-                html_content = json.load(fl)["content"]
+            with telemetry.org(inp["org"]):
+                html_content = self._read_content(inp)
 
+                model_dict = {
+                    "org": inp["org"],
+                    "url": inp["url"],
+                }
+                if html_content is not None:
+                    try:
+                        model_dict.update(**self._extract_jobs(inp["url"], html_content))
+                    except Exception as e:
+                        log.exception(f"Error fetching job info for org:{inp['org']}. Skipping it...")
+                        self.journal.mark(inp["org"], FAILED, reason=str(e))
+                        continue
+                else:
+                    log.warning(f"no HTML content found for org: {inp['org']}")
+                    model_dict.update({"jobs": []})
+
+                results.append(self._store_org_jobs(model_dict))
+
+        store_final_jobs_report(self.journal.report(results + self.unchanged_results), self.topic)
+
+    async def aget_job_info_from_all_orgs(self, max_concurrence: int = 5):
+        """
+        same as `get_job_info_from_all_orgs` but with up to `max_concurrence` orgs being extracted at once.
+        The overall pace is still bound by the `max_rpm` / `max_tpm` of the LLM's rate limiter.
+        """
+        semaphore = asyncio.Semaphore(max_concurrence)
+        results = await asyncio.gather(*(self._aprocess_org(inp, semaphore) for inp in self.inputs))
+        results = [res for res in results if res is not None]
+        store_final_jobs_report(self.journal.report(results + self.unchanged_results), self.topic)
+
+    async def _aprocess_org(self, inp, semaphore):
+        """extract, validate & store the jobs of a single org. Returns `None` if that fails"""
+        with telemetry.org(inp["org"]):
+            html_content = self._read_content(inp)
             model_dict = {
                 "org": inp["org"],
                 "url": inp["url"],
             }
             if html_content is not None:
-                messages = [self._system_msg, {"role": "user", "content": html_content}]
-                # We call the LLM without giving `org` & `url` to avoid hallucinations
-                # We add them back once the results are fetched.
                 try:
-                    model_dict.update(**self._call_llm(messages))
+                    model_dict.update(**await self._aextract_jobs(inp["url"], html_content, semaphore))
                 except Exception as e:
                     log.exception(f"Error fetching job info for org:{inp['org']}. Skipping it...")
-                    continue
+                    self.journal.mark(inp["org"], FAILED, reason=str(e))
+                    return None
             else:
                 log.warning(f"no HTML content found for org: {inp['org']}")
                 model_dict.update({"jobs": []})
 
-            model_dump = OrgsModel(**fix_job_listings(model_dict)).model_dump()
-            store_jobs_info(model_dump)
-            results.append(model_dump)
+            return self._store_org_jobs(model_dict)
+
+    async def astream_job_info_from_all_orgs(self, max_concurrence: int = 5, scrape_concurrence: int = 5):
+        """
+        scrape & extract orgs as a stream: each org flows through a queue to the extraction workers
+        as soon as it's scraped instead of waiting for every org to be scraped first.
+        Up to `scrape_concurrence` pages are scraped & `max_concurrence` orgs extracted at once.
+        """
+        queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(max_concurrence)
+        results = []
+        completed_orgs = set(self.journal.completed_orgs())
+
+        async def produce():
+            try:
+                if self.scrape and not self.journal.scrape_done:
+                    await scrape_orgs(scrape_concurrence, queue=queue)
+                else:
+                    for inp in await prepare_inputs(scrape=False, topic=self.topic):
+                        queue.put_nowait(inp)
+                self.journal.mark_scraped([])
+            finally:
+                # let the workers know that there's nothing more to come
+                for _ in range(max_concurrence):
+                    queue.put_nowait(None)
+
+        async def extract_worker():
+            while (inp := await queue.get()) is not None:
+                if inp["org"] in completed_orgs:
+                    continue
+                if "content" in inp and inp["content"] is None:
+                    # failed scrapes keep the jobs extracted from the org's previous content, as in the other modes
+                    log.warning(f"no HTML content found for org: {inp['org']}. Keeping its previous jobs.")
+                    self.journal.mark(inp["org"], FAILED, reason="couldn't be scraped")
+                    continue
+                self.journal.mark(inp["org"], SCRAPED)
+                if self.incremental and is_unchanged(load_manifest().get(inp["org"], {}), inp["org"], self.topic):
+                    log.debug(f"content of org: {inp['org']} unchanged since its last extraction. Reusing its jobs.")
+                    results.append(load_jobs_info(inp["org"]))
+                elif (res := await self._aprocess_org(inp, semaphore)) is not None:
+                    results.append(res)
+
+        await asyncio.gather(produce(), *(extract_worker() for _ in range(max_concurrence)))
+        store_final_jobs_report(self.journal.report(results), self.topic)
+
+    async def aprocess_queue(self, max_concurrence: int = 5, poll_s: float = 5):
+        """
+        extract the orgs leased off the work queue, along with the other workers of the queue, until no org is left
+        to be scraped or extracted. Each org's jobs are stored as usual, the final report is assembled by the reducer
+        (see `src/distributed.py`)
+        """
+        semaphore = asyncio.Semaphore(max_concurrence)
+
+        async def worker():
+            while True:
+                items = self.queue.lease(EXTRACT)
+                if not len(items):
+                    # orgs that are still being scraped are queued for extraction once they're scraped
+                    if self.queue.is_drained(SCRAPE, EXTRACT):
+                        return
+                    await asyncio.sleep(poll_s)
+                    continue
+                item = items[0]
+                if self.incremental and is_unchanged(load_manifest().get(item["org"], {}), item["org"], self.topic):
+                    log.debug(f"content of org: {item['org']} unchanged since its last extraction. Reusing its jobs.")
+                    self.queue.complete(item["id"])
+                elif await self._aprocess_org(item, semaphore) is not None:
+                    self.queue.complete(item["id"])
+                else:
+                    self.queue.fail(item["id"], reason=self.journal.failed_orgs().get(item["org"]))
+
+        await asyncio.gather(*(worker() for _ in range(max_concurrence)))
+        log.info(f"no orgs left to extract in work queue '{self.queue.name}': {self.queue.counts()}")
+
+    async def _aextract_listings(self, inp, semaphore):
+        """extract all the jobs listed by an org regardless of the topic & store them"""
+        with telemetry.org(inp["org"]):
+            html_content = self._read_content(inp)
+            model_dict = {
+                "org": inp["org"],
+                "url": inp["url"],
+                "jobs": [],
+            }
+            if html_content is None:
+                log.warning(f"no HTML content found for org: {inp['org']}")
+            elif (jobs := self._extract_known_jobs(inp["url"], html_content)) is not None:
+                model_dict["jobs"] = jobs
+            else:
+
+                async def extract_chunk(messages):
+                    async with semaphore:
+                        return await self._acall_llm(messages, JobsModel, self._listings_common_msg)
+
+                content = self._prepare_content(html_content)
+                messages_list = self._build_messages(content, self._listings_system_msg)
+                try:
+                    models = await asyncio.gather(*(extract_chunk(messages) for messages in messages_list))
+                except Exception as e:
+                    log.exception(f"Error fetching job listings for org:{inp['org']}. Skipping it...")
+                    self.journal.mark(inp["org"], FAILED, reason=str(e))
+                    return None
+                model_dict.update(**merge_job_lists(models))
 
-        store_final_jobs_report(results)
+            with telemetry.stage("store"):
+                model_dump = OrgsModel(**fix_job_listings(model_dict)).model_dump()
+                store_listings(model_dump)
+            return model_dump
+
+    async def aget_job_info_in_two_stages(self, max_concurrence: int = 5, refilter: bool = False):
+        """
+        first extract all the jobs listed by every org regardless of the topic & then classify their titles
+        against the topic in batches across all orgs. This takes O(titles / classify_batch_size) LLM calls
+        to filter by topic instead of one per org.
+        If `refilter`, the listings stored by a previous run are classified again (e.g. for a new topic) without
+        extracting them again.
+        """
+        semaphore = asyncio.Semaphore(max_concurrence)
+        if refilter:
+            listings, unchanged_results = load_listings(), []
+        else:
+            listings = await asyncio.gather(*(self._aextract_listings(inp, semaphore) for inp in self.inputs))
+            listings, unchanged_results = [lst for lst in listings if lst is not None], self.unchanged_results
+
+        relevant = await self._aclassify_titles([job["title"] for lst in listings for job in lst["jobs"]], semaphore)
+        results = []
+        for listing in listings:
+            model_dump = {**listing, "jobs": self._select_relevant(listing["jobs"], relevant)}
+            with telemetry.stage("store", org=listing["org"]):
+                store_jobs_info(model_dump, self.topic)
+            telemetry.set("jobs_found", len(model_dump["jobs"]), org=listing["org"])
+            self.journal.mark(listing["org"], EXTRACTED)
+            results.append(model_dump)
+        store_final_jobs_report(self.journal.report(results + unchanged_results), self.topic)
 
 
 @click.command(context_settings=dict(show_default=True))
-@click.option("--topic", default=JOB_TOPIC, help="the topic to filter the scraped job listings with")
+@click.option(
+    "--topic",
+    default=[JOB_TOPIC],
+    multiple=True,
+    help="the topic to filter the scraped job listings with. Repeat it to extract several topics in a single pass",
+)
 @click.option("--scrape/--no-scrape", default=True, help="scrape org pages")
-@click.option("--provider", default="OPENROUTER", help="LLM Provider. Add creds in '.env' file")
+@click.option(
+    "--provider",
+    default="OPENROUTER",
+    help="LLM Provider(s). Add creds in 'creds.yaml'. Pass several comma separated ones to route requests across them",
+)
+@click.option(
+    "--hedge/--no-hedge",
+    default=False,
+    help="with several providers, duplicate async requests to another one when they take longer than usual",
+)
 @click.option("--temperature", default=0.1, help="model temperature (0-sticks to instructions, 1-highly creative)")
+@click.option("--max-rpm", default=20, help="Max LLM calls to make per minute. Pass `-1` to remove any limits")
+@click.option("--max-tpm", default=-1, help="Max tokens to send to the LLM per minute. Pass `-1` to remove any limits")
+@click.option("--async-run/--no-async-run", default=False, help="extract job info from multiple orgs concurrently")
+@click.option("--max-concurrence", default=5, help="max LLM calls in flight at once when run in async mode")
+@click.option("--cache/--no-cache", default=True, help="reuse cached LLM responses for unchanged content")
+@click.option(
+    "--incremental/--no-incremental", default=True, help="reuse previous job reports of orgs with unchanged content"
+)
+@click.option(
+    "--preprocess/--no-preprocess", default=True, help="strip scraped HTML down to text & job links before prompting"
+)
+@click.option(
+    "--max-chunk-tokens",
+    default=-1,
+    help="split content larger than this into chunks. Pass `-1` to derive it from the provider's context length",
+)
+@click.option(
+    "--use-extractors/--no-use-extractors",
+    default=True,
+    help="read jobs off known job boards (Ashby, Greenhouse, Lever) without an LLM & only classify their titles",
+)
+@click.option(
+    "--two-stages/--no-two-stages",
+    default=False,
+    help="extract all jobs of every org first & then filter them by topic in batches of job titles",
+)
+@click.option("--classify-batch-size", default=200, help="no. of job titles to classify per LLM call")
+@click.option(
+    "--refilter/--no-refilter",
+    default=False,
+    help="filter the job listings extracted by a previous two-stage run by topic again, without extracting them",
+)
+@click.option(
+    "--stream/--no-stream",
+    default=False,
+    help="extract each org as soon as it's scraped instead of scraping all orgs first",
+)
+@click.option("--scrape-concurrence", default=5, help="max pages to scrape at once when streaming")
+@click.option(
+    "--structured-output/--no-structured-output",
+    default=True,
+    help="constrain LLM responses to the expected JSON schema where the provider supports it",
+)
+@click.option(
+    "--prompt-caching/--no-prompt-caching",
+    default=True,
+    help="let providers cache the shared system prompt (cache control hints, ollama `keep_alive`)",
+)
+@click.option(
+    "--relevance-threshold",
+    default=-1.0,
+    help="skip orgs whose listings score below this (e.g. 0.15) against the topic without an LLM call. `-1` disables it",
+)
+@click.option("--max-repairs", default=2, help="max attempts to repair an invalid LLM response before giving up")
+@click.option("--resume", default=None, help="run ID of a run that died half way, to continue without redoing its orgs")
 @click.option(
-    "--wait-between-requests-seconds",
-    default=0.1,
-    help="no. of seconds to wait between two successive calls to LLM. Pass `-1` to set it to None",
+    "--queue",
+    default=None,
+    help="name of a work queue (see `enqueue_orgs`) to extract orgs from, along with other workers, until it's drained",
 )
 @click.option("--payload-kwargs", default=dict(), help="other kwargs to be passed to the requests payload")
-def run(topic, scrape, provider, temperature, wait_between_requests_seconds, payload_kwargs):
+def run(async_run, max_concurrence, two_stages, refilter, scrape_concurrence, payload_kwargs, **kwargs):
+    if (two_stages or refilter) and (kwargs["stream"] or kwargs["queue"] is not None):
+        # orgs are extracted one by one when streamed or leased off a queue, while titles are classified across orgs
+        raise click.UsageError("--two-stages / --refilter can't be combined with --stream or --queue")
     payload_kwargs = literal_eval(payload_kwargs)
-    wait_between_requests_seconds = (
-        None if wait_between_requests_seconds == float("-1") else float(wait_between_requests_seconds)
-    )
-    ps = ProgrammaticJobSearch(topic, scrape, provider, temperature, wait_between_requests_seconds, **payload_kwargs)
-    ps.get_job_info_from_all_orgs()
+    kwargs["max_rpm"] = None if float(kwargs["max_rpm"]) == -1 else float(kwargs["max_rpm"])
+    kwargs["max_tpm"] = None if float(kwargs["max_tpm"]) == -1 else float(kwargs["max_tpm"])
+    kwargs["use_cache"] = kwargs.pop("cache")
+    kwargs["topic"] = kwargs["topic"][0] if len(kwargs["topic"]) == 1 else list(kwargs["topic"])
+    relevance_threshold = float(kwargs["relevance_threshold"])
+    kwargs["relevance_threshold"] = None if relevance_threshold == -1 else relevance_threshold
+    kwargs["max_chunk_tokens"] = None if int(kwargs["max_chunk_tokens"]) == -1 else int(kwargs["max_chunk_tokens"])
+    ps = ProgrammaticJobSearch(**kwargs, **payload_kwargs)
+    if kwargs["queue"] is not None:
+        asyncio.run(ps.aprocess_queue(int(max_concurrence)))
+    elif kwargs["stream"]:
+        asyncio.run(ps.astream_job_info_from_all_orgs(int(max_concurrence), int(scrape_concurrence)))
+    elif two_stages or refilter:
+        asyncio.run(ps.aget_job_info_in_two_stages(int(max_concurrence) if async_run else 1, refilter))
+    elif async_run:
+        asyncio.run(ps.aget_job_info_from_all_orgs(int(max_concurrence)))
+    else:
+        ps.get_job_info_from_all_orgs()
+    ps.log_usage()
 
 
 if __name__ == "__main__":
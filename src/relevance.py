@@ -0,0 +1,109 @@
+"""
+Cheap, CPU-only relevance prefilter of career pages for a topic.
+
+Every line of a page's reduced content (i.e. every listing entry, see `src/preprocess.py`) & every alternative of the
+topic (e.g. "Data Science", "Machine/Deep Learning", "NLP/LLMs"...) is turned into a TF-IDF vector of its hashed
+character trigrams, so that "Data Scientist" matches "Data Science" & "LLM Engineer" matches "LLMs".
+A page scores the best cosine similarity of any of its lines with any alternative of the topic. Orgs scoring below a
+threshold have no listings related to the topic & are skipped without asking an LLM.
+"""
+
+import re
+import threading
+from typing import Iterable, List, Optional
+from zlib import crc32
+
+import numpy as np
+
+from src.config import log
+
+N_FEATURES = 2**12
+NGRAM = 3
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# words that join the alternatives of a topic rather than being part of them
+TOPIC_SEPARATORS = re.compile(r"\s*(?:\bor\b|\band\b|,|;|\|)\s*", re.IGNORECASE)
+
+
+def split_topic(topic: str) -> List[str]:
+    """the alternatives of a topic, e.g. "Data Science or Machine/Deep Learning" -> Data Science, Machine Deep Learning"""
+    return [" ".join(part.replace("/", " ").split()) for part in TOPIC_SEPARATORS.split(topic) if part.strip()]
+
+
+def _ngrams(text: str) -> List[str]:
+    # trigrams within padded words, so that they don't span across words
+    ngrams = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        word = f" {word} "
+        ngrams.extend(word[i : i + NGRAM] for i in range(max(len(word) - NGRAM + 1, 1)))
+    return ngrams
+
+
+def _feature_ids(text: str) -> np.ndarray:
+    return np.fromiter((crc32(ngram.encode()) % N_FEATURES for ngram in _ngrams(text)), dtype=np.int64)
+
+
+def _listing_lines(content: str) -> List[str]:
+    lines = (" ".join(TAG_PATTERN.sub(" ", line).split()) for line in content.splitlines())
+    return [line for line in lines if line]
+
+
+class TopicScorer:
+    """score texts against the `topic` with hashed character trigram TF-IDF & cosine similarity"""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.phrases = split_topic(topic)
+        self.idf = np.ones(N_FEATURES, dtype=np.float32)
+        self._topic_vectors = self._vectorize(self.phrases)
+        self._doc_freq, self._n_docs = np.zeros(N_FEATURES, dtype=np.float32), 0
+        self._lock = threading.Lock()
+
+    def fit(self, contents: Iterable[Optional[str]]) -> "TopicScorer":
+        """
+        weigh the trigrams by their inverse document frequency across the lines of all `contents`, so that the
+        ones common to most listings (e.g. of "Engineer" & "Manager") count for less
+        """
+        with self._lock:
+            self._doc_freq, self._n_docs = np.zeros(N_FEATURES, dtype=np.float32), 0
+            for content in contents:
+                self._count(content)
+            self._update_idf()
+        log.debug(f"fitted the relevance prefilter on {self._n_docs} listing lines")
+        return self
+
+    def partial_fit(self, content: Optional[str]) -> "TopicScorer":
+        """add the lines of `content` to the ones the trigrams are weighed by, e.g. as each org is extracted"""
+        with self._lock:
+            self._count(content)
+            self._update_idf()
+        return self
+
+    def _count(self, content: Optional[str]):
+        for line in _listing_lines(content or ""):
+            self._doc_freq[np.unique(_feature_ids(line))] += 1
+            self._n_docs += 1
+
+    def _update_idf(self):
+        self.idf = (np.log((1 + self._n_docs) / (1 + self._doc_freq)) + 1).astype(np.float32)
+        self._topic_vectors = self._vectorize(self.phrases)
+
+    def _vectorize(self, texts: List[str]) -> np.ndarray:
+        """l2 normalized TF-IDF vectors of `texts`, one per row"""
+        vectors = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+        for row, text in enumerate(texts):
+            np.add.at(vectors[row], _feature_ids(text), 1)
+        vectors *= self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def score_lines(self, lines: List[str]) -> np.ndarray:
+        """the best similarity of each line with any alternative of the topic"""
+        if not len(lines) or not len(self.phrases):
+            return np.zeros(len(lines), dtype=np.float32)
+        return (self._vectorize(lines) @ self._topic_vectors.T).max(axis=1)
+
+    def score(self, content: Optional[str]) -> float:
+        """the relevance of a page's reduced `content`: the score of its most relevant listing entry"""
+        lines = _listing_lines(content or "")
+        return float(self.score_lines(lines).max()) if len(lines) else 0.0
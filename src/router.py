@@ -0,0 +1,215 @@
+"""
+Route LLM requests across several providers from `creds.yaml` at once.
+
+Every request goes to the provider with the best rolling latency, error rate & rate limit headroom, failing over
+to the next best one on rate limits & transient errors. Optionally, async requests that take longer than the
+primary provider's p95 latency are hedged with a duplicate request to the next best provider.
+"""
+
+import asyncio
+from collections import deque
+from time import monotonic
+from typing import Dict, List, Optional
+
+from src.config import log
+from src.llms import CustomLLM, get_retry_after
+from src.telemetry import telemetry
+
+
+def retriable_errors() -> tuple:
+    """errors worth retrying with another provider. litellm is only imported once a request fails"""
+    from litellm import APIConnectionError, InternalServerError, RateLimitError, ServiceUnavailableError, Timeout
+
+    return (RateLimitError, APIConnectionError, Timeout, ServiceUnavailableError, InternalServerError)
+
+
+class ProviderStats:
+    """rolling latency & error rate of the last `window` requests sent to a provider"""
+
+    def __init__(self, window: int = 50):
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.throttled_until = 0.0
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.errors.append(False)
+
+    def record_error(self, backoff_s: Optional[float] = None):
+        self.errors.append(True)
+        if backoff_s:
+            self.throttled_until = max(self.throttled_until, monotonic() + backoff_s)
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors) / len(self.errors) if len(self.errors) else 0.0
+
+    @property
+    def is_throttled(self) -> bool:
+        return monotonic() < self.throttled_until
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not len(self.latencies):
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+class ProviderRouter:
+    """Drop-in replacement for `CustomLLM` that spreads requests across several providers"""
+
+    def __init__(
+        self,
+        providers: List[str],
+        temperature: float = 0.1,
+        max_rpm: Optional[float] = None,
+        max_tpm: Optional[float] = None,
+        cache=None,
+        structured_output: bool = False,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        prompt_caching: bool = True,
+    ):
+        self.providers = providers
+        self.llms: Dict[str, CustomLLM] = {
+            # rate limited requests fail over to another provider right away instead of waiting for this one
+            provider: CustomLLM(
+                provider,
+                temperature,
+                max_rpm,
+                max_tpm,
+                cache,
+                structured_output,
+                prompt_caching=prompt_caching,
+                max_rate_limit_retries=0,
+            )
+            for provider in providers
+        }
+        self.stats = {provider: ProviderStats() for provider in providers}
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+
+    @property
+    def primary(self) -> CustomLLM:
+        return self.llms[self.providers[0]]
+
+    @property
+    def model_name(self) -> str:
+        return self.primary.model_name
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        """token usage summed across all providers"""
+        usage = {}
+        for llm in self.llms.values():
+            for k, v in llm.usage.items():
+                usage[k] = usage.get(k, 0) + v
+        return usage
+
+    def count_tokens(self, messages) -> int:
+        return self.primary.count_tokens(messages)
+
+    def get_context_window_size(self) -> Optional[int]:
+        """the smallest context window of all providers, so that the content fits into whichever gets picked"""
+        sizes = [size for llm in self.llms.values() if (size := llm.get_context_window_size()) is not None]
+        return min(sizes) if sizes else None
+
+    def get_cached(self, messages, **payload_kwargs) -> Optional[str]:
+        for llm in self.llms.values():
+            if (cached_resp := llm.get_cached(messages, **payload_kwargs)) is not None:
+                return cached_resp
+        return None
+
+    def uncache(self, messages, **payload_kwargs):
+        for llm in self.llms.values():
+            llm.uncache(messages, **payload_kwargs)
+
+    def recache(self, messages, response, **payload_kwargs):
+        for llm in self.llms.values():
+            llm.recache(messages, response, **payload_kwargs)
+
+    def _score(self, provider: str, tokens: int) -> float:
+        """expected seconds until a response: typical latency plus any rate limiting wait, penalized by errors"""
+        stats = self.stats[provider]
+        # providers without any requests yet get tried first
+        latency = stats.percentile(0.5) or 0.0
+        wait = self.llms[provider].rate_limiter.expected_wait(tokens)
+        return (latency + wait) * (1 + 5 * stats.error_rate)
+
+    def _ranked_providers(self, messages) -> List[str]:
+        tokens = self.count_tokens(messages) if any(llm.rate_limiter.max_tpm for llm in self.llms.values()) else 0
+        available = [provider for provider in self.providers if not self.stats[provider].is_throttled]
+        if not len(available):
+            # every provider is throttled, so go with the ones that recover first
+            return sorted(self.providers, key=lambda provider: self.stats[provider].throttled_until)
+        return sorted(available, key=lambda provider: self._score(provider, tokens))
+
+    def _on_error(self, provider: str, error: Exception):
+        from litellm import RateLimitError
+
+        backoff_s = get_retry_after(error) if isinstance(error, RateLimitError) else None
+        self.stats[provider].record_error(backoff_s)
+        telemetry.add("retries")
+        log.warning(f'request to "{provider}" failed. Failing over to the next provider. Error: {error}')
+
+    def __call__(self, messages, **payload_kwargs):
+        if (cached_resp := self.get_cached(messages, **payload_kwargs)) is not None:
+            return cached_resp
+
+        last_error = None
+        for provider in self._ranked_providers(messages):
+            start = monotonic()
+            try:
+                resp = self.llms[provider](messages, **payload_kwargs)
+            except retriable_errors() as e:
+                self._on_error(provider, e)
+                last_error = e
+                continue
+            self.stats[provider].record_success(monotonic() - start)
+            return resp
+        raise last_error
+
+    async def _attempt(self, provider: str, messages, payload_kwargs):
+        start = monotonic()
+        try:
+            resp = await self.llms[provider].acall(messages, **payload_kwargs)
+        except retriable_errors() as e:
+            self._on_error(provider, e)
+            raise
+        self.stats[provider].record_success(monotonic() - start)
+        return resp
+
+    async def acall(self, messages, **payload_kwargs):
+        if (cached_resp := self.get_cached(messages, **payload_kwargs)) is not None:
+            return cached_resp
+
+        ranked = iter(self._ranked_providers(messages))
+        primary = next(ranked)
+        pending = {asyncio.create_task(self._attempt(primary, messages, payload_kwargs))}
+        # only requests taking longer than usual are hedged, & only once
+        deadline = self.stats[primary].percentile(self.hedge_quantile) if self.hedge else None
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    deadline = None
+                    if (backup := next(ranked, None)) is not None:
+                        log.debug(f'"{primary}" is slower than usual. Hedging the request with "{backup}"')
+                        pending.add(asyncio.create_task(self._attempt(backup, messages, payload_kwargs)))
+                    continue
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if not isinstance(task.exception(), retriable_errors()):
+                        raise task.exception()
+                    last_error = task.exception()
+
+                # fail over to the next provider once every request in flight failed
+                if not pending and (backup := next(ranked, None)) is not None:
+                    pending.add(asyncio.create_task(self._attempt(backup, messages, payload_kwargs)))
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
@@ -0,0 +1,95 @@
+"""
+Fetch career pages with a plain (pooled, keep-alive, HTTP/2) HTTP client, which is enough for server-rendered pages
+& a lot cheaper than rendering them in a headless browser. Pages whose listings are rendered with JS yield nothing
+for the org's `selector` & have to be scraped with playwright instead. Fetches are scheduled per host & retried on
+transient failures by a `HostScheduler` (see `src/scrape/scheduler.py`).
+"""
+
+from typing import Optional
+
+import httpx
+from bs4 import BeautifulSoup
+
+from src.config import log
+from src.scrape.scheduler import HostScheduler, TransientError, parse_retry_after
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+# statuses of overloaded or temporarily unavailable servers, worth retrying after a while
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def select_content(html: str, selector: str) -> Optional[str]:
+    """the inner HTML of all elements matching the CSS `selector`, one per line, like the playwright scraper"""
+    entries = BeautifulSoup(html, "html.parser").select(selector)
+    if not len(entries):
+        return None
+    return "\n".join(entry.decode_contents() for entry in entries)
+
+
+class HttpFetcher:
+    def __init__(self, max_concurrence: int = 5, timeout_s: float = 15, scheduler: Optional[HostScheduler] = None):
+        self.scheduler = scheduler or HostScheduler(max_concurrence)
+        self.client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            headers=HEADERS,
+            timeout=timeout_s,
+            limits=httpx.Limits(max_connections=max_concurrence, max_keepalive_connections=max_concurrence),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def fetch(self, url: str, selector: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """
+        return the content matching `selector` along with the page's cache validators
+        or `None` if the page has to be rendered in a browser. `not_modified` is set if the server confirms
+        that the page didn't change since it was fetched with the given `etag` / `last_modified`.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        async def attempt():
+            try:
+                resp = await self.client.get(url, headers=headers)
+            except httpx.TransportError as e:
+                raise TransientError(f"{type(e).__name__}: {e}") from e
+            if resp.status_code in RETRY_STATUSES:
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                overloaded = resp.status_code == 429 or resp.status_code >= 500
+                raise TransientError(f"status {resp.status_code}", retry_after, overloaded)
+            return resp
+
+        try:
+            resp = await self.scheduler.run(url, attempt)
+        except (TransientError, httpx.HTTPError) as e:
+            log.debug(f"couldn't fetch '{url}' over HTTP. Exception: {e}")
+            return None
+
+        result = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+        if resp.status_code == 304:
+            return {**result, "content": None, "not_modified": True}
+        if resp.status_code != 200:
+            log.debug(f"fetching '{url}' over HTTP returned status {resp.status_code}")
+            return None
+
+        content = select_content(resp.text, selector)
+        if content is None:
+            log.debug(f"selector found nothing in the static HTML of '{url}'")
+            return None
+        return {**result, "content": content, "not_modified": False}
@@ -0,0 +1,157 @@
+"""
+Polite & adaptive scheduling of page fetches.
+
+- no more than `per_host` fetches hit the same host at once, so that the orgs hosted on the same job board
+  (e.g. jobs.ashbyhq.com) don't hammer it while other hosts sit idle. A host's own cap is halved whenever its
+  fetches fail transiently or it responds much slower than it used to, & grows back as it responds fast again.
+- the no. of fetches in flight overall adapts with AIMD: it grows by one per window of fast successful fetches up to
+  `max_concurrence` & is halved only when servers say they're overloaded (429s & 5xx), not for one slow host.
+- transient failures (timeouts, connection errors, 429s & 5xx) are retried with exponential backoff & jitter (or after
+  the `Retry-After` of the response), pausing the host in the meantime.
+"""
+
+import asyncio
+import random
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from time import monotonic, time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from src.config import log
+
+T = TypeVar("T")
+
+
+class TransientError(Exception):
+    """
+    a failure worth retrying after `retry_after` seconds (or the scheduler's backoff if it's `None`). `overloaded`
+    failures (429s & 5xx) also slow down the fetches from every other host
+    """
+
+    def __init__(self, msg: str, retry_after: Optional[float] = None, overloaded: bool = False):
+        super().__init__(msg)
+        self.retry_after = retry_after
+        self.overloaded = overloaded
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """seconds to wait as per a `Retry-After` header, given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostScheduler:
+    def __init__(
+        self,
+        max_concurrence: int = 5,
+        per_host: int = 2,
+        min_concurrence: int = 1,
+        retries: int = 2,
+        backoff_s: float = 2.0,
+        slow_factor: float = 3.0,
+    ):
+        self.max_concurrence = max(max_concurrence, min_concurrence)
+        self.min_concurrence = min_concurrence
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.slow_factor = slow_factor
+        self.limit = float(self.max_concurrence)
+        self._host_limit: Dict[str, float] = defaultdict(lambda: float(self.per_host))
+        self._in_flight = 0
+        self._host_in_flight: Dict[str, int] = defaultdict(int)
+        self._paused_until: Dict[str, float] = {}
+        # exponentially weighted moving average of each host's latency
+        self._host_latency: Dict[str, float] = {}
+        self._last_decrease: Dict[Optional[str], float] = defaultdict(float)
+        self._cond = asyncio.Condition()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def _ready(self, host: str) -> bool:
+        return self._in_flight < int(self.limit) and self._host_in_flight[host] < int(self._host_limit[host])
+
+    async def _acquire(self, host: str):
+        async with self._cond:
+            while True:
+                wait = self._paused_until.get(host, 0) - monotonic()
+                if wait <= 0 and self._ready(host):
+                    break
+                try:
+                    # paused hosts are woken up once their pause is over, the rest whenever a fetch is done
+                    await asyncio.wait_for(self._cond.wait(), wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self._in_flight += 1
+            self._host_in_flight[host] += 1
+
+    async def _release(self, host: str, latency_s: float, outcome: Optional[bool], overloaded: bool = False):
+        """`outcome` is `True` for a success, `False` for a transient failure & `None` for anything else"""
+        async with self._cond:
+            self._in_flight -= 1
+            self._host_in_flight[host] -= 1
+            if outcome is False:
+                self._decrease(host, f"a transient failure fetching from {host}")
+                if overloaded:
+                    self._decrease(None, f"{host} being overloaded")
+            elif outcome:
+                self._adapt(host, latency_s)
+            self._cond.notify_all()
+
+    def _adapt(self, host: str, latency_s: float):
+        baseline = self._host_latency.get(host)
+        self._host_latency[host] = latency_s if baseline is None else 0.8 * baseline + 0.2 * latency_s
+        if baseline is not None and latency_s > self.slow_factor * baseline:
+            self._decrease(host, f"{host} responding in {latency_s:.1f}s instead of ~{baseline:.1f}s")
+            return
+        # additive increase of one fetch per window of `limit` fetches
+        self.limit = min(float(self.max_concurrence), self.limit + 1 / self.limit)
+        self._host_limit[host] = min(float(self.per_host), self._host_limit[host] + 1 / self._host_limit[host])
+
+    def _decrease(self, host: Optional[str], reason: str):
+        """halve the cap of `host` or the global one if it's `None`"""
+        # fetches that were in flight together tell about the same congestion, so it's only acted upon once
+        cooldown_s = self._host_latency.get(host) if host is not None else max(self._host_latency.values(), default=0)
+        if monotonic() - self._last_decrease[host] < (cooldown_s or 1.0):
+            return
+        self._last_decrease[host] = monotonic()
+        if host is None:
+            self.limit = max(float(self.min_concurrence), self.limit / 2)
+            log.debug(f"scraping at most {int(self.limit)} pages at once due to {reason}")
+        else:
+            self._host_limit[host] = max(1.0, self._host_limit[host] / 2)
+            log.debug(f"scraping at most {int(self._host_limit[host])} pages at once from {host} due to {reason}")
+
+    async def run(self, url: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """
+        run `attempt` (e.g. fetching `url`) once there's room for another fetch from its host, retrying it while
+        it raises `TransientError`. The last `TransientError` is raised once `retries` are exhausted
+        """
+        host = self.host(url)
+        for n_retries in range(self.retries + 1):
+            await self._acquire(host)
+            start, outcome, overloaded = monotonic(), None, False
+            try:
+                result = await attempt()
+                outcome = True
+                return result
+            except TransientError as e:
+                outcome, overloaded = False, e.overloaded
+                if n_retries == self.retries:
+                    raise
+                delay = e.retry_after or self.backoff_s * 2**n_retries * (1 + random.random())
+                log.debug(f"retrying '{url}' in {delay:.1f}s: {e}")
+                self._paused_until[host] = max(self._paused_until.get(host, 0), monotonic() + delay)
+            finally:
+                await self._release(host, monotonic() - start, outcome, overloaded)
@@ -5,14 +5,19 @@ that agents will later access to filter for jobs you like.
 
 import asyncio
 import json
+import os
 from pathlib import Path
+from time import monotonic, time
 
 import click
 import yaml
-from playwright.async_api import TimeoutError as playWrightTimeoutError
-from playwright.async_api import async_playwright
 
-from src.config import SCRAPE_DOWNLOAD_PATH, SCRAPE_ORGS_PATH, log
+from src.cache import hash_text
+from src.config import SCRAPE_MANIFEST_PATH, SCRAPE_ORGS_PATH, log
+from src.scrape.scheduler import HostScheduler, TransientError
+from src.scrape.store import crawl_store, file_lock
+from src.telemetry import telemetry
+from src.work_queue import EXTRACT, SCRAPE, WorkQueue
 
 
 def get_orgs_info(orgs_yml_filepath=SCRAPE_ORGS_PATH):
@@ -31,63 +36,373 @@ def get_orgs_info(orgs_yml_filepath=SCRAPE_ORGS_PATH):
     return orgs
 
 
-async def scrape_orgs(max_concurrence=5, timeout_s=15):
+def load_manifest():
+    """
+    per org info about the scraped content: its hash, when it was last fetched & last changed
+    and the hash of the content from which jobs were last successfully extracted.
+    """
+    if not SCRAPE_MANIFEST_PATH.exists():
+        return {}
+    with open(SCRAPE_MANIFEST_PATH) as fl:
+        return json.load(fl)
+
+
+def save_manifest(manifest):
+    SCRAPE_MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = SCRAPE_MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w") as fl:
+        json.dump(manifest, fl, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, SCRAPE_MANIFEST_PATH)
+
+
+# manifest fields owned by the scraper, the rest are recorded when the jobs of an org are extracted
+SCRAPE_MANIFEST_FIELDS = ("content_hash", "last_fetched", "last_changed", "fetch_tier")
+
+
+def merge_manifest(entries, tracked_orgs=None):
+    """
+    merge the scraped info of `entries` into the manifest on disk, keeping the extraction info that may have been
+    recorded in the meantime (e.g. when orgs are extracted while others are still being scraped).
+    """
+    with file_lock(SCRAPE_MANIFEST_PATH):
+        manifest = load_manifest()
+        for org, entry in entries.items():
+            manifest.setdefault(org, {}).update({k: v for k, v in entry.items() if k in SCRAPE_MANIFEST_FIELDS})
+        if tracked_orgs is not None:
+            manifest = {org: entry for org, entry in manifest.items() if org in tracked_orgs}
+        save_manifest(manifest)
+
+
+def update_manifest_entry(manifest, org, content):
+    """record the freshly scraped content of `org` & return whether it changed since the previous scrape"""
+    now = time()
+    content_hash = hash_text(content)
+    entry = manifest.setdefault(org, {})
+    changed = entry.get("content_hash") != content_hash
+    if changed:
+        entry.update({"content_hash": content_hash, "last_changed": now})
+    entry["last_fetched"] = now
+    return changed
+
+
+# resources that are of no use in reading the listings off a page but take the bulk of its load time
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "hotjar.com",
+    "segment.com",
+    "segment.io",
+    "intercom.io",
+    "hs-scripts.com",
+    "hs-analytics.net",
+    "linkedin.com/px",
+    "cookielaw.org",
+)
+
+
+async def _block_non_essential(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(domain in request.url for domain in BLOCKED_DOMAINS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class SelectorNotFound(Exception):
+    """a page that loaded without any element matching its org's selector, which isn't worth retrying"""
+
+
+class PagePool:
+    """
+    A fixed set of pages spread across `n_contexts` browser contexts that are reused across orgs
+    instead of opening (& closing) a new page for every org. Its size bounds the no. of concurrent scrapes.
+    """
+
+    def __init__(self, browser, size: int = 5, n_contexts: int = 1, block_resources: bool = True):
+        self.browser = browser
+        self.size = size
+        self.n_contexts = max(1, min(n_contexts, size))
+        self.block_resources = block_resources
+        self.contexts = []
+        self._pages = asyncio.Queue()
+        self._page_context = {}
+
+    async def open(self):
+        for _ in range(self.n_contexts):
+            context = await self.browser.new_context()
+            if self.block_resources:
+                await context.route("**/*", _block_non_essential)
+            self.contexts.append(context)
+        for idx in range(self.size):
+            await self._add_page(self.contexts[idx % self.n_contexts])
+        return self
+
+    async def _add_page(self, context):
+        page = await context.new_page()
+        self._page_context[page] = context
+        self._pages.put_nowait(page)
+
+    async def acquire(self):
+        return await self._pages.get()
+
+    async def release(self, page):
+        if page.is_closed():
+            # replace pages that crashed or got closed by the site
+            context = self._page_context.pop(page)
+            await self._add_page(context)
+        else:
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        for context in self.contexts:
+            await context.close()
+
+
+async def _fetch_over_http(fetcher, manifest, *, org, url, selector):
+    """
+    return the org's content along with the cache validators of its page if it could be fetched without a browser,
+    `None` otherwise
+    """
+    entry = manifest.get("_".join(org.lower().split()), {})
+    # orgs whose listings are rendered with JS are sent straight to the browser
+    if selector is None or entry.get("fetch_tier") == "browser":
+        return None
+
+    # the previous content is only read off the crawl store once the server confirms it's still current
+    etag, last_modified = crawl_store.validators(org)
+    with telemetry.stage("scrape", org="_".join(org.lower().split())):
+        result = await fetcher.fetch(url, selector, etag, last_modified)
+    if result is None:
+        return None
+
+    if result["not_modified"]:
+        content = crawl_store.read(org)
+        if content is not None:
+            log.debug(f'"{org}" not modified since the last fetch')
+            etag, last_modified = result["etag"] or etag, result["last_modified"] or last_modified
+            return {"content": content, "etag": etag, "last_modified": last_modified}
+        # the previous content went missing from the store, so the page is fetched again in full
+        with telemetry.stage("scrape", org="_".join(org.lower().split())):
+            result = await fetcher.fetch(url, selector)
+        if result is None or result["not_modified"]:
+            return None
+    return {"content": result["content"], "etag": result["etag"], "last_modified": result["last_modified"]}
+
+
+async def scrape_orgs(
+    max_concurrence=5,
+    timeout_s=15,
+    block_resources=True,
+    n_contexts=1,
+    http_first=True,
+    queue=None,
+    orgs=None,
+    per_host_concurrence=2,
+    retries=2,
+):
+    """
+    scrape all orgs (or only the given `orgs`) & store their content in the crawl store (see `src/scrape/store.py`).
+    If a `queue` is given, each org's input (see `prepare_inputs`) along with its content is put into it
+    as soon as it's scraped so that it can be processed further while other orgs are still being scraped.
+    At most `max_concurrence` pages are scraped at once (fewer while sites struggle), `per_host_concurrence` of them
+    from the same host, & pages that fail transiently are retried up to `retries` times.
+    """
     log.info("scraping organizations' data...")
 
-    orgs = get_orgs_info()
-    semaphore = asyncio.Semaphore(max_concurrence)
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
-        unscraped_orgs = []
-
-        async def scrape(*, org, url, selector):
-            log.debug(f'scraping org: "{org}"')
-            async with semaphore:
-                page = await context.new_page()
-                try:
-                    content = None
-                    await page.goto(url)
-                    if selector is not None:
-                        await page.wait_for_selector(selector, timeout=timeout_s * 1000)
-                        entries = await page.query_selector_all(selector)
-                        if len(entries):
-                            content = " ".join([await entry.inner_html() for entry in entries])
-                    else:
-                        content = await page.content()
-                except playWrightTimeoutError:
-                    msg = f"Timeout trying to wait for selector. Couldn't scrape org: '{org}'"
-                    log.exception(msg)
-                    unscraped_orgs.append(org)
-                except Exception as e:
-                    msg = f"Couldn't scrape '{url}'. Exception: {e}"
-                    log.exception(msg)
-                    unscraped_orgs.append(org)
-                finally:
-                    await page.close()
-
-                json_content = {"org": "_".join(org.lower().split()), "url": url, "content": content}
-                with open(f"{SCRAPE_DOWNLOAD_PATH}/{org}.json", "w") as fp:
-                    json.dump(json_content, fp, ensure_ascii=False)
-
-        tasks = [scrape(**entry) for entry in orgs]
-        await asyncio.gather(*tasks)
-
-        if len(unscraped_orgs):
-            log.warning(f"couldn't scrape for the followings orgs: {unscraped_orgs}")
-
-        await context.close()
-        await browser.close()
+    all_orgs = orgs is None
+    orgs = get_orgs_info() if all_orgs else orgs
+    manifest = load_manifest()
+    # forget about orgs that aren't tracked anymore
+    org_names = {"_".join(entry["org"].lower().split()) for entry in orgs}
+    manifest = {org: entry for org, entry in manifest.items() if org in org_names}
+    unscraped_orgs = []
+    # shared by both tiers, so that the browser starts off with what was learned about the hosts over HTTP
+    scheduler = HostScheduler(max_concurrence, per_host_concurrence, retries=retries)
+
+    def store(*, org, url, content, fetch_tier, etag=None, last_modified=None):
+        json_content = {"org": "_".join(org.lower().split()), "url": url, "content": content}
+        crawl_store.put(org, url, content, etag, last_modified)
+
+        # failed scrapes keep the previous manifest entry so that the org isn't considered as changed
+        if content is not None:
+            telemetry.add("bytes_fetched", len(content.encode("utf-8")), org=json_content["org"])
+            if not update_manifest_entry(manifest, json_content["org"], content):
+                log.debug(f'content of org: "{org}" unchanged since the last scrape')
+            manifest[json_content["org"]]["fetch_tier"] = fetch_tier
+
+        if queue is not None:
+            # the manifest has to be up to date before the org's jobs are extracted
+            if content is not None:
+                merge_manifest({json_content["org"]: manifest[json_content["org"]]})
+            queue.put_nowait(json_content)
+
+    # the browser is only started once the first org needs it (see `open_pool`)
+    browser_state, browser_lock = {}, asyncio.Lock()
+    fetcher, n_http_orgs = None, 0
+    if http_first:
+        for entry in orgs:
+            manifest.setdefault("_".join(entry["org"].lower().split()), {})
+        # the HTTP client & the browser are imported only when they're used, as they're slow to import
+        from src.scrape.fetch import HttpFetcher
+
+        fetcher = HttpFetcher(max_concurrence, timeout_s, scheduler)
+
+    async def open_pool():
+        async with browser_lock:
+            if "pool" not in browser_state:
+                from playwright.async_api import async_playwright
+
+                browser_state["playwright"] = await async_playwright().start()
+                browser_state["browser"] = await browser_state["playwright"].chromium.launch(headless=True)
+                pool = PagePool(browser_state["browser"], max_concurrence, n_contexts, block_resources)
+                browser_state["pool"] = await pool.open()
+        return browser_state["pool"]
+
+    async def close_browser():
+        if "pool" in browser_state:
+            await browser_state["pool"].close()
+            await browser_state["browser"].close()
+            await browser_state["playwright"].stop()
+
+    async def render(url, selector):
+        from playwright.async_api import Error as playWrightError
+        from playwright.async_api import TimeoutError as playWrightTimeoutError
+
+        pool = await open_pool()
+        page = await pool.acquire()
+        try:
+            # the listings are waited for with the selector, so there's no need to wait for the page load
+            await page.goto(url, wait_until="domcontentloaded")
+            if selector is None:
+                return await page.content()
+            try:
+                await page.wait_for_selector(selector, timeout=timeout_s * 1000)
+            except playWrightTimeoutError as e:
+                # the page loaded but its listings didn't show up: the selector is most likely stale
+                raise SelectorNotFound(f"selector '{selector}' not found on '{url}' within {timeout_s}s") from e
+            entries = await page.query_selector_all(selector)
+            if not len(entries):
+                return None
+            # one selector match per line, so that large pages can be chunked on entry boundaries
+            return "\n".join([await entry.inner_html() for entry in entries])
+        except playWrightTimeoutError as e:
+            raise TransientError(f"timed out loading the page: {e}") from e
+        except playWrightError as e:
+            # network errors (connection resets, DNS hiccups...) are worth another try, unlike the rest
+            if "net::ERR_" not in str(e):
+                raise
+            raise TransientError(str(e)) from e
+        finally:
+            await pool.release(page)
+
+    async def scrape_in_browser(*, org, url, selector):
+        log.debug(f'scraping org: "{org}"')
+        start = monotonic()
+        content = None
+        try:
+            content = await scheduler.run(url, lambda: render(url, selector))
+        except SelectorNotFound as e:
+            log.warning(f"Couldn't scrape org: '{org}'. {e}")
+            unscraped_orgs.append(org)
+        except TransientError as e:
+            log.warning(f"Couldn't scrape org: '{org}' after {scheduler.retries} retries. Exception: {e}")
+            unscraped_orgs.append(org)
+        except Exception as e:
+            msg = f"Couldn't scrape '{url}'. Exception: {e}"
+            log.exception(msg)
+            unscraped_orgs.append(org)
+        finally:
+            telemetry.add_time("scrape", monotonic() - start, org="_".join(org.lower().split()))
+
+        store(org=org, url=url, content=content, fetch_tier="browser")
+
+    async def scrape(*, org, url, selector):
+        # each org is stored (& queued) as soon as it's scraped, whichever tier it took, while the others are still
+        # being fetched over HTTP or rendered in the browser
+        nonlocal n_http_orgs
+        if fetcher is not None:
+            result = await _fetch_over_http(fetcher, manifest, org=org, url=url, selector=selector)
+            if result is not None:
+                n_http_orgs += 1
+                store(org=org, url=url, fetch_tier="http", **result)
+                return
+        await scrape_in_browser(org=org, url=url, selector=selector)
+
+    try:
+        await asyncio.gather(*(scrape(**entry) for entry in orgs))
+    finally:
+        if fetcher is not None:
+            await fetcher.aclose()
+        await close_browser()
+    if http_first:
+        log.info(f"fetched {n_http_orgs} orgs over plain HTTP")
+
+    crawl_store.save()
+    # drop the placeholders of orgs that couldn't be scraped at all. Untracked orgs are forgotten only when scraping all
+    tracked_orgs = org_names if all_orgs else None
+    merge_manifest({org: entry for org, entry in manifest.items() if entry}, tracked_orgs=tracked_orgs)
+
+    if len(unscraped_orgs):
+        log.warning(f"couldn't scrape for the followings orgs: {unscraped_orgs}")
+
+
+async def scrape_from_queue(queue, max_concurrence=5, **kwargs):
+    """
+    scrape the orgs leased off the work `queue`, `max_concurrence` of them at a time, until there are none left &
+    queue each org that was scraped to be extracted
+    """
+    orgs_info = {entry["org"]: entry for entry in get_orgs_info()}
+    while len(items := queue.lease(SCRAPE, max_concurrence)):
+        await scrape_orgs(max_concurrence, orgs=[orgs_info[item["org"]] for item in items], **kwargs)
+        crawl_store.save()
+        entries = {item["id"]: crawl_store.index.get("_".join(item["org"].lower().split()), {}) for item in items}
+        scraped = {item_id: entry for item_id, entry in entries.items() if entry.get("content_hash") is not None}
+        # queued for extraction before they're done, so that extraction workers don't stop while they're in between
+        queue.enqueue(EXTRACT, [{k: entry[k] for k in ("org", "url", "content_hash")} for entry in scraped.values()])
+        for item_id in entries:
+            if item_id in scraped:
+                queue.complete(item_id)
+            else:
+                queue.fail(item_id, reason="couldn't scrape the org")
+    log.info(f"no orgs left to scrape in work queue '{queue.name}'")
 
 
 @click.command(context_settings=dict(show_default=True))
 @click.option("--max-concurrence", default=5, help="max async jobs to run")
 @click.option("--timeout-s", default=15, help="timeout in seconds waiting for selector")
-def run_scrape(max_concurrence, timeout_s):
+@click.option(
+    "--block-resources/--no-block-resources",
+    default=True,
+    help="skip loading images, fonts, stylesheets & trackers",
+)
+@click.option("--n-contexts", default=1, help="no. of browser contexts to spread the pages across")
+@click.option(
+    "--http-first/--no-http-first",
+    default=True,
+    help="try fetching pages over plain HTTP & only render the ones that need JS in a browser",
+)
+@click.option("--queue", default=None, help="name of a work queue to lease orgs from, along with other workers")
+@click.option("--per-host-concurrence", default=2, help="max pages to scrape at once from the same host")
+@click.option("--retries", default=2, help="times to retry pages that time out, are rate limited or fail transiently")
+def run_scrape(
+    max_concurrence, timeout_s, block_resources, n_contexts, http_first, queue, per_host_concurrence, retries
+):
     import asyncio
 
-    asyncio.run(scrape_orgs(int(max_concurrence), float(timeout_s)))
+    kwargs = dict(
+        timeout_s=float(timeout_s),
+        block_resources=block_resources,
+        n_contexts=int(n_contexts),
+        per_host_concurrence=int(per_host_concurrence),
+        retries=int(retries),
+    )
+    if queue is not None:
+        asyncio.run(scrape_from_queue(WorkQueue(queue), int(max_concurrence), http_first=http_first, **kwargs))
+    else:
+        asyncio.run(scrape_orgs(int(max_concurrence), http_first=http_first, **kwargs))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+"""
+Compact store of the scraped career pages.
+
+The metadata of every org (its URL & which content it was last scraped with) lives in a small JSON index, apart from
+the content itself, which is stored gzip compressed in blobs named after its hash. Listing the scraped orgs thus
+only reads the index & content is only read (& decompressed) when an org is actually processed. As blobs are
+content addressed, the last `max_snapshots` versions of every page are kept at no extra cost for unchanged pages.
+Several processes (see `src/work_queue.py`) may scrape into the same store, each saving only the orgs it scraped.
+"""
+
+import gzip
+import json
+import os
+import threading
+from contextlib import contextmanager
+from glob import glob
+from pathlib import Path
+from shutil import rmtree
+from time import sleep, time
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from src.cache import hash_text
+from src.config import SCRAPE_DOWNLOAD_PATH, log
+
+
+def normalize_org(org: str) -> str:
+    return "_".join(org.lower().split())
+
+
+@contextmanager
+def file_lock(path, timeout_s: float = 60):
+    """
+    hold `<path>.lock` for as long as the context lasts, so that processes (& threads) updating the same file
+    don't overwrite each other's changes. A lock taken longer than `timeout_s` ago was left behind by a holder that
+    died & is broken
+    """
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    # tells this holder's lock apart from one taken after it was broken
+    token = f"{os.getpid()}-{threading.get_ident()}-{uuid4().hex}"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                age_s = time() - lock_path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if age_s > timeout_s:
+                log.warning(f"breaking the stale lock '{lock_path}' taken {age_s:.0f}s ago")
+                lock_path.unlink(missing_ok=True)
+                continue
+            sleep(0.05)
+    try:
+        os.write(fd, token.encode())
+    finally:
+        os.close(fd)
+    try:
+        yield
+    finally:
+        try:
+            owned = lock_path.read_text() == token
+        except FileNotFoundError:
+            owned = False
+        if owned:
+            lock_path.unlink(missing_ok=True)
+        else:
+            log.warning(f"the lock '{lock_path}' was broken while it was held")
+
+
+class CrawlStore:
+    def __init__(self, root=SCRAPE_DOWNLOAD_PATH, max_snapshots: int = 30, compresslevel: int = 6):
+        self.root = Path(root)
+        self.max_snapshots = max_snapshots
+        self.compresslevel = compresslevel
+        self._index: Optional[Dict[str, dict]] = None
+        # orgs stored since the index was last saved & the blobs their older snapshots were dropped with
+        self._dirty, self._dropped = set(), set()
+        self._lock = threading.RLock()
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / "index.json"
+
+    @property
+    def blobs_path(self) -> Path:
+        return self.root / "blobs"
+
+    @property
+    def export_path(self) -> Path:
+        return self.root / "export"
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.blobs_path / f"{content_hash}.html.gz"
+
+    @property
+    def index(self) -> Dict[str, dict]:
+        """org -> its url, the hash of its latest content & its snapshots. Loaded once, on first use"""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load_index()
+        return self._index
+
+    def _load_index(self) -> Dict[str, dict]:
+        if self.index_path.exists():
+            with open(self.index_path) as fl:
+                return json.load(fl)
+        index = {}
+        # pages scraped before there was a store were stored as one JSON file per org
+        for path in glob(f"{self.root}/*.json"):
+            try:
+                with open(path) as fl:
+                    legacy = json.load(fl)
+            except (json.JSONDecodeError, OSError):
+                continue
+            self._put(index, legacy["org"], legacy["url"], legacy.get("content"))
+            os.remove(path)
+        if len(index):
+            log.info(f"moved {len(index)} scraped orgs into the crawl store at '{self.root}'")
+            self._save_index(index)
+        return index
+
+    def _save_index(self, index: Dict[str, dict]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as fl:
+            json.dump(index, fl, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def save(self):
+        """
+        persist the orgs stored since the last save into the index, keeping those stored by other processes in the
+        meantime, & drop the blobs that aren't referenced by any snapshot anymore
+        """
+        with self._lock, file_lock(self.index_path):
+            index = self.index
+            if self.index_path.exists():
+                with open(self.index_path) as fl:
+                    index = {**json.load(fl), **{org: index[org] for org in self._dirty}}
+            self._save_index(index)
+            self._index = index
+            referenced = {snapshot["hash"] for entry in index.values() for snapshot in entry["snapshots"]}
+            for content_hash in self._dropped - referenced:
+                self._blob_path(content_hash).unlink(missing_ok=True)
+            self._dirty, self._dropped = set(), set()
+
+    def _put(
+        self,
+        index: Dict[str, dict],
+        org: str,
+        url: str,
+        content: Optional[str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        org = normalize_org(org)
+        entry = index.setdefault(org, {"org": org, "url": url, "content_hash": None, "snapshots": []})
+        entry.update({"url": url, "stored": time(), "etag": etag, "last_modified": last_modified})
+        # a failed scrape leaves the previous snapshots as they are
+        entry["content_hash"] = None if content is None else hash_text(content)
+        if content is None:
+            return
+        blob_path = self._blob_path(entry["content_hash"])
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = blob_path.with_suffix(".tmp")
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=self.compresslevel) as fl:
+                fl.write(content)
+            os.replace(tmp_path, blob_path)
+        snapshots = [snapshot for snapshot in entry["snapshots"] if snapshot["hash"] != entry["content_hash"]]
+        snapshots.append({"hash": entry["content_hash"], "stored": entry["stored"]})
+        self._dropped |= {snapshot["hash"] for snapshot in snapshots[: -self.max_snapshots]}
+        entry["snapshots"] = snapshots[-self.max_snapshots :]
+
+    def put(
+        self,
+        org: str,
+        url: str,
+        content: Optional[str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        """
+        store the freshly scraped `content` of `org` along with the cache validators of its page, if it was fetched
+        over HTTP. The index is only persisted with `save`
+        """
+        index = self.index
+        with self._lock:
+            self._put(index, org, url, content, etag, last_modified)
+            self._dirty.add(normalize_org(org))
+
+    def validators(self, org: str) -> Tuple[Optional[str], Optional[str]]:
+        """the `ETag` & `Last-Modified` of the page the latest content of `org` was read off, without reading it"""
+        entry = self.index.get(normalize_org(org)) or {}
+        if entry.get("content_hash") is None:
+            return None, None
+        return entry.get("etag"), entry.get("last_modified")
+
+    def entries(self) -> List[dict]:
+        """the org, url & content hash of every scraped org, without reading any content"""
+        return list(self.index.values())
+
+    def read(self, org: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """the latest content of `org` (or its snapshot with `content_hash`), `None` if it couldn't be scraped"""
+        entry = self.index.get(normalize_org(org))
+        content_hash = content_hash or (entry or {}).get("content_hash")
+        if content_hash is None:
+            return None
+        try:
+            with gzip.open(self._blob_path(content_hash), "rt", encoding="utf-8") as fl:
+                return fl.read()
+        except FileNotFoundError:
+            log.warning(f"content of org: {org} is missing from the crawl store")
+            return None
+
+    def export(self, org: str) -> str:
+        """write the latest content of `org` as a plain JSON file (for tools that read files) & return its path"""
+        entry = self.index[normalize_org(org)]
+        self.export_path.mkdir(parents=True, exist_ok=True)
+        path = self.export_path / f"{entry['org']}.json"
+        with open(path, "w") as fl:
+            json.dump({"org": entry["org"], "url": entry["url"], "content": self.read(org)}, fl, ensure_ascii=False)
+        return str(path)
+
+    def clear(self):
+        with self._lock:
+            rmtree(self.root, ignore_errors=True)
+            self.root.mkdir(parents=True)
+            self._index = {}
+            self._dirty, self._dropped = set(), set()
+
+
+crawl_store = CrawlStore()
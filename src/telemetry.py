@@ -0,0 +1,141 @@
+"""
+Per-org performance telemetry of a run: time spent in each stage (scraping, preprocessing, waiting on the rate
+limiter, LLM calls & storing), bytes fetched, tokens, retries & validation failures.
+
+Work is attributed to the org set with `telemetry.org(...)`, so that LLM calls deep down the stack don't need to know
+which org they're made for. The spans are written as JSON lines along with a summary next to the final report.
+"""
+
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from time import monotonic, time
+from typing import Dict, List, Optional
+
+from src.config import log
+
+# the org whose work is being done in the current thread / asyncio task
+current_org: ContextVar[Optional[str]] = ContextVar("current_org", default=None)
+
+COUNTERS = (
+    "bytes_fetched",
+    "llm_calls",
+    "llm_cache_hits",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "retries",
+    "validation_failures",
+    "jobs_found",
+)
+# spans of work that isn't done for a single org (e.g. classifying job titles of all orgs at once)
+UNATTRIBUTED = "_unattributed"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not len(values):
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class RunTelemetry:
+    def __init__(self):
+        self.spans: Dict[str, dict] = {}
+
+    def _span(self, org: Optional[str]) -> dict:
+        org = org or current_org.get() or UNATTRIBUTED
+        if org not in self.spans:
+            self.spans[org] = {
+                "org": org,
+                "start": time(),
+                "end": time(),
+                "stages": {},
+                "llm_latencies": [],
+                **{counter: 0 for counter in COUNTERS},
+            }
+        return self.spans[org]
+
+    @contextmanager
+    def org(self, org: str):
+        """attribute everything recorded within this block to `org`"""
+        token = current_org.set(org)
+        try:
+            yield
+        finally:
+            current_org.reset(token)
+
+    @contextmanager
+    def stage(self, name: str, org: Optional[str] = None):
+        """add the time spent within this block to the `name` stage of the org's span"""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add_time(name, monotonic() - start, org)
+
+    def add_time(self, name: str, seconds: float, org: Optional[str] = None):
+        span = self._span(org)
+        span["stages"][name] = span["stages"].get(name, 0.0) + seconds
+        span["end"] = time()
+
+    def add_llm_latency(self, seconds: float, org: Optional[str] = None):
+        self._span(org)["llm_latencies"].append(seconds)
+        self.add_time("llm", seconds, org)
+
+    def add(self, counter: str, value: int = 1, org: Optional[str] = None):
+        self._span(org)[counter] += value
+
+    def set(self, counter: str, value: int, org: Optional[str] = None):
+        self._span(org)[counter] = value
+
+    def summary(self) -> dict:
+        spans = list(self.spans.values())
+        org_spans = [span for span in spans if span["org"] != UNATTRIBUTED]
+        stage_names = sorted({name for span in spans for name in span["stages"]})
+        latencies = [latency for span in spans for latency in span["llm_latencies"]]
+        totals = {counter: sum(span[counter] for span in spans) for counter in COUNTERS}
+        tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+
+        stages = {}
+        for name in stage_names:
+            durations = [span["stages"][name] for span in org_spans if name in span["stages"]]
+            stages[name] = {
+                "p50_s": percentile(durations, 0.5),
+                "p95_s": percentile(durations, 0.95),
+                "total_s": sum(span["stages"].get(name, 0.0) for span in spans),
+            }
+
+        durations = sorted(((sum(span["stages"].values()), span["org"]) for span in org_spans), reverse=True)
+        return {
+            "orgs": len(org_spans),
+            "wall_time_s": max(span["end"] for span in spans) - min(span["start"] for span in spans) if spans else 0,
+            "stages": stages,
+            "llm_latency": {
+                "calls": len(latencies),
+                "p50_s": percentile(latencies, 0.5),
+                "p95_s": percentile(latencies, 0.95),
+            },
+            "totals": totals,
+            "tokens_per_job": tokens / totals["jobs_found"] if totals["jobs_found"] else None,
+            "slowest_orgs": [{"org": org, "duration_s": duration} for duration, org in durations[:5]],
+        }
+
+    def write(self, report_path: Path):
+        """write the spans & their summary next to the final report at `report_path` & start over"""
+        if not len(self.spans):
+            return
+        spans_path = report_path.with_name(f"{report_path.stem}_spans.jsonl")
+        with open(spans_path, "w") as fl:
+            for span in self.spans.values():
+                fl.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+        summary_path = report_path.with_name(f"{report_path.stem}_summary.json")
+        log.info(f"writing performance summary to '{summary_path}'")
+        with open(summary_path, "w") as fl:
+            json.dump(self.summary(), fl, ensure_ascii=False, indent=4)
+        self.spans = {}
+
+
+telemetry = RunTelemetry()
@@ -2,15 +2,30 @@ import html
 import json
 import random
 from glob import glob
+from pathlib import Path
 from shutil import rmtree
 from time import time
-from typing import List, Optional
+from typing import List, Optional, Union
 from urllib.parse import urlparse
 
 from pydantic import BaseModel, Field
 
-from src.config import JOB_TOPIC, JOBS_WRITE_PATH, SCRAPE_DOWNLOAD_PATH, FINAL_REPORT_PATH, log
-from src.scrape.scrape import scrape_orgs
+from src.config import (
+    FINAL_REPORT_PATH,
+    JOB_INDEX_PATH,
+    JOB_TOPIC,
+    JOBS_WRITE_PATH,
+    LISTINGS_WRITE_PATH,
+    LLM_CACHE_PATH,
+    RUNS_PATH,
+    SCRAPE_MANIFEST_PATH,
+    WORK_QUEUE_PATH,
+    log,
+)
+from src.job_index import job_index
+from src.scrape.scrape import load_manifest, save_manifest, scrape_orgs
+from src.scrape.store import crawl_store, file_lock
+from src.telemetry import telemetry
 
 
 class JobModel(BaseModel):
@@ -18,16 +33,30 @@ class JobModel(BaseModel):
     href: str = Field(..., description="URL of the Job application")
     location: Optional[str] = Field(None, description="Job Location")
     workplaceType: Optional[str] = Field(None, description="Way of Working (On-Site/Hybrid/Remote)")
+    topics: Optional[List[str]] = Field(None, description="Topics the job is related to, when run for several topics")
 
 
 class JobsModel(BaseModel):
     jobs: List[JobModel]
 
 
+class TaggedJobModel(JobModel):
+    topics: List[int] = Field(..., description="Numbers of the topics the job is related to")
+
+
+class TaggedJobsModel(BaseModel):
+    jobs: List[TaggedJobModel]
+
+
+class RelevantJobsModel(BaseModel):
+    relevant: List[int] = Field(..., description="Numbers of the job titles related to the topic")
+
+
 class OrgsModel(BaseModel):
     org: str = Field(..., description="Name of the Organization")
     url: str = Field(..., description="URL of the Organization")
     jobs: List[JobModel]
+    relevance: Optional[float] = Field(None, description="score of the org's content against the topic")
 
 
 class InputModel(BaseModel):
@@ -36,33 +65,74 @@ class InputModel(BaseModel):
     content: str = Field(..., description="HTML content containing various job listings")
 
 
-async def prepare_inputs(scrape: bool = True, skip_empty_content: bool = True):
-    """read the scraped files and build a dictionary"""
+def jobs_info_path(org: str) -> str:
+    org = "_".join(org.lower().split())
+    return f"{JOBS_WRITE_PATH}/jobs_{org}.json"
+
+
+def is_unchanged(entry, org: str, topic: str = JOB_TOPIC) -> bool:
+    """whether the manifest `entry` of `org` shows no change in content since its jobs were extracted for `topic`"""
+    return (
+        entry.get("content_hash") is not None
+        and entry.get("extracted_hash") == entry["content_hash"]
+        and entry.get("extracted_topic") == topic
+        and Path(jobs_info_path(org)).exists()
+    )
+
+
+def get_unchanged_orgs(topic: str = JOB_TOPIC):
+    """orgs whose scraped content hasn't changed since their jobs were last successfully extracted for `topic`"""
+    return [org for org, entry in load_manifest().items() if is_unchanged(entry, org, topic)]
+
+
+def load_jobs_info(org: str):
+    with open(jobs_info_path(org)) as fl:
+        return json.load(fl)
+
+
+def load_unchanged_jobs(topic: str = JOB_TOPIC):
+    """reuse the previously extracted jobs of orgs with unchanged content"""
+    results = [load_jobs_info(org) for org in get_unchanged_orgs(topic)]
+    log.info(f"reusing previously extracted jobs for {len(results)} unchanged orgs")
+    return results
+
+
+async def prepare_inputs(
+    scrape: bool = True, skip_empty_content: bool = True, incremental: bool = False, topic: str = JOB_TOPIC
+):
+    """
+    list the scraped orgs off the crawl store's index, without reading their content (see `crawl_store.read`).
+    If `incremental`, orgs whose content didn't change since their last successful extraction are left out.
+    Use `load_unchanged_jobs` to get their previous results.
+    """
     log.debug("preparing inputs")
     if scrape:
         await scrape_orgs()
-    text_filepaths = glob(f"{SCRAPE_DOWNLOAD_PATH}/*.json")
+    unchanged_orgs = set(get_unchanged_orgs(topic)) if incremental else set()
+    entries = crawl_store.entries()
     # shuffle them so that you don't always feed the org data in the same order to the LLM
-    random.shuffle(text_filepaths)
+    random.shuffle(entries)
     inputs = []
-    for fp in text_filepaths:
-        with open(fp) as fl:
-            content = json.load(fl)
-        if content is None:
-            log.warning(f"no HTML content found for org: {content['org']}. Skipping it.")
+    for entry in entries:
+        if entry["content_hash"] is None:
+            log.warning(f"no HTML content found for org: {entry['org']}.")
             if skip_empty_content:
-                break
+                continue
+        if entry["org"] in unchanged_orgs:
+            log.debug(f"content of org: {entry['org']} unchanged since its last extraction. Skipping it.")
+            continue
         dc = {
-            "org": content["org"],
-            "url": content["url"],
-            "file_path": str(fp),
-            "topic": JOB_TOPIC,
+            "org": entry["org"],
+            "url": entry["url"],
+            "topic": topic,
         }
         inputs.append(dc)
     return inputs
 
 
 def merge_urls(job_url: str, org_url: str) -> str:
+    if job_url.startswith(("http://", "https://")):
+        return job_url
     if not org_url.startswith("http"):
         org_url = "http://" + org_url
     parsed_url = urlparse(org_url)
@@ -80,6 +150,18 @@ def fix_job_listings(json_resp):
     return json_resp
 
 
+def merge_job_lists(models):
+    """merge the jobs extracted from several chunks of the same org, dropping duplicate `href`s"""
+    seen_hrefs, jobs = set(), []
+    for model in models:
+        for job in model["jobs"]:
+            if job["href"] in seen_hrefs:
+                continue
+            seen_hrefs.add(job["href"])
+            jobs.append(job)
+    return {"jobs": jobs}
+
+
 def clean_resp(resp):
     """return the content inside code blocks if any"""
     resp = resp.strip()
@@ -91,36 +173,111 @@ def clean_resp(resp):
     return resp
 
 
-def store_jobs_info(model_dump):
-    org = "_".join(model_dump["org"].lower().split())
-    fp = f"{JOBS_WRITE_PATH}/jobs_{org}.json"
+def jobs_of_topic(model_dump, topic: str):
+    """the jobs of an org extracted for several topics, limited to those tagged with `topic`"""
+    return {**model_dump, "jobs": [job for job in model_dump["jobs"] if topic in (job.get("topics") or [])]}
+
+
+def store_jobs_info(model_dump, topic: Union[str, List[str]] = JOB_TOPIC):
+    fp = jobs_info_path(model_dump["org"])
+    JOBS_WRITE_PATH.mkdir(parents=True, exist_ok=True)
     with open(fp, "w") as fl:
         json.dump(model_dump, fl, ensure_ascii=False, indent=4)
     log.info(f"stored jobs info for \"{model_dump['org']}\" at '{fp}'")
+    mark_extracted(model_dump["org"], topic)
+    if isinstance(topic, str):
+        job_index.upsert_org(model_dump["org"], model_dump["jobs"], topic)
+    else:
+        for tp in topic:
+            job_index.upsert_org(model_dump["org"], jobs_of_topic(model_dump, tp)["jobs"], tp)
+
+
+def mark_extracted(org: str, topic: Union[str, List[str]] = JOB_TOPIC):
+    """remember which version of the scraped content the stored jobs of `org` were extracted from"""
+    org = "_".join(org.lower().split())
+    with file_lock(SCRAPE_MANIFEST_PATH):
+        manifest = load_manifest()
+        entry = manifest.get(org)
+        if entry is None or entry.get("content_hash") is None:
+            return
+        entry.update({"extracted_hash": entry["content_hash"], "extracted_topic": topic, "last_extracted": time()})
+        save_manifest(manifest)
+
+
+def listings_path(org: str) -> str:
+    org = "_".join(org.lower().split())
+    return f"{LISTINGS_WRITE_PATH}/listings_{org}.json"
+
+
+def store_listings(model_dump):
+    """store all the jobs listed by an org regardless of the topic, so that they can be filtered again later"""
+    fp = listings_path(model_dump["org"])
+    LISTINGS_WRITE_PATH.mkdir(parents=True, exist_ok=True)
+    with open(fp, "w") as fl:
+        json.dump(model_dump, fl, ensure_ascii=False, indent=4)
+    log.debug(f"stored job listings for \"{model_dump['org']}\" at '{fp}'")
+
+
+def load_listings():
+    listings = []
+    for fp in glob(f"{LISTINGS_WRITE_PATH}/listings_*.json"):
+        with open(fp) as fl:
+            listings.append(json.load(fl))
+    return listings
 
 
-def store_final_jobs_report(results):
+def topic_slug(topic: str) -> str:
+    return "_".join("".join(ch if ch.isalnum() else " " for ch in topic.lower()).split())
+
+
+def store_final_jobs_report(results, topic: Union[str, List[str]] = JOB_TOPIC):
+    """
+    write the final report of the run along with the jobs new / removed since the previous one.
+    Runs for several topics get a report per topic, named after it
+    """
+    FINAL_REPORT_PATH.mkdir(parents=True, exist_ok=True)
     path = FINAL_REPORT_PATH / f"{int(time())}.json"
-    log.info(f"writing final jobs report to '{path}'")
-    with open(path, "w") as fl:
-        json.dump(results, fl, ensure_ascii=False, indent=4)
+    if isinstance(topic, str):
+        topic_paths = {topic: path}
+    else:
+        topic_paths = {tp: path.with_name(f"{path.stem}_{topic_slug(tp)}.json") for tp in topic}
+    for tp, report_path in topic_paths.items():
+        report = results if isinstance(topic, str) else [jobs_of_topic(res, tp) for res in results]
+        log.info(f"writing final jobs report to '{report_path}'")
+        with open(report_path, "w") as fl:
+            json.dump(report, fl, ensure_ascii=False, indent=4)
+        # the postings that are new or not listed anymore since the previous report
+        diff = job_index.diff(tp)
+        diff_path = report_path.with_name(f"{report_path.stem}_diff.json")
+        log.info(f"{len(diff['new'])} new & {len(diff['removed'])} removed jobs since the last report: '{diff_path}'")
+        with open(diff_path, "w") as fl:
+            json.dump(diff, fl, ensure_ascii=False, indent=4)
+    telemetry.write(path)
 
 
 def cleanup_reports():
     """delete generated job reports"""
     log.warning("deleting all job reports generated so far!")
-    for path in (JOBS_WRITE_PATH, FINAL_REPORT_PATH):
-        rmtree(path)
-        path.mkdir(parents=True)
+    for path in (JOBS_WRITE_PATH, LISTINGS_WRITE_PATH, FINAL_REPORT_PATH, RUNS_PATH):
+        rmtree(path, ignore_errors=True)
+    for db_path in (JOB_INDEX_PATH, WORK_QUEUE_PATH):
+        for path in (db_path, *db_path.parent.glob(f"{db_path.name}-*")):
+            path.unlink(missing_ok=True)
 
 
 def cleanup_crawled_content(delete_job_reports=True):
     log.warning("deleting crawled content scraped so far!")
-    rmtree(SCRAPE_DOWNLOAD_PATH)
-    SCRAPE_DOWNLOAD_PATH.mkdir(parents=True)
+    crawl_store.clear()
     if delete_job_reports:
         cleanup_reports()
 
 
+def cleanup_llm_cache():
+    """delete cached LLM responses"""
+    log.warning("deleting all cached LLM responses!")
+    rmtree(LLM_CACHE_PATH, ignore_errors=True)
+
+
 def cleanup():
     cleanup_crawled_content()
+    cleanup_llm_cache()
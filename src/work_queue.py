@@ -0,0 +1,177 @@
+"""
+Durable queue of org work items, so that orgs can be scraped & extracted by several worker processes at once, on one
+box or on several sharing a volume, e.g. each with its own provider / API key.
+
+Items go through two stages: `scrape` items are leased by `scrape_jobsites --queue` workers, which enqueue an `extract`
+item for every org they scraped, in turn leased by `run_manual --queue` workers. A lease expires after `lease_s`, so
+the items of a worker that died are picked up by another one. See `src/distributed.py` for the producer & reducer.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional, Union
+
+from src.config import JOB_TOPIC, WORK_QUEUE_PATH, log
+
+SCRAPE, EXTRACT = "scrape", "extract"
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queues (
+    queue TEXT PRIMARY KEY,
+    topic TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    org TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    reason TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (queue, stage, org)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (queue, stage, status);
+"""
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, name: str, path=WORK_QUEUE_PATH, lease_s: float = 600, max_attempts: int = 3):
+        self.name = name
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.worker = worker_id()
+        # the schema & the journal mode are set once per worker, not on every claim or heartbeat
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # leases are claimed within `BEGIN IMMEDIATE` transactions, so that no two workers get the same item.
+        # Workers contending for the queue wait for each other's transactions for up to `timeout` seconds
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, topic: Union[str, List[str]] = JOB_TOPIC):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO queues (queue, topic, created) VALUES (?, ?, ?)",
+                (self.name, json.dumps(topic), time()),
+            )
+
+    @property
+    def topic(self) -> Union[str, List[str]]:
+        """the topic(s) the orgs of this queue are extracted for. Raises `KeyError` if there's no such queue"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT topic FROM queues WHERE queue = ?", (self.name,)).fetchone()
+        if row is None:
+            raise KeyError(f"no work queue named '{self.name}'")
+        return json.loads(row["topic"])
+
+    def enqueue(self, stage: str, payloads: List[dict]):
+        """add an item per payload (which has to name its `org`), leaving out orgs already queued for the `stage`"""
+        now = time()
+        rows = [(self.name, stage, payload["org"], json.dumps(payload), PENDING, now) for payload in payloads]
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (queue, stage, org, payload, status, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        log.debug(f"enqueued {len(rows)} {stage} items in work queue '{self.name}'")
+
+    def lease(self, stage: str, n: int = 1) -> List[dict]:
+        """
+        claim up to `n` pending items of the `stage` (or those whose lease expired) for `lease_s`. Items whose lease
+        expired `max_attempts` times, e.g. as they crash every worker leasing them, are failed instead
+        """
+        now = time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                n_failed = conn.execute(
+                    """
+                    UPDATE items SET status = ?, reason = ?, lease_expires = NULL, updated = ?
+                    WHERE queue = ? AND stage = ? AND status = ? AND lease_expires < ? AND attempts >= ?
+                    """,
+                    (FAILED, "lease expired on every attempt", now, self.name, stage, LEASED, now, self.max_attempts),
+                ).rowcount
+                rows = conn.execute(
+                    """
+                    SELECT id, org, payload FROM items
+                    WHERE queue = ? AND stage = ? AND attempts < ?
+                        AND (status = ? OR (status = ? AND lease_expires < ?))
+                    ORDER BY id LIMIT ?
+                    """,
+                    (self.name, stage, self.max_attempts, PENDING, LEASED, now, n),
+                ).fetchall()
+                conn.executemany(
+                    """
+                    UPDATE items SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ?
+                    WHERE id = ?
+                    """,
+                    [(LEASED, self.worker, now + self.lease_s, now, row["id"]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if n_failed:
+            log.warning(f"failed {n_failed} {stage} items of work queue '{self.name}' whose leases kept expiring")
+        return [{"id": row["id"], "org": row["org"], **json.loads(row["payload"])} for row in rows]
+
+    def complete(self, item_id: int):
+        self._set_status(item_id, DONE)
+
+    def fail(self, item_id: int, reason: Optional[str] = None):
+        """put the item back for another attempt, unless it already had `max_attempts`"""
+        with closing(self._connect()) as conn:
+            (attempts,) = conn.execute("SELECT attempts FROM items WHERE id = ?", (item_id,)).fetchone()
+        self._set_status(item_id, FAILED if attempts >= self.max_attempts else PENDING, reason)
+
+    def _set_status(self, item_id: int, status: str, reason: Optional[str] = None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE items SET status = ?, reason = ?, lease_expires = NULL, updated = ? WHERE id = ?",
+                (status, reason, time(), item_id),
+            )
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """no. of items per stage & status"""
+        counts = {SCRAPE: {}, EXTRACT: {}}
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT stage, status, COUNT(*) AS n FROM items WHERE queue = ? GROUP BY stage, status", (self.name,)
+            ).fetchall()
+        for row in rows:
+            counts[row["stage"]][row["status"]] = row["n"]
+        return counts
+
+    def is_drained(self, *stages: str) -> bool:
+        """whether no item of the `stages` is left to be done, i.e. none is pending or leased"""
+        counts = self.counts()
+        return all(not counts[stage].get(PENDING) and not counts[stage].get(LEASED) for stage in stages)
+
+    def items(self, stage: str, status: str) -> List[dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT org, payload, reason FROM items WHERE queue = ? AND stage = ? AND status = ?",
+                (self.name, stage, status),
+            ).fetchall()
+        return [{**json.loads(row["payload"]), "reason": row["reason"]} for row in rows]
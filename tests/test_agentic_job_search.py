@@ -0,0 +1,31 @@
+import asyncio
+
+from src.agentic_job_search import main
+from src.journal import RunJournal
+from src.telemetry import RunTelemetry
+
+
+class _Crew:
+    """stands in for a crew, recording its LLM calls the way the crew's LLM does"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def copy(self):
+        return self
+
+    def kickoff(self, inputs):
+        self.recorder.add("llm_calls")
+
+    async def kickoff_async(self, inputs):
+        self.recorder.add("llm_calls")
+
+
+def test_crews_record_telemetry_per_org(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    recorder = RunTelemetry()
+    journal = RunJournal()
+    main._kickoff(_Crew(recorder), {"org": "acme"}, journal)
+    asyncio.run(main._kickoff_with_workers(_Crew(recorder), [{"org": "globex"}, {"org": "initech"}], 2, journal))
+    assert {org: span["llm_calls"] for org, span in recorder.spans.items()} == {"acme": 1, "globex": 1, "initech": 1}
+    assert set(journal.completed_orgs()) == {"acme", "globex", "initech"}
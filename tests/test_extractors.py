@@ -0,0 +1,61 @@
+from src.extractors import extract_jobs
+
+ASHBY = """
+<div class="_jobs_abc12">
+    <a class="_container_x1y2z" href="/acme/1">
+        <h3 class="_title_q9">Data Scientist</h3>
+        <div class="_details_k3"><p>Berlin</p><span>Hybrid</span></div>
+    </a>
+    <a class="_container_x1y2z" href="/acme/2"><h3 class="_title_q9">ML Engineer</h3></a>
+</div>
+"""
+GREENHOUSE = """
+<table><tbody>
+    <tr class="job-post"><td><a href="https://job-boards.greenhouse.io/acme/jobs/1">
+        <p class="body body--medium">Data Scientist</p><p class="body body__secondary body--metadata">Remote, US</p>
+    </a></td></tr>
+</tbody></table>
+"""
+LEVER = """
+<div class="posting">
+    <div class="posting-apply"><a class="posting-btn-submit" href="https://jobs.lever.co/acme/1/apply">Apply</a></div>
+    <a class="posting-title" href="https://jobs.lever.co/acme/1">
+        <h5 data-qa="posting-name">ML Engineer</h5>
+        <span class="location">London</span><span class="workplaceTypes">On-site</span>
+    </a>
+</div>
+"""
+
+
+def test_ashby():
+    assert extract_jobs("https://jobs.ashbyhq.com/acme", ASHBY) == [
+        {"title": "Data Scientist", "href": "/acme/1", "location": "Berlin Hybrid", "workplaceType": "Hybrid"},
+        {"title": "ML Engineer", "href": "/acme/2", "location": None, "workplaceType": None},
+    ]
+
+
+def test_greenhouse():
+    assert extract_jobs("https://job-boards.greenhouse.io/acme", GREENHOUSE) == [
+        {
+            "title": "Data Scientist",
+            "href": "https://job-boards.greenhouse.io/acme/jobs/1",
+            "location": "Remote, US",
+            "workplaceType": "Remote",
+        }
+    ]
+
+
+def test_lever_takes_the_link_of_the_posting():
+    assert extract_jobs("https://jobs.lever.co/acme", LEVER) == [
+        {
+            "title": "ML Engineer",
+            "href": "https://jobs.lever.co/acme/1",
+            "location": "London",
+            "workplaceType": "On-site",
+        }
+    ]
+
+
+def test_unknown_boards_and_changed_markup_are_left_to_the_llm():
+    assert extract_jobs("https://acme.com/careers", ASHBY) is None
+    assert extract_jobs("https://jobs.ashbyhq.com/acme", GREENHOUSE) is None
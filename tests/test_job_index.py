@@ -0,0 +1,49 @@
+from src.job_index import JobIndex, normalize_href
+
+TOPIC = "Data Science"
+
+
+def test_normalize_href_drops_only_tracking_params():
+    assert normalize_href("https://Jobs.acme.com/jobs/1/?utm_source=x&gh_src=y&ref=z#apply") == (
+        "https://jobs.acme.com/jobs/1"
+    )
+    # params named like tracking ones may still tell postings apart
+    assert normalize_href("https://acme.com/jobs?reference=1") != normalize_href("https://acme.com/jobs?reference=2")
+    assert normalize_href("https://acme.com/jobs?sourceId=1&refId=2") == "https://acme.com/jobs?refId=2&sourceId=1"
+
+
+def _jobs(*ids):
+    return [{"title": f"Data Scientist {idx}", "href": f"https://acme.com/jobs/{idx}"} for idx in ids]
+
+
+def _hrefs(jobs):
+    return sorted(job["href"] for job in jobs)
+
+
+def test_diff_against_the_last_report(tmp_path):
+    index = JobIndex(tmp_path / "index.sqlite3")
+    index.upsert_org("acme", _jobs(1, 2), TOPIC, seen_at=1)
+    diff = index.diff(TOPIC)
+    assert diff["since"] is None
+    assert _hrefs(diff["new"]) == _hrefs(_jobs(1, 2)) and diff["removed"] == []
+
+    # job 1 is gone, job 3 is new & the same job 2 is listed under a tracking param
+    jobs = _jobs(3) + [{"title": "Data Scientist 2", "href": "https://acme.com/jobs/2?utm_source=x"}]
+    index.upsert_org("acme", jobs, TOPIC)
+    diff = index.diff(TOPIC)
+    assert _hrefs(diff["new"]) == _hrefs(_jobs(3))
+    assert _hrefs(diff["removed"]) == _hrefs(_jobs(1))
+    assert len(index.query("active", TOPIC, org="acme")) == 2
+
+    # nothing changed since
+    index.upsert_org("acme", _jobs(2, 3), TOPIC)
+    diff = index.diff(TOPIC)
+    assert diff["new"] == diff["removed"] == []
+
+
+def test_topics_are_indexed_apart(tmp_path):
+    index = JobIndex(tmp_path / "index.sqlite3")
+    index.upsert_org("acme", _jobs(1), TOPIC)
+    index.upsert_org("acme", [], "Design")
+    assert len(index.query("active", TOPIC)) == 1
+    assert index.query("active", "Design") == []
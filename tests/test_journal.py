@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.journal import EXTRACTED, FAILED, SCRAPED, RunJournal
+from src.utils import jobs_info_path
+
+TOPIC = "Data Science"
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # every path of the package is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_resume_a_run():
+    journal = RunJournal("run", TOPIC)
+    journal.mark_scraped(["acme", "globex", "initech"])
+    journal.mark("acme", EXTRACTED)
+    journal.mark("globex", FAILED, reason="invalid response")
+
+    resumed = RunJournal.load("run", "Design")
+    # resumed runs keep the topic they were started with
+    assert resumed.topic == TOPIC
+    assert resumed.scrape_done
+    assert resumed.completed_orgs() == ["acme"]
+    assert resumed.failed_orgs() == {"globex": "invalid response"}
+    assert resumed.orgs["initech"]["status"] == SCRAPED
+
+    # scraping again doesn't undo the orgs already extracted
+    resumed.mark_scraped(["acme", "globex"])
+    assert resumed.completed_orgs() == ["acme"]
+    assert resumed.orgs["globex"]["status"] == SCRAPED
+
+
+def test_resume_an_unknown_run():
+    with pytest.raises(FileNotFoundError):
+        RunJournal.load("unknown")
+
+
+def test_report_includes_the_orgs_extracted_before_resuming():
+    journal = RunJournal("run", TOPIC)
+    journal.mark("acme", EXTRACTED)
+    journal.mark("globex", EXTRACTED)
+    Path(jobs_info_path("acme")).parent.mkdir(parents=True)
+    Path(jobs_info_path("acme")).write_text(json.dumps({"org": "acme", "jobs": []}))
+
+    report = RunJournal.load("run", TOPIC).report([{"org": "initech", "jobs": []}])
+    # globex's jobs went missing, so it's left out
+    assert [res["org"] for res in report] == ["initech", "acme"]
@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from pydantic import BaseModel
+
+from src import llms
+from src.cache import ResponseCache
+from src.llms import CustomLLM
+
+
+def _response(content):
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, model_dump_json=lambda: "{}")
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def test_call_with_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "openai/test", "API_KEY": "test"})
+    llm = CustomLLM("TEST", cache=ResponseCache(tmp_path), prompt_caching=False)
+    calls = []
+
+    def complete(messages, payload_kwargs):
+        calls.append(messages)
+        return _response('{"jobs": []}')
+
+    monkeypatch.setattr(llm, "_complete", complete)
+    messages = [{"role": "system", "content": "extract the jobs"}, {"role": "user", "content": "<ul></ul>"}]
+    assert llm(messages) == '{"jobs": []}'
+    # the second call is answered from the cache
+    assert llm(messages) == '{"jobs": []}'
+    assert len(calls) == 1
+
+
+def test_prompt_caching_support_falls_back(monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "unknown/model"})
+    llm = CustomLLM("TEST")
+    messages = llm._prepare_prefix_cache([{"role": "user", "content": "hi"}, {"role": "system", "content": "sys"}])
+    assert [msg["role"] for msg in messages] == ["system", "user"]
+    assert isinstance(llm.supports_cache_control, bool)
+
+
+class _Jobs(BaseModel):
+    jobs: list
+
+
+def test_uncache_with_structured_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "openai/test", "API_KEY": "test"})
+    llm = CustomLLM("TEST", cache=ResponseCache(tmp_path), structured_output=True, prompt_caching=False)
+    monkeypatch.setattr(llm, "_complete", lambda messages, payload_kwargs: _response("not json"))
+    messages = [{"role": "user", "content": "<ul></ul>"}]
+    llm(messages, response_model=_Jobs)
+    assert llm.get_cached(messages, response_model=_Jobs) == "not json"
+    llm.uncache(messages, response_model=_Jobs)
+    assert llm.get_cached(messages, response_model=_Jobs) is None
+
+
+def test_call_without_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "openai/test", "API_KEY": "test"})
+    llm = CustomLLM("TEST", cache=ResponseCache(tmp_path), prompt_caching=False)
+    monkeypatch.setattr(llm, "_complete", lambda messages, payload_kwargs: _response("{}"))
+    messages = [{"role": "user", "content": "<ul></ul>"}]
+    llm(messages, use_cache=False)
+    assert llm.get_cached(messages) is None
+
+
+def test_only_schema_errors_disable_structured_output():
+    assert llms.is_unsupported_schema_error(ValueError("response_format json_schema is not supported by this model"))
+    assert not llms.is_unsupported_schema_error(ValueError("This model's maximum context length is 8192 tokens"))
+
+
+def test_cache_prunes_every_n_writes(tmp_path):
+    # room for 2 entries of ~110 bytes
+    cache = ResponseCache(tmp_path, max_size_mb=250 / 1024 / 1024, prune_every=4)
+    for idx in range(3):
+        cache.set(f"key{idx}", "x" * 60, "model")
+    # the cache is over its size, but isn't listed until the 4th write
+    assert len(list(tmp_path.glob("*.json"))) == 3
+    cache.set("key3", "x" * 60, "model")
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+
+def test_cache_entry_written_by_several_threads_at_once(tmp_path):
+    cache = ResponseCache(tmp_path)
+    responses = [str(idx) * 50_000 for idx in range(8)]
+    with ThreadPoolExecutor(len(responses)) as pool:
+        list(pool.map(lambda response: cache.set("key", response, "model"), responses))
+    assert cache.get("key") in responses
+    assert not len(list(tmp_path.glob("*.tmp")))
+
+
+def test_system_prompt_is_marked_as_a_cacheable_prefix(monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "anthropic/test"})
+    llm = CustomLLM("TEST")
+    llm._supports_cache_control = True
+    messages, _ = llm._prepare_request(
+        [{"role": "user", "content": "<ul></ul>"}, {"role": "system", "content": "sys"}], {}
+    )
+    assert messages == [
+        {"role": "system", "content": [{"type": "text", "text": "sys", "cache_control": {"type": "ephemeral"}}]},
+        {"role": "user", "content": "<ul></ul>"},
+    ]
+    llm = CustomLLM("TEST", prompt_caching=False)
+    messages = [{"role": "user", "content": "<ul></ul>"}, {"role": "system", "content": "sys"}]
+    assert llm._prepare_request(list(messages), {})[0] == messages
+
+
+def test_ollama_keeps_the_model_loaded(monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "ollama/test"})
+    _, payload_kwargs = CustomLLM("OLLAMA", keep_alive="1h")._prepare_request("hi", {})
+    assert payload_kwargs["keep_alive"] == "1h"
+
+
+def test_cached_prompt_tokens_are_counted(monkeypatch):
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "openai/test"})
+    llm = CustomLLM("TEST")
+    llm._record_usage(SimpleNamespace(prompt_tokens=100, completion_tokens=5, cache_read_input_tokens=80))
+    llm._record_usage(
+        SimpleNamespace(prompt_tokens=100, completion_tokens=5, prompt_tokens_details=SimpleNamespace(cached_tokens=90))
+    )
+    assert llm.usage["prompt_tokens"] == 200
+    assert llm.usage["cached_tokens"] == 170
@@ -0,0 +1,38 @@
+from src.preprocess import reduce_html, split_into_chunks
+
+
+def test_reduce_html_keeps_text_and_job_links():
+    html = """
+    <html><head><title>Careers</title><style>li { color: red }</style></head>
+    <body>
+        <script>track()</script>
+        <ul class="jobs">
+            <li data-id="1"><a class="job" href="/jobs/1"><h3>Data Scientist</h3><span>Berlin</span></a></li>
+            <li><a href="#top">Back to top</a><svg><path d="M0"/></svg></li>
+            <li><a href="/jobs/2?a=1&amp;b=2">ML Engineer</a> <span>Remote</span></li>
+        </ul>
+    </body></html>
+    """
+    assert reduce_html(html).splitlines() == [
+        '<a href="/jobs/1">Data Scientist | Berlin</a>',
+        "Back to top",
+        '<a href="/jobs/2?a=1&amp;b=2">ML Engineer</a> | Remote',
+    ]
+
+
+def test_reduce_html_passes_empty_content_through():
+    assert reduce_html(None) is None
+    assert reduce_html("") == ""
+
+
+def test_split_into_chunks_on_line_boundaries():
+    content = "\n".join(f"job {idx}" for idx in range(10))
+    chunks = split_into_chunks(content, 20)
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert "\n".join(chunks) == content
+    assert chunks[0] == "job 0\njob 1\njob 2"
+
+
+def test_split_into_chunks_cuts_only_overlong_lines():
+    assert split_into_chunks("short", 10) == ["short"]
+    assert split_into_chunks("x" * 25 + "\nshort", 10) == ["x" * 10, "x" * 10, "x" * 5, "short"]
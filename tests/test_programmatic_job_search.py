@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from click.testing import CliRunner
+
+from src import llms, utils
+from src.job_index import JobIndex
+from src.programmatic_job_search import main
+from src.programmatic_job_search.main import ProgrammaticJobSearch
+from src.relevance import TopicScorer
+from src.utils import load_jobs_info, store_jobs_info
+
+TOPIC = "Data Science"
+JOBS = [{"title": f"Data Scientist {idx}", "href": f"https://acme.com/jobs/{idx}"} for idx in range(3)]
+
+
+@pytest.fixture
+def search(tmp_path, monkeypatch):
+    # every path of the package is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "job_index", JobIndex(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(llms, "read_creds", lambda provider: {"MODEL_NAME": "openai/test", "API_KEY": "test"})
+    return ProgrammaticJobSearch(TOPIC, provider="TEST", use_cache=False, stream=True, incremental=False)
+
+
+def test_stream_keeps_the_jobs_of_orgs_that_failed_to_scrape(search, monkeypatch):
+    store_jobs_info({"org": "acme", "url": "https://acme.com/jobs", "jobs": JOBS}, TOPIC)
+
+    async def scrape_orgs(max_concurrence, queue):
+        queue.put_nowait({"org": "acme", "url": "https://acme.com/jobs", "content": None})
+
+    async def extract(*args, **kwargs):
+        raise AssertionError("orgs that failed to scrape shouldn't be extracted")
+
+    monkeypatch.setattr(main, "scrape_orgs", scrape_orgs)
+    monkeypatch.setattr(search, "_aextract_jobs", extract)
+    asyncio.run(search.astream_job_info_from_all_orgs(max_concurrence=2))
+
+    assert load_jobs_info("acme")["jobs"] == JOBS
+    assert len(utils.job_index.query("active", TOPIC, org="acme")) == len(JOBS)
+    assert list(search.journal.failed_orgs()) == ["acme"]
+
+
+def test_two_stages_cant_be_streamed():
+    result = CliRunner().invoke(main.run, ["--stream", "--two-stages"])
+    assert result.exit_code == 2
+    assert "can't be combined" in result.output
+
+
+def test_relevant_titles_coerce_the_numbers():
+    titles = ["Data Scientist", "Recruiter", "ML Engineer"]
+    model = {"relevant": ["0", 2.0, 7, -1]}
+    assert ProgrammaticJobSearch._relevant_titles(titles, model) == {"Data Scientist", "ML Engineer"}
+
+
+def test_tag_topics_coerce_the_numbers(search):
+    search.topics = ["Data Science", "Design"]
+    jobs = [
+        {"title": "Data Scientist", "href": "/1", "topics": ["1"]},
+        {"title": "Product Designer", "href": "/2", "topics": [2.0, 5]},
+        {"title": "Recruiter", "href": "/3", "topics": [3]},
+    ]
+    assert [job["topics"] for job in search._tag_topics(jobs)] == [["Data Science"], ["Design"]]
+
+
+def test_build_messages_chunks_content_over_the_token_budget(search, monkeypatch):
+    search.max_chunk_tokens = 10
+    # 1 token per 4 chars
+    monkeypatch.setattr(search.llm, "count_tokens", lambda content: len(content) // 4)
+    content = "\n".join(f"<li>job {idx}</li>" for idx in range(20))
+    messages = search._build_messages(content)
+    assert len(messages) > 1
+    assert all(len(msgs[1]["content"]) <= 40 for msgs in messages)
+    assert [msgs[0] for msgs in messages] == [search._system_msg] * len(messages)
+    assert "\n".join(msgs[1]["content"] for msgs in messages) == content
+
+
+def test_irrelevant_orgs_are_skipped_without_an_llm(search, monkeypatch):
+    search.relevance_threshold, search.scorer = 0.3, TopicScorer(TOPIC)
+    monkeypatch.setattr(search, "_call_llm", lambda messages: {"jobs": JOBS[:1]})
+    res = search._extract_jobs("https://acme.com/jobs", '<ul><li><a href="/1">Account Executive</a></li></ul>')
+    assert res["jobs"] == [] and res["relevance"] < 0.3
+    res = search._extract_jobs("https://acme.com/jobs", '<ul><li><a href="/1">Data Scientist</a></li></ul>')
+    assert res["jobs"] == JOBS[:1] and res["relevance"] >= 0.3
@@ -0,0 +1,26 @@
+from src.relevance import TopicScorer, split_topic
+
+TOPIC = "Data Science or Machine/Deep Learning or NLP/LLMs"
+
+
+def test_split_topic():
+    assert split_topic(TOPIC) == ["Data Science", "Machine Deep Learning", "NLP LLMs"]
+
+
+def test_listings_related_to_the_topic_score_higher():
+    scorer = TopicScorer(TOPIC)
+    relevant = '<a href="/jobs/1">Senior Data Scientist</a> | Berlin\nOffice Manager'
+    irrelevant = '<a href="/jobs/2">Account Executive</a> | Berlin\nOffice Manager'
+    assert scorer.score(relevant) > 0.4
+    assert scorer.score(relevant) > 3 * scorer.score(irrelevant)
+    assert scorer.score(None) == scorer.score("") == 0.0
+
+
+def test_partial_fit_weighs_down_common_words():
+    scorer = TopicScorer("Machine Learning Engineer")
+    text = "Sales Engineer"
+    before = scorer.score(text)
+    for _ in range(20):
+        scorer.partial_fit("Sales Engineer\nSupport Engineer\nData Engineer")
+    assert scorer.score(text) < before
+    assert scorer.score("Machine Learning Engineer") > 0.99
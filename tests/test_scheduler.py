@@ -0,0 +1,87 @@
+import asyncio
+from email.utils import formatdate
+from time import time
+
+import pytest
+
+from src.scrape.scheduler import HostScheduler, TransientError, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert 55 < parse_retry_after(formatdate(time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_fetches_per_host_are_capped():
+    scheduler = HostScheduler(max_concurrence=4, per_host=1)
+    in_flight, max_in_flight = {}, {}
+
+    async def attempt(host):
+        in_flight[host] = in_flight.get(host, 0) + 1
+        max_in_flight[host] = max(max_in_flight.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+
+    async def main():
+        urls = [f"https://{host}/jobs/{idx}" for host in ("a.com", "b.com") for idx in range(3)]
+        await asyncio.gather(*(scheduler.run(url, lambda url=url: attempt(HostScheduler.host(url))) for url in urls))
+
+    asyncio.run(main())
+    assert max_in_flight == {"a.com": 1, "b.com": 1}
+
+
+def test_transient_failures_are_retried():
+    scheduler = HostScheduler(retries=2, backoff_s=0.001)
+    attempts = []
+
+    async def attempt():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TransientError("status 503", overloaded=True)
+        return "content"
+
+    assert asyncio.run(scheduler.run("https://a.com/jobs", attempt)) == "content"
+    assert len(attempts) == 3
+
+
+def test_retries_are_exhausted():
+    scheduler = HostScheduler(retries=1, backoff_s=0.001)
+
+    async def attempt():
+        raise TransientError("timed out")
+
+    with pytest.raises(TransientError):
+        asyncio.run(scheduler.run("https://a.com/jobs", attempt))
+
+
+def test_only_overloaded_hosts_slow_down_the_others():
+    scheduler = HostScheduler(max_concurrence=8, per_host=4)
+
+    async def main():
+        await scheduler._acquire("a.com")
+        await scheduler._release("a.com", 1.0, False)
+        assert scheduler._host_limit["a.com"] == 2 and scheduler.limit == 8
+        await scheduler._acquire("b.com")
+        await scheduler._release("b.com", 1.0, False, overloaded=True)
+        assert scheduler._host_limit["b.com"] == 2 and scheduler.limit == 4
+        # fast successes grow the caps back
+        for _ in range(40):
+            await scheduler._acquire("b.com")
+            await scheduler._release("b.com", 1.0, True)
+        assert scheduler._host_limit["b.com"] == 4 and scheduler.limit == 8
+
+    asyncio.run(main())
+
+
+def test_slow_hosts_only_slow_down_themselves():
+    scheduler = HostScheduler(max_concurrence=8, per_host=4, slow_factor=3.0)
+
+    async def main():
+        for latency_s in (0.1, 1.0):
+            await scheduler._acquire("a.com")
+            await scheduler._release("a.com", latency_s, True)
+
+    asyncio.run(main())
+    assert scheduler._host_limit["a.com"] == 2 and scheduler.limit == 8
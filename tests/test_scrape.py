@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from src.scrape import scrape
+from src.scrape.store import CrawlStore
+
+
+class _Fetcher:
+    """answers with `responses` in turn, recording the validators each fetch was sent with"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.validators = []
+
+    async def fetch(self, url, selector, etag=None, last_modified=None):
+        self.validators.append((etag, last_modified))
+        return self.responses.pop(0)
+
+
+def _response(content=None, etag=None):
+    return {"content": content, "etag": etag, "last_modified": None, "not_modified": content is None}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = CrawlStore(tmp_path)
+    monkeypatch.setattr(scrape, "crawl_store", store)
+    return store
+
+
+def _fetch(fetcher):
+    return asyncio.run(scrape._fetch_over_http(fetcher, {}, org="Acme", url="https://acme.com/jobs", selector="li"))
+
+
+def test_fetch_revalidates_without_reading_the_previous_content(store, monkeypatch):
+    store.put("Acme", "https://acme.com/jobs", "<li>Data Scientist</li>", etag='"v1"')
+    reads = []
+    monkeypatch.setattr(store, "read", lambda org: reads.append(org) or "<li>Data Scientist</li>")
+
+    fetcher = _Fetcher(_response("<li>ML Engineer</li>", etag='"v2"'))
+    assert _fetch(fetcher) == {"content": "<li>ML Engineer</li>", "etag": '"v2"', "last_modified": None}
+    assert fetcher.validators == [('"v1"', None)]
+    assert reads == []
+
+    # the previous content is only read once the server says it wasn't modified
+    fetcher = _Fetcher(_response())
+    assert _fetch(fetcher) == {"content": "<li>Data Scientist</li>", "etag": '"v1"', "last_modified": None}
+    assert reads == ["Acme"]
+
+
+def test_fetch_in_full_when_the_previous_content_is_missing(store, monkeypatch):
+    store.put("Acme", "https://acme.com/jobs", "<li>Data Scientist</li>", etag='"v1"')
+    monkeypatch.setattr(store, "read", lambda org: None)
+    fetcher = _Fetcher(_response(), _response("<li>Data Scientist</li>", etag='"v1"'))
+    assert _fetch(fetcher)["content"] == "<li>Data Scientist</li>"
+    assert fetcher.validators == [('"v1"', None), (None, None)]
+
+
+def test_failed_scrapes_drop_the_validators(store):
+    store.put("Acme", "https://acme.com/jobs", "<li>Data Scientist</li>", etag='"v1"')
+    store.put("Acme", "https://acme.com/jobs", None)
+    assert store.validators("Acme") == (None, None)
@@ -0,0 +1,58 @@
+import json
+import os
+from time import time
+
+from src.cache import hash_text
+from src.scrape.store import CrawlStore, file_lock
+
+
+def test_file_lock_breaks_only_stale_locks(tmp_path):
+    path = tmp_path / "index.json"
+    lock_path = tmp_path / "index.json.lock"
+    lock_path.write_text("someone else")
+    os.utime(lock_path, (time() - 120, time() - 120))
+    with file_lock(path, timeout_s=60):
+        assert lock_path.read_text() != "someone else"
+    assert not lock_path.exists()
+
+
+def test_file_lock_keeps_a_lock_taken_after_it_was_broken(tmp_path):
+    path = tmp_path / "index.json"
+    lock_path = tmp_path / "index.json.lock"
+    with file_lock(path):
+        # another process broke this lock & took its own
+        lock_path.write_text("someone else")
+    assert lock_path.read_text() == "someone else"
+
+
+def test_crawl_store_keeps_snapshots_of_the_content(tmp_path):
+    store = CrawlStore(tmp_path, max_snapshots=2)
+    for version in range(3):
+        store.put("Acme Inc", "https://acme.com/jobs", f"<li>job {version}</li>")
+    store.save()
+    assert store.read("acme inc") == "<li>job 2</li>"
+    assert store.read("Acme Inc", hash_text("<li>job 1</li>")) == "<li>job 1</li>"
+    # the oldest snapshot is dropped along with its blob
+    assert store.read("Acme Inc", hash_text("<li>job 0</li>")) is None
+    assert len(list(store.blobs_path.glob("*.gz"))) == 2
+
+    # a failed scrape has no content but keeps the previous snapshots
+    store.put("Acme Inc", "https://acme.com/jobs", None)
+    assert store.read("Acme Inc") is None
+    assert store.read("Acme Inc", hash_text("<li>job 2</li>")) == "<li>job 2</li>"
+
+
+def test_crawl_store_keeps_the_orgs_saved_by_other_processes(tmp_path):
+    store, other = CrawlStore(tmp_path), CrawlStore(tmp_path)
+    store.put("acme", "https://acme.com/jobs", "<li>Data Scientist</li>")
+    other.put("globex", "https://globex.com/jobs", "<li>ML Engineer</li>")
+    other.save()
+    store.save()
+    assert {entry["org"] for entry in CrawlStore(tmp_path).entries()} == {"acme", "globex"}
+
+
+def test_crawl_store_moves_legacy_files_into_the_store(tmp_path):
+    (tmp_path / "acme.json").write_text(json.dumps({"org": "acme", "url": "https://acme.com", "content": "<li>x</li>"}))
+    store = CrawlStore(tmp_path)
+    assert store.read("acme") == "<li>x</li>"
+    assert not (tmp_path / "acme.json").exists()
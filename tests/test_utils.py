@@ -0,0 +1,46 @@
+import pytest
+
+from src import utils
+from src.job_index import JobIndex
+from src.scrape.scrape import load_manifest, save_manifest, update_manifest_entry
+from src.utils import get_unchanged_orgs, merge_job_lists, store_jobs_info
+
+TOPIC = "Data Science"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # every path of the package is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "job_index", JobIndex(tmp_path / "index.sqlite3"))
+    return tmp_path
+
+
+def _scrape(org, content):
+    manifest = load_manifest()
+    changed = update_manifest_entry(manifest, org, content)
+    save_manifest(manifest)
+    return changed
+
+
+def test_orgs_are_unchanged_until_their_content_changes(workdir):
+    assert _scrape("acme", "<li>Data Scientist</li>")
+    # not extracted yet
+    assert get_unchanged_orgs(TOPIC) == []
+    store_jobs_info({"org": "acme", "url": "https://acme.com/jobs", "jobs": []}, TOPIC)
+    assert get_unchanged_orgs(TOPIC) == ["acme"]
+    assert get_unchanged_orgs("Design") == []
+
+    assert not _scrape("acme", "<li>Data Scientist</li>")
+    assert get_unchanged_orgs(TOPIC) == ["acme"]
+    assert _scrape("acme", "<li>ML Engineer</li>")
+    assert get_unchanged_orgs(TOPIC) == []
+
+
+def test_merge_job_lists_drops_jobs_repeated_across_chunks():
+    chunks = [
+        {"jobs": [{"title": "Data Scientist", "href": "/jobs/1"}, {"title": "ML Engineer", "href": "/jobs/2"}]},
+        {"jobs": [{"title": "ML Engineer", "href": "/jobs/2"}, {"title": "Analyst", "href": "/jobs/3"}]},
+        {"jobs": []},
+    ]
+    assert [job["href"] for job in merge_job_lists(chunks)["jobs"]] == ["/jobs/1", "/jobs/2", "/jobs/3"]
@@ -0,0 +1,33 @@
+import sqlite3
+
+from src import work_queue
+from src.work_queue import FAILED, SCRAPE, WorkQueue
+
+
+def test_expired_leases_fail_after_max_attempts(tmp_path):
+    # every lease expires right away, as if the worker holding it had died
+    queue = WorkQueue("test", path=tmp_path / "queue.sqlite3", lease_s=-1, max_attempts=2)
+    queue.create("topic")
+    queue.enqueue(SCRAPE, [{"org": "acme"}])
+    assert len(queue.lease(SCRAPE)) == 1
+    assert len(queue.lease(SCRAPE)) == 1
+    assert queue.lease(SCRAPE) == []
+    assert queue.counts()[SCRAPE] == {FAILED: 1}
+    assert queue.is_drained(SCRAPE)
+
+
+def test_schema_is_created_once(tmp_path, monkeypatch):
+    queue = WorkQueue("test", path=tmp_path / "queue.sqlite3")
+    statements, connect = [], sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(work_queue.sqlite3, "connect", traced_connect)
+    queue.create("topic")
+    queue.enqueue(SCRAPE, [{"org": "acme"}])
+    queue.lease(SCRAPE)
+    assert len(statements)
+    assert not [statement for statement in statements if "CREATE" in statement or "PRAGMA" in statement]